@@ -0,0 +1,119 @@
+import hmac
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from app.api.endpoints import knowledge_index, report_store, session_store
+from app.core import capacity, profiling
+from app.core import openai_service
+from app.core.model_router import router as model_router
+from app.core.offload import run_in_thread
+from app.core.config import ADMIN_API_KEY
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+
+def is_admin_key(key: Optional[str]) -> bool:
+    """Check a key against ADMIN_API_KEY (always False when admin access is disabled)."""
+    return bool(ADMIN_API_KEY and key and hmac.compare_digest(key, ADMIN_API_KEY))
+
+
+def verify_admin_key(x_admin_key: Optional[str] = Header(None)):
+    """
+    Require a valid X-Admin-Key header.
+
+    Admin endpoints are disabled entirely when ADMIN_API_KEY is not configured.
+    """
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not is_admin_key(x_admin_key):
+        raise HTTPException(status_code=401, detail="Invalid admin key")
+
+
+router = APIRouter(dependencies=[Depends(verify_admin_key)])
+
+
+@router.delete("/research/reports")
+async def invalidate_research_reports(query: Optional[str] = None, model_name: Optional[str] = None):
+    """
+    Invalidate stored research reports.
+
+    Without parameters every stored report is deleted. Pass query and/or model_name
+    to restrict invalidation; queries are matched after normalization.
+    """
+    deleted = await run_in_thread(report_store.invalidate, query=query, model_name=model_name)
+    return {"deleted": deleted}
+
+
+@router.get("/research/reports/stats")
+async def research_report_stats():
+    """Return report store size and this worker's hit/miss counters."""
+    return await run_in_thread(report_store.stats)
+
+
+@router.get("/router/stats")
+async def model_router_stats():
+    """Return the routed models and this worker's live latency, error and circuit state per model."""
+    return model_router.stats()
+
+
+@router.get("/hedging/stats")
+async def hedging_stats():
+    """Return this worker's hedging outcomes, hedge win rate and current hedge delays."""
+    if openai_service.hedge_policy is None:
+        raise HTTPException(status_code=404, detail="Hedging is disabled")
+    return openai_service.hedge_policy.stats()
+
+
+@router.get("/capacity")
+async def capacity_stats():
+    """Return this worker's offload pool size, in-flight limit, recommended worker count and what they were sized from."""
+    if capacity.controller is None:
+        raise HTTPException(status_code=404, detail="Capacity control is disabled")
+    return capacity.controller.stats()
+
+
+@router.get("/sessions/stats")
+async def session_stats():
+    """Return stored session counts and this worker's session cache size and counters."""
+    return await run_in_thread(session_store.stats)
+
+
+def _require_knowledge_index():
+    if knowledge_index is None:
+        raise HTTPException(status_code=404, detail="Knowledge index is disabled")
+    return knowledge_index
+
+
+@router.get("/knowledge/stats")
+async def knowledge_index_stats():
+    """Return knowledge index size, lookup latency and how many remote searches it avoided in this worker."""
+    return await run_in_thread(_require_knowledge_index().stats)
+
+
+@router.post("/knowledge/compact")
+async def compact_knowledge_index():
+    """Evict the oldest documents beyond the size limit and merge the index segments."""
+    evicted = await run_in_thread(_require_knowledge_index().compact)
+    return {"evicted": evicted}
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """List stored request profiles and continuous stack samples, newest first."""
+    return {"profiles": profiling.list_artifacts()}
+
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str):
+    """
+    Download a profile artifact.
+
+    .prof files are cProfile stats (open with pstats or snakeviz); .folded files
+    are collapsed stacks (open with speedscope or flamegraph.pl).
+    """
+    path = profiling.artifact_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
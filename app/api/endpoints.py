@@ -1,20 +1,133 @@
 import logging
+from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from app.models.chat import ChatRequest, ChatResponse, StreamingChunk as ChatStreamingChunk
+from app.models.chat import (
+    ChatMessage,
+    ChatRequest,
+    ChatResponse,
+    CompareChunk,
+    CompareRequest,
+    CompareResponse,
+    SessionResponse,
+    StreamingChunk as ChatStreamingChunk,
+)
 from app.models.research import ResearchRequest, ResearchResponse, StreamingChunk as ResearchStreamingChunk
 from app.core.openai_service import AgnoService
 from app.core.research_service import ResearchService
-from app.core.config import MODEL_NAME
-import json
+from app.core.config import (
+    COMPARE_MAX_MODELS,
+    COMPARE_MODELS,
+    CONTENT_CHUNK_TOKENS,
+    KNOWLEDGE_COMPACT_EVERY,
+    KNOWLEDGE_INDEX_ENABLED,
+    KNOWLEDGE_INDEX_PATH,
+    KNOWLEDGE_MAX_DOCUMENTS,
+    MODEL_NAME,
+    REPORT_FRESHNESS_SECONDS,
+    REPORT_STORE_PATH,
+    SESSION_CACHE_MAX_BYTES,
+    SESSION_CACHE_MAX_SESSIONS,
+    SESSION_STORE_PATH,
+    SESSION_TTL_SECONDS,
+)
+from app.core.knowledge_index import KnowledgeIndex
+from app.core.model_router import AUTO, RouteDecision, router as model_router
+from app.core.metrics import RESEARCH_RUNS_JOINED, StreamMeter
+from app.core import codec, tracing, traffic_recorder
+from app.core.codec import CodecRoute
+from app.core.drain import StreamCut, drain
+from app.core.offload import run_in_thread
+from app.core.tracing import get_request_id
+from app.core.report_store import ReportStore, report_key
+from app.core.research_runs import InflightRuns
+from app.core.research_budget import ResearchBudget
+from app.core.sessions import SessionStore
+import time
 
 # Get logger for this module
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=CodecRoute)
 
 # Initialize services
-research_service = ResearchService(model_name=MODEL_NAME)
+knowledge_index = KnowledgeIndex(
+    KNOWLEDGE_INDEX_PATH,
+    chunk_tokens=CONTENT_CHUNK_TOKENS,
+    max_documents=KNOWLEDGE_MAX_DOCUMENTS,
+    compact_every=KNOWLEDGE_COMPACT_EVERY
+) if KNOWLEDGE_INDEX_ENABLED else None
+research_service = ResearchService(model_name=MODEL_NAME, knowledge=knowledge_index)
+report_store = ReportStore(REPORT_STORE_PATH)
+inflight_research = InflightRuns()
+session_store = SessionStore(
+    SESSION_STORE_PATH,
+    max_bytes=SESSION_CACHE_MAX_BYTES,
+    max_sessions=SESSION_CACHE_MAX_SESSIONS,
+    ttl=SESSION_TTL_SECONDS
+)
+
+
+@router.post("/sessions", response_model=SessionResponse)
+async def create_session():
+    """
+    Start a conversation session.
+
+    Chat requests that pass the returned session_id only need to send the new
+    messages; the server keeps the history and adds each completed turn to it.
+    """
+    session_id = await run_in_thread(session_store.create)
+    return SessionResponse(session_id=session_id)
+
+
+@router.get("/sessions/{session_id}", response_model=SessionResponse)
+async def get_session(session_id: str):
+    """Return a session's stored history."""
+    turns = await run_in_thread(session_store.get, session_id)
+    if turns is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return SessionResponse(
+        session_id=session_id,
+        messages=[ChatMessage(role=role, content=content) for role, content in turns]
+    )
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Delete a session and its history."""
+    if not await run_in_thread(session_store.delete, session_id):
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return {"deleted": True}
+
+
+async def _conversation(request: ChatRequest) -> List[ChatMessage]:
+    """Return the request's messages, preceded by the stored history of its session if it has one."""
+    if request.session_id is None:
+        return request.messages
+    turns = await run_in_thread(session_store.get, request.session_id)
+    if turns is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    # Stored turns were validated when they were added
+    return [ChatMessage.model_construct(role=role, content=content) for role, content in turns] + request.messages
+
+
+async def _save_turn(request: ChatRequest, reply: str) -> None:
+    """Add the request's messages and the assistant's reply to its session."""
+    turns = [(m.role, m.content) for m in request.messages] + [("assistant", reply)]
+    if not await run_in_thread(session_store.append, request.session_id, turns):
+        logger.warning("Session deleted during a chat request; turn not saved", extra={"request_id": get_request_id()})
+
+
+async def _route(request: ChatRequest, messages: List[ChatMessage]) -> Optional[RouteDecision]:
+    """Choose a model for a model_name=auto request (None for any other model)."""
+    if request.model_name != AUTO:
+        return None
+    try:
+        # Counting the conversation's tokens takes a while for long histories: kept off the event loop
+        return await run_in_thread(model_router.route, messages)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_agent(request: ChatRequest, req: Request):
@@ -27,16 +140,26 @@ async def chat_with_agent(request: ChatRequest, req: Request):
     If not provided, the default model from the server configuration will be used.
     
     Set stream=True to receive a streaming response.
+    
+    Pass a session_id from POST /sessions to send only the new messages: the stored
+    history is put before them and the completed turn is added to the session.
     """
+    if traffic_recorder.recorder is not None:
+        req.state.traffic_shape = traffic_recorder.chat_shape(request)
+
+    messages = await _conversation(request)
+    route = await _route(request, messages)
+
     # If streaming is requested, use the streaming endpoint
     if request.stream:
-        return await stream_chat_with_agent(request, req)
+        return await stream_chat_with_agent(request, req, messages, route)
     
     client_host = req.client.host if req.client else "unknown"
-    request_id = req.headers.get("X-Request-ID", "unknown")
+    request_id = get_request_id()
     
-    # Get the model name from the request or use the default
-    model_name = request.model_name or MODEL_NAME
+    # Get the model name from the request, the router or the default
+    model_name = route.model if route is not None else request.model_name or MODEL_NAME
+    req.state.model = model_name
     
     logger.info(
         f"Chat request received",
@@ -51,10 +174,11 @@ async def chat_with_agent(request: ChatRequest, req: Request):
         # Log the user's query (but be careful with PII)
         if request.messages and len(request.messages) > 0:
             last_message = request.messages[-1].content
-            # Truncate long messages for logging
-            truncated_message = last_message[:50] + ('...' if len(last_message) > 50 else '')
+            # Truncate long messages for logging (formatted only if the record is kept)
             logger.info(
-                f"Processing query: {truncated_message}",
+                "Processing query: %.50s%s",
+                last_message,
+                "..." if len(last_message) > 50 else "",
                 extra={
                     "request_id": request_id, 
                     "message_length": len(last_message),
@@ -62,12 +186,21 @@ async def chat_with_agent(request: ChatRequest, req: Request):
                 }
             )
         
-        response = AgnoService.chat_completion(
-            messages=request.messages,
+        # The agent call blocks (including retry backoff), so it runs in the offload pool
+        response = await run_in_thread(
+            AgnoService.chat_completion,
+            messages=messages,
             max_tokens=request.max_tokens,
-            model_name=request.model_name,
-            stream=False
+            model_name=model_name,
+            stream=False,
+            route=route
         )
+        # A routed request may have failed over to another model
+        req.state.model = response.model or model_name
+        
+        if request.session_id is not None:
+            await _save_turn(request, response.message.content)
+            response.session_id = request.session_id
         
         # Log successful completion
         logger.info(
@@ -103,15 +236,20 @@ async def chat_with_agent(request: ChatRequest, req: Request):
         raise HTTPException(status_code=500, detail=f"Error communicating with Agno agent: {str(e)}")
 
 
-async def stream_chat_with_agent(request: ChatRequest, req: Request):
+async def stream_chat_with_agent(request: ChatRequest, req: Request, messages: List[ChatMessage], route: Optional[RouteDecision] = None):
     """
     Stream chat response from the Agno agent.
+    
+    With a session, the turn is saved before the final chunk is sent, so a client
+    can send its next message as soon as the stream ends.
     """
     client_host = req.client.host if req.client else "unknown"
-    request_id = req.headers.get("X-Request-ID", "unknown")
+    request_id = get_request_id()
     
-    # Get the model name from the request or use the default
-    model_name = request.model_name or MODEL_NAME
+    # Get the model name from the request, the router or the default
+    model_name = route.model if route is not None else request.model_name or MODEL_NAME
+    req.state.model = model_name
+    started = time.perf_counter()
     
     logger.info(
         f"Streaming chat request received",
@@ -125,10 +263,11 @@ async def stream_chat_with_agent(request: ChatRequest, req: Request):
     # Log the user's query (but be careful with PII)
     if request.messages and len(request.messages) > 0:
         last_message = request.messages[-1].content
-        # Truncate long messages for logging
-        truncated_message = last_message[:50] + ('...' if len(last_message) > 50 else '')
+        # Truncate long messages for logging (formatted only if the record is kept)
         logger.info(
-            f"Processing streaming query: {truncated_message}",
+            "Processing streaming query: %.50s%s",
+            last_message,
+            "..." if len(last_message) > 50 else "",
             extra={
                 "request_id": request_id, 
                 "message_length": len(last_message),
@@ -139,18 +278,27 @@ async def stream_chat_with_agent(request: ChatRequest, req: Request):
     
     async def event_generator():
         """Generate server-sent events."""
+        meter = StreamMeter("chat", model_name, started, span=tracing.current_span())
+        reply = []
+        final = None
         try:
-            async for chunk in AgnoService.chat_completion(
-                messages=request.messages,
+            # Ended with an error event if the server drains for shutdown and the deadline passes
+            async for chunk in drain.guard(AgnoService.chat_completion(
+                messages=messages,
                 max_tokens=request.max_tokens,
-                model_name=request.model_name,
-                stream=True
-            ):
-                # Convert the chunk to a dictionary for JSON serialization
-                chunk_dict = chunk.dict()
-                
-                # Format as a server-sent event with proper JSON serialization
-                yield f"data: {json.dumps(chunk_dict)}\n\n"
+                model_name=model_name,
+                stream=True,
+                route=route
+            )):
+                if request.session_id is not None:
+                    if chunk.done:
+                        # Held back until the stream ends without error; a failed run raises after its final chunk
+                        final = chunk
+                        continue
+                    reply.append(chunk.content)
+                meter.content(chunk.content)
+                # Format as a server-sent event
+                yield meter.sse(chunk)
                 
                 # If this is the final chunk, log completion
                 if chunk.done:
@@ -161,6 +309,21 @@ async def stream_chat_with_agent(request: ChatRequest, req: Request):
                             "model": model_name
                         }
                     )
+            
+            if request.session_id is not None:
+                if final is None:
+                    # An incomplete reply is not added to the session; the client gets an error event instead
+                    raise RuntimeError("Stream ended before the reply was complete; turn not saved")
+                await _save_turn(request, "".join(reply))
+                final.session_id = request.session_id
+                yield meter.sse(final)
+                logger.info(
+                    f"Streaming chat request completed successfully",
+                    extra={
+                        "request_id": request_id,
+                        "model": model_name
+                    }
+                )
         except Exception as e:
             logger.error(
                 f"Error processing streaming request",
@@ -177,13 +340,149 @@ async def stream_chat_with_agent(request: ChatRequest, req: Request):
                 done=True,
                 model=model_name
             )
-            yield f"data: {json.dumps(error_chunk.dict())}\n\n"
+            yield meter.sse(error_chunk)
+        finally:
+            meter.finish()
     
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream"
     )
 
+@router.post("/chat/compare", response_model=CompareResponse)
+async def compare_models(request: CompareRequest, req: Request):
+    """
+    Send one conversation to several models at once and compare their replies.
+    
+    The models (COMPARE_MODELS by default) run concurrently, so the comparison
+    takes as long as the slowest one. Each result has the model's latency,
+    time to first token and token usage.
+    
+    Set stream=True to receive the replies interleaved as they arrive: every
+    chunk is tagged with its model, a finished chunk with the model's result
+    follows its last content, and the final chunk (done) has all results.
+    """
+    request_id = get_request_id()
+    models = list(dict.fromkeys(request.models or [m.strip() for m in COMPARE_MODELS.split(",") if m.strip()]))
+    if len(models) > COMPARE_MAX_MODELS:
+        raise HTTPException(status_code=400, detail=f"At most {COMPARE_MAX_MODELS} models can be compared")
+    try:
+        chunks = AgnoService.compare(request.messages, models, max_tokens=request.max_tokens)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    
+    logger.info(
+        f"Comparison request received",
+        extra={
+            "request_id": request_id,
+            "models": models,
+            "streaming": request.stream
+        }
+    )
+    
+    if not request.stream:
+        replies = {model: [] for model in models}
+        errors = {}
+        results = None
+        async for chunk in chunks:
+            if chunk.done:
+                results = chunk.results
+            elif chunk.finished:
+                if chunk.result.error:
+                    errors[chunk.model] = chunk.result.error
+            else:
+                replies[chunk.model].append(chunk.content)
+        if results is None:
+            # The comparison ended before its summary chunk: report what is known of the models
+            logger.error(
+                f"Comparison ended without results",
+                extra={
+                    "request_id": request_id,
+                    "models": models,
+                    "errors": errors
+                }
+            )
+            raise HTTPException(status_code=502, detail={"message": "Comparison ended without results", "errors": errors})
+        for result in results:
+            result.content = "".join(replies[result.model])
+        return CompareResponse(results=results)
+    
+    async def event_generator():
+        """Generate server-sent events, one stream meter per model."""
+        started = time.perf_counter()
+        meters = {model: StreamMeter("compare", model, started) for model in models}
+        try:
+            async for chunk in drain.guard(chunks):
+                if chunk.model is not None:
+                    meters[chunk.model].content(chunk.content)
+                    if chunk.finished:
+                        meters[chunk.model].finish()
+                yield codec.sse(chunk)
+            logger.info(
+                f"Comparison request completed",
+                extra={
+                    "request_id": request_id,
+                    "models": models
+                }
+            )
+        except StreamCut as e:
+            logger.warning(
+                f"Comparison stream cut by shutdown",
+                extra={
+                    "request_id": request_id,
+                    "models": models
+                }
+            )
+            yield codec.sse(CompareChunk(content=f"\n\nError: {str(e)}", done=True))
+        finally:
+            await chunks.aclose()
+            for meter in meters.values():
+                meter.finish()
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream"
+    )
+
+
+def _stored_report_response(content: str, usage, model_name: str, stream: bool):
+    """Build a streaming or non-streaming response for a stored report."""
+    if not stream:
+        return ResearchResponse(
+            message={"role": "assistant", "content": content},
+            model=model_name,
+            usage=usage,
+            cached=True
+        )
+
+    async def event_generator():
+        """Replay the stored report as server-sent events."""
+        yield codec.sse({'type': 'content', 'content': content, 'done': False, 'model': model_name, 'cached': True})
+        yield codec.sse({'type': 'done', 'content': '', 'done': True, 'model': model_name, 'cached': True})
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream"
+    )
+
+
+async def _store_report(query: str, model_name: str, budget: ResearchBudget, content: str, usage) -> None:
+    """
+    Store a completed report unless the deadline or output budget cut it short.
+
+    Reports are stored under their budget's limits, so a request with other limits doesn't get them.
+    A report cut short by a draining worker (budget_exhausted "drain") is stored apart as a partial
+    report: it is never served and never replaces a complete one, but a retry resumes from it (see research()).
+    """
+    exhausted = usage.get("budget_exhausted") if usage else None
+    if exhausted in ("deadline", "output_tokens"):
+        logger.info(f"Not storing research report cut short by its {exhausted} budget")
+        return
+    await run_in_thread(
+        report_store.put, query, model_name, content, usage, budget=budget.variant(), partial=exhausted == "drain"
+    )
+
+
 @router.post("/research", response_model=ResearchResponse)
 async def research(request: ResearchRequest, req: Request):
     """
@@ -192,10 +491,21 @@ async def research(request: ResearchRequest, req: Request):
     This endpoint takes a research request with a query and returns a detailed research report.
     You can specify a different model by including the model_name parameter.
     Set stream=True to receive a streaming response.
+    
+    Completed reports are stored and reused for repeat queries within the freshness window
+    (REPORT_FRESHNESS_SECONDS, overridable per request with max_age_seconds). Identical
+    requests arriving while a run is in flight join that run instead of starting another.
+    Reports and runs are only shared between requests with the same budget limits.
+    A run cut short by a worker shutting down stores its partial report, which a retry builds on.
     """
     client_host = req.client.host if req.client else "unknown"
-    request_id = req.headers.get("X-Request-ID", "unknown")
+    request_id = get_request_id()
     model_name = request.model_name or MODEL_NAME
+    req.state.model = model_name
+    if traffic_recorder.recorder is not None:
+        req.state.traffic_shape = traffic_recorder.research_shape(request)
+    max_age = REPORT_FRESHNESS_SECONDS if request.max_age_seconds is None else request.max_age_seconds
+    budget = ResearchBudget.from_request(request)
     
     logger.info(
         f"Research request received",
@@ -208,13 +518,70 @@ async def research(request: ResearchRequest, req: Request):
     )
     
     try:
+        with tracing.span("research.admission", model=model_name) as admission:
+            stored = await run_in_thread(report_store.get, request.query, model_name, max_age, budget=budget.variant())
+            key = report_key(request.query, model_name, budget.variant())
+            run = inflight_research.get(key) if stored is None and max_age > 0 else None
+            resume = None
+            if stored is None and run is None:
+                # A run cut short by a worker shutting down left no answer, but a head start for this one
+                partial = await run_in_thread(
+                    report_store.get_partial, request.query, model_name, REPORT_FRESHNESS_SECONDS, budget=budget.variant()
+                )
+                resume = partial["content"] if partial is not None else None
+            admission.set_attribute(
+                "outcome", "stored" if stored is not None else "joined" if run is not None else "launched"
+            )
+            admission.set_attribute("resumed", resume is not None)
+        
+        if stored is not None:
+            logger.info(
+                f"Serving stored research report",
+                extra={
+                    "request_id": request_id,
+                    "model": model_name,
+                    "age": round(stored["age"], 1)
+                }
+            )
+            return _stored_report_response(stored["content"], stored["usage"], model_name, request.stream)
+        
+        if run is not None:
+            RESEARCH_RUNS_JOINED.inc()
+            logger.info(
+                f"Joining in-flight research run",
+                extra={
+                    "request_id": request_id,
+                    "model": model_name
+                }
+            )
+        else:
+            # Runs execute in the background so their report is stored even if the client leaves.
+            # A forced refresh runs alongside any in-flight run without replacing it.
+            run = inflight_research.launch(
+                key,
+                research_service.research(
+                    request.query,
+                    stream=True,
+                    budget=budget,
+                    model_name=model_name,
+                    resume=resume
+                ),
+                on_complete=lambda content, usage: _store_report(request.query, model_name, budget, content, usage),
+                register=inflight_research.get(key) is None
+            )
+        
         if request.stream:
+            started = time.perf_counter()
+            
             async def event_generator():
                 """Generate server-sent events."""
+                meter = StreamMeter("research", model_name, started, span=tracing.current_span())
                 try:
-                    async for chunk in research_service.research(request.query, stream=True):
+                    async for chunk in drain.guard(run.subscribe()):
+                        if chunk.get("type") == "content":
+                            meter.content(chunk.get("content", ""))
                         # Format as a server-sent event with proper JSON serialization
-                        yield f"data: {json.dumps(chunk)}\n\n"
+                        yield meter.sse(chunk)
                         
                         # If this is the final chunk, log completion
                         if chunk.get("done", False):
@@ -237,28 +604,25 @@ async def research(request: ResearchRequest, req: Request):
                     )
                     # Send an error event
                     error_chunk = {
+                        "type": "error",
                         "content": f"\n\nError: {str(e)}",
                         "done": True,
                         "model": model_name
                     }
-                    yield f"data: {json.dumps(error_chunk)}\n\n"
+                    yield meter.sse(error_chunk)
+                finally:
+                    meter.finish()
             
             return StreamingResponse(
                 event_generator(),
                 media_type="text/event-stream"
             )
         else:
-            # Get the first (and only) chunk from the generator
-            async for chunk in research_service.research(request.query, stream=False):
-                if chunk.get("done", False):
-                    return ResearchResponse(
-                        message={"role": "assistant", "content": chunk.get("content", "")},
-                        model=model_name
-                    )
-            
-            raise HTTPException(
-                status_code=500,
-                detail="No response received from research service"
+            content = await run.result()
+            return ResearchResponse(
+                message={"role": "assistant", "content": content},
+                model=model_name,
+                usage=run.usage
             )
         
     except ValueError as ve:
@@ -281,4 +645,4 @@ async def research(request: ResearchRequest, req: Request):
                 "model": model_name
             }
         )
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
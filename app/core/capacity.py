@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core import offload, prefork
+from app.core.config import (
+    API_V1_PREFIX,
+    CAPACITY_CONTROL_ENABLED,
+    CAPACITY_INTERVAL_SECONDS,
+    CAPACITY_MAX_CONCURRENCY,
+    CAPACITY_MAX_THREADS,
+    CAPACITY_MIN_CONCURRENCY,
+    CAPACITY_MIN_THREADS,
+    CAPACITY_TARGET_CPU,
+    CAPACITY_TARGET_LAG_MS,
+    CAPACITY_THREAD_HEADROOM,
+    WEB_CONCURRENCY,
+)
+from app.core.loop_monitor import LoopMonitor
+from app.core.metrics import CAPACITY_CONCURRENCY_LIMIT, CAPACITY_RECOMMENDED_WORKERS, CAPACITY_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Seconds a client refused for capacity is asked to wait before retrying
+RETRY_AFTER_SECONDS = 1
+
+
+class CapacityController:
+    """
+    Sizes this worker's offload pool and in-flight limit from what it observes.
+
+    Every interval:
+
+    - Offload threads: each blocking agent call or stream holds a pool thread
+      for as long as the upstream takes, so the threads needed are the call
+      rate times the mean hold time (Little's law), or the calls running and
+      waiting right now if that is more. The pool is set to that times
+      thread_headroom: it grows at once and shrinks by a tenth per interval,
+      and does not grow while the event loop lags (more threads would only
+      add to the loop's work).
+    - In-flight limit: chat and research requests handled at once (see
+      CapacityMiddleware). Event loop lag over target_lag cuts it by a
+      quarter; an interval that reached the limit without lag raises it by a
+      tenth.
+    - Recommended workers: the CPU this worker used, times the worker count,
+      over target_cpu per worker; while the loop lags, at least one worker
+      more than now. At most the CPU count. Only reported, as a metric and
+      in stats(); the worker count is set at startup (WORKERS).
+
+    Statistics and limits are per worker.
+    """
+
+    def __init__(
+        self,
+        min_threads: int = 32,
+        max_threads: int = 256,
+        thread_headroom: float = 1.5,
+        min_concurrency: int = 8,
+        max_concurrency: int = 256,
+        target_lag: float = 0.05,
+        target_cpu: float = 0.7,
+        workers: int = 1,
+        interval: float = 5.0,
+    ):
+        """
+        Args:
+            min_threads: Smallest offload pool
+            max_threads: Largest offload pool
+            thread_headroom: Pool size as a multiple of the measured demand for threads
+            min_concurrency: Lowest in-flight limit
+            max_concurrency: Highest in-flight limit, and its starting value
+            target_lag: Event loop lag in seconds above which the worker counts as overloaded
+            target_cpu: CPU per worker, in cores, the recommended worker count aims for
+            workers: Worker processes serving the app
+            interval: Seconds between adjustments
+        """
+        self.min_threads = min_threads
+        self.max_threads = max_threads
+        self.thread_headroom = thread_headroom
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_lag = target_lag
+        self.target_cpu = target_cpu
+        self.workers = workers
+        self.interval = interval
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.rejected = 0
+        self.recommended_workers = workers
+        self._reached_limit = False
+        self._hold_seconds = 0.0
+        self._last: Dict[str, Any] = {}
+        self._monitor: Optional[LoopMonitor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._reset_window()
+        self._publish()
+        # Gauge samples are per process; a forked worker starts its own
+        prefork.after_fork(self._publish)
+
+    def _publish(self) -> None:
+        CAPACITY_CONCURRENCY_LIMIT.set(self.limit)
+        CAPACITY_RECOMMENDED_WORKERS.set(self.recommended_workers)
+
+    def _reset_window(self) -> None:
+        self._usage = offload.usage()
+        self._cpu = time.process_time()
+        self._at = time.perf_counter()
+
+    def try_admit(self) -> bool:
+        """Count a request in flight, or refuse it when the worker is at its limit."""
+        if self.in_flight >= self.limit:
+            self._reached_limit = True
+            self.rejected += 1
+            CAPACITY_REJECTED.inc()
+            return False
+        self.in_flight += 1
+        if self.in_flight >= self.limit:
+            self._reached_limit = True
+        return True
+
+    def release(self) -> None:
+        """A request admitted by try_admit() has finished."""
+        self.in_flight -= 1
+
+    def start(self, monitor: Optional[LoopMonitor] = None) -> None:
+        """
+        Start adjusting on the running event loop.
+
+        Args:
+            monitor: Loop monitor whose lag measurements to use; without one only the controller's own wake-ups are timed
+        """
+        self._monitor = monitor
+        self._reset_window()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop adjusting."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            due = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            try:
+                self.adjust(lag=max(time.perf_counter() - due, 0.0))
+            except Exception as e:
+                logger.error(f"Capacity adjustment failed: {str(e)}", exc_info=True)
+
+    def adjust(self, lag: float = 0.0) -> None:
+        """
+        Resize the offload pool and the in-flight limit from the interval since the last adjustment.
+
+        Args:
+            lag: Event loop lag seen by the caller, in seconds (the loop monitor's is added)
+        """
+        elapsed = max(time.perf_counter() - self._at, 1e-6)
+        usage, previous = offload.usage(), self._usage
+        cpu_seconds = time.process_time() - self._cpu
+        if self._monitor is not None:
+            lag = max(lag, self._monitor.take_recent_max_lag())
+        overloaded = lag > self.target_lag
+
+        completed = usage.completed - previous.completed
+        if completed:
+            self._hold_seconds = (usage.held_seconds - previous.held_seconds) / completed
+        call_rate = (usage.submitted - previous.submitted) / elapsed
+        demand = max(call_rate * self._hold_seconds, usage.busy + usage.queued)
+        threads = min(max(math.ceil(demand * self.thread_headroom), self.min_threads), self.max_threads)
+        if threads > usage.threads and overloaded:
+            threads = usage.threads
+        elif threads < usage.threads:
+            threads = max(threads, usage.threads - max(1, usage.threads // 10))
+        if threads != usage.threads:
+            logger.info(f"Offload pool resized from {usage.threads} to {threads} threads", extra={"demand": round(demand, 1)})
+            offload.resize(threads)
+
+        if overloaded:
+            limit = max(self.min_concurrency, int(self.limit * 0.75))
+        elif self._reached_limit:
+            limit = min(self.max_concurrency, self.limit + max(1, self.limit // 10))
+        else:
+            limit = self.limit
+        if limit != self.limit:
+            logger.info(f"In-flight limit changed from {self.limit} to {limit}", extra={"loop_lag_ms": round(lag * 1000, 1)})
+            self.limit = limit
+        self._reached_limit = self.in_flight >= self.limit
+
+        cpu = cpu_seconds / elapsed
+        recommended = math.ceil(self.workers * cpu / self.target_cpu)
+        if overloaded:
+            recommended = max(recommended, self.workers + 1)
+        self.recommended_workers = min(max(recommended, 1), os.cpu_count() or 1)
+        self._publish()
+
+        self._last = {
+            "call_rate": round(call_rate, 2),
+            "mean_hold_ms": round(self._hold_seconds * 1000, 1),
+            "thread_demand": round(demand, 1),
+            "loop_lag_ms": round(lag * 1000, 1),
+            "cpu_cores": round(cpu, 3),
+            "overloaded": overloaded,
+        }
+        self._reset_window()
+
+    def stats(self) -> Dict[str, Any]:
+        """Current pool size and limits, and what the last adjustment observed."""
+        usage = offload.usage()
+        return {
+            "offload_threads": usage.threads,
+            "offload_busy": usage.busy,
+            "offload_queued": usage.queued,
+            "concurrency_limit": self.limit,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "workers": self.workers,
+            "recommended_workers": self.recommended_workers,
+            "cpu_count": os.cpu_count(),
+            "last_adjustment": self._last,
+        }
+
+
+class CapacityMiddleware:
+    """
+    Refuses requests to the given path prefixes with a 503 while the controller is at its in-flight limit.
+
+    A request counts as in flight until its response, streamed or not, has
+    been sent. Refused responses carry Retry-After, so a load balancer or
+    client can try again (elsewhere).
+    """
+
+    def __init__(self, app: ASGIApp, controller: CapacityController, paths: Sequence[str]):
+        """
+        Args:
+            app: The application to wrap
+            controller: Controller holding the in-flight limit
+            paths: Path prefixes of the requests limited
+        """
+        self.app = app
+        self.controller = controller
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+        if not self.controller.try_admit():
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server is at capacity, retry shortly"},
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
+
+
+# Chat and research requests are the ones holding upstream calls and offload threads
+LIMITED_PATHS = (f"{API_V1_PREFIX}/chat", f"{API_V1_PREFIX}/research")
+
+controller = CapacityController(
+    min_threads=CAPACITY_MIN_THREADS,
+    max_threads=CAPACITY_MAX_THREADS,
+    thread_headroom=CAPACITY_THREAD_HEADROOM,
+    min_concurrency=CAPACITY_MIN_CONCURRENCY,
+    max_concurrency=CAPACITY_MAX_CONCURRENCY,
+    target_lag=CAPACITY_TARGET_LAG_MS / 1000,
+    target_cpu=CAPACITY_TARGET_CPU,
+    workers=WEB_CONCURRENCY,
+    interval=CAPACITY_INTERVAL_SECONDS,
+) if CAPACITY_CONTROL_ENABLED else None
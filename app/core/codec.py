@@ -0,0 +1,62 @@
+import json
+from typing import Any, Callable
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.responses import Response
+
+from app.core.config import FAST_CODEC_ENABLED
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+# Whether the orjson backend is in use (tests/benchmarks/bench_codec.py measures the difference).
+# Response models are left to FastAPI, which already encodes them with pydantic's JSON serializer.
+FAST_JSON = FAST_CODEC_ENABLED and orjson is not None
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode obj as compact JSON."""
+    if FAST_JSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """Decode JSON from bytes or str."""
+    if FAST_JSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def sse(payload: Any) -> bytes:
+    """Encode payload as a server-sent event."""
+    if isinstance(payload, BaseModel):
+        return b"data: " + payload.model_dump_json().encode("utf-8") + b"\n\n"
+    return b"data: " + dumps(payload) + b"\n\n"
+
+
+class CodecRequest(Request):
+    """Request whose JSON body is decoded with the fast backend."""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = loads(await self.body())
+        return self._json
+
+
+class CodecRoute(APIRoute):
+    """Route that decodes request bodies with the fast backend before FastAPI validates them."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if not FAST_JSON:
+            return handler
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(CodecRequest(request.scope, request.receive))
+
+        return route_handler
@@ -13,6 +13,10 @@ if not OPENAI_API_KEY:
 # Model settings
 MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4")
 
+# Upstream endpoints; point both at tests/fake_upstream to run without the real APIs
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+EXA_BASE_URL = os.getenv("EXA_BASE_URL")
+
 # Environment settings
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 
@@ -32,4 +36,177 @@ else:
         CORS_ORIGINS = ["https://your-domain.com"]
 
 # Logging
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO") 
\ No newline at end of file
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Share of requests whose info/debug logs are kept (warnings and errors are always logged)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+# Encode responses and stream events and decode request bodies with orjson when installed
+FAST_CODEC_ENABLED = os.getenv("FAST_CODEC_ENABLED", "true").lower() == "true"
+
+# Tracing: spans are written as OTLP/JSON lines to TRACE_DIR (one file per process)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+# A process's span file is rotated at this size, keeping this many rotated files per process
+TRACE_MAX_FILE_BYTES = int(os.getenv("TRACE_MAX_FILE_BYTES", str(50 * 1024 * 1024)))
+TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", "3"))
+# Oldest span files (including those of exited workers) are deleted beyond this total size of TRACE_DIR
+TRACE_MAX_TOTAL_BYTES = int(os.getenv("TRACE_MAX_TOTAL_BYTES", str(1024 * 1024 * 1024)))
+
+# Prometheus metrics endpoint (set PROMETHEUS_MULTIPROC_DIR to aggregate across workers)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Token usage accounting
+# Count tokens locally with tiktoken when the upstream response has no usage (falls back to a length estimate)
+TIKTOKEN_ENABLED = os.getenv("TIKTOKEN_ENABLED", "true").lower() == "true"
+# Prices in USD per million prompt/completion tokens, as JSON: {"model": [prompt, completion]}; merged over the built-in list prices
+MODEL_PRICES = os.getenv("MODEL_PRICES")
+# Distinct X-Client-ID values tracked in metrics per worker; later clients are counted as "other"
+USAGE_MAX_CLIENTS = int(os.getenv("USAGE_MAX_CLIENTS", "100"))
+
+# Admin settings
+# Admin endpoints are disabled unless a key is configured
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+# Local data directory for stores and caches
+DATA_DIR = os.getenv("DATA_DIR", "data")
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(DATA_DIR, "traces"))
+
+# Profiling: per-request profiles (admin only) and the continuous stack sampler
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+# Request profile artifacts kept on disk per worker (oldest are deleted first)
+PROFILE_MAX_ARTIFACTS = int(os.getenv("PROFILE_MAX_ARTIFACTS", "100"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+CONTINUOUS_PROFILING_ENABLED = os.getenv("CONTINUOUS_PROFILING_ENABLED", "false").lower() == "true"
+CONTINUOUS_PROFILING_INTERVAL_MS = float(os.getenv("CONTINUOUS_PROFILING_INTERVAL_MS", "100"))
+CONTINUOUS_PROFILING_FLUSH_SECONDS = float(os.getenv("CONTINUOUS_PROFILING_FLUSH_SECONDS", "60"))
+
+# Research report store
+REPORT_STORE_PATH = os.getenv("REPORT_STORE_PATH", os.path.join(DATA_DIR, "reports.db"))
+# Completed reports younger than this are served without a new agent run (0 disables reuse)
+REPORT_FRESHNESS_SECONDS = int(os.getenv("REPORT_FRESHNESS_SECONDS", "3600")) 
+
+# Conversation sessions: histories are stored in SQLite with an in-memory LRU per worker
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", os.path.join(DATA_DIR, "sessions.db"))
+SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_CACHE_MAX_SESSIONS = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "10000"))
+# Sessions idle longer than this are deleted
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Conversation context compaction: histories over the model's token budget keep their system
+# messages and recent turns verbatim and have older turns replaced by a rolling summary
+CONTEXT_COMPACTION_ENABLED = os.getenv("CONTEXT_COMPACTION_ENABLED", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+# Per-model budgets as JSON: {"model": tokens}; the longest matching model prefix wins
+CONTEXT_TOKEN_BUDGETS = os.getenv("CONTEXT_TOKEN_BUDGETS")
+# Most recent messages always kept verbatim
+CONTEXT_KEEP_RECENT = int(os.getenv("CONTEXT_KEEP_RECENT", "4"))
+# The summarized part grows in steps of this many messages, so a summary serves several turns
+CONTEXT_COMPACT_STEP = int(os.getenv("CONTEXT_COMPACT_STEP", "6"))
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "gpt-4o-mini")
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "500"))
+# Most tokens of earlier messages summarized in one model request; longer spans are summarized in rounds
+CONTEXT_SUMMARY_INPUT_TOKENS = int(os.getenv("CONTEXT_SUMMARY_INPUT_TOKENS", "6000"))
+CONTEXT_SUMMARY_STORE_PATH = os.getenv("CONTEXT_SUMMARY_STORE_PATH", os.path.join(DATA_DIR, "summaries.db"))
+
+# Model routing for model_name="auto": models from the cheapest to the most capable
+ROUTER_MODELS = os.getenv("ROUTER_MODELS", "gpt-4o-mini,gpt-4o")
+# Prompts longer than this count towards a more capable model
+ROUTER_LONG_PROMPT_TOKENS = int(os.getenv("ROUTER_LONG_PROMPT_TOKENS", "2000"))
+# A model is avoided while its error average reaches this, or its latency average exceeds this multiple of its baseline
+ROUTER_DEGRADED_ERROR_RATE = float(os.getenv("ROUTER_DEGRADED_ERROR_RATE", "0.3"))
+ROUTER_DEGRADED_LATENCY_FACTOR = float(os.getenv("ROUTER_DEGRADED_LATENCY_FACTOR", "2.0"))
+# Consecutive failures that open a model's circuit, and the wait before a probe request
+ROUTER_BREAKER_FAILURES = int(os.getenv("ROUTER_BREAKER_FAILURES", "5"))
+ROUTER_BREAKER_COOLDOWN_SECONDS = float(os.getenv("ROUTER_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Hedged streaming chat: a second request is sent when the first token is later than a percentile
+# of recent times to first token; the first to produce a token wins and the other is cancelled
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "500"))
+# Used until a model has enough observations
+HEDGE_DEFAULT_DELAY_MS = float(os.getenv("HEDGE_DEFAULT_DELAY_MS", "2000"))
+# Most hedges as a percentage of streaming chats
+HEDGE_BUDGET_PERCENT = float(os.getenv("HEDGE_BUDGET_PERCENT", "5"))
+# Model of the hedge request (defaults to the same model, or the next candidate of a routed request)
+HEDGE_MODEL = os.getenv("HEDGE_MODEL")
+
+# Memory-mapped I/O for the SQLite stores: pages are read from the OS page cache, shared by all workers (0 disables)
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+
+# Model comparison (POST /chat/compare): models compared when a request names none, and the most per request
+COMPARE_MODELS = os.getenv("COMPARE_MODELS", "o3-mini,gpt-4o-mini,gpt-4o,gpt-3.5-turbo")
+COMPARE_MAX_MODELS = int(os.getenv("COMPARE_MAX_MODELS", "6"))
+
+# Research budgets (server defaults; requests may tighten but not exceed them)
+RESEARCH_MAX_TOOL_CALLS = int(os.getenv("RESEARCH_MAX_TOOL_CALLS", "10"))
+RESEARCH_MAX_OUTPUT_TOKENS = int(os.getenv("RESEARCH_MAX_OUTPUT_TOKENS", "4000"))
+RESEARCH_MAX_SOURCES = int(os.getenv("RESEARCH_MAX_SOURCES", "25"))
+RESEARCH_DEADLINE_SECONDS = float(os.getenv("RESEARCH_DEADLINE_SECONDS", "180"))
+# Part of the deadline kept back for writing up gathered material
+RESEARCH_WRITEUP_RESERVE_SECONDS = float(os.getenv("RESEARCH_WRITEUP_RESERVE_SECONDS", "30"))
+
+# Threads used to run blocking agent calls off the event loop
+OFFLOAD_THREADS = int(os.getenv("OFFLOAD_THREADS", "32"))
+
+# Capacity controller: every interval, sizes each worker's offload pool and its limit of chat and
+# research requests in flight from observed upstream latency and event loop lag. Off by default: untuned, its
+# in-flight limit shed load a healthy worker could serve (lower throughput and 503s in bench_capacity.py)
+CAPACITY_CONTROL_ENABLED = os.getenv("CAPACITY_CONTROL_ENABLED", "false").lower() == "true"
+CAPACITY_INTERVAL_SECONDS = float(os.getenv("CAPACITY_INTERVAL_SECONDS", "5"))
+# Offload pool bounds, and spare threads as a multiple of measured demand
+CAPACITY_MIN_THREADS = int(os.getenv("CAPACITY_MIN_THREADS", str(OFFLOAD_THREADS)))
+CAPACITY_MAX_THREADS = int(os.getenv("CAPACITY_MAX_THREADS", "256"))
+CAPACITY_THREAD_HEADROOM = float(os.getenv("CAPACITY_THREAD_HEADROOM", "1.5"))
+# Bounds of the in-flight limit (it starts at the maximum); requests over it get a 503
+CAPACITY_MIN_CONCURRENCY = int(os.getenv("CAPACITY_MIN_CONCURRENCY", "8"))
+CAPACITY_MAX_CONCURRENCY = int(os.getenv("CAPACITY_MAX_CONCURRENCY", "256"))
+# Event loop lag above this lowers the in-flight limit and keeps the pool from growing
+CAPACITY_TARGET_LAG_MS = float(os.getenv("CAPACITY_TARGET_LAG_MS", "50"))
+# CPU per worker (in cores) the recommended worker count aims for
+CAPACITY_TARGET_CPU = float(os.getenv("CAPACITY_TARGET_CPU", "0.7"))
+# Worker processes (set by entrypoint.sh; gunicorn and uvicorn also read it as their default)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Graceful drain on SIGTERM (shutdown and rolling restarts): new requests are refused with a 503 while
+# requests in flight may finish for up to this many seconds; streams still open then end with an error event
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("DRAIN_TIMEOUT_SECONDS", "25"))
+
+# Readiness (/readyz): a worker whose load score (0 idle, 1 saturated) reaches this reports not ready
+READY_MAX_LOAD_SCORE = float(os.getenv("READY_MAX_LOAD_SCORE", "1.0"))
+# Add the worker's load score to every response as X-Load-Score, for load balancers that weight by it
+LOAD_SCORE_HEADER_ENABLED = os.getenv("LOAD_SCORE_HEADER_ENABLED", "false").lower() == "true"
+
+# Event loop monitor: lag is sampled every interval; a loop stalled longer than the threshold is reported with its stack
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_MONITOR_INTERVAL_MS = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "50"))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+# Source content reduction before prompting
+CONTENT_REDUCTION_ENABLED = os.getenv("CONTENT_REDUCTION_ENABLED", "true").lower() == "true"
+# Characters of page text requested from Exa per result before reduction
+EXA_TEXT_LENGTH_LIMIT = int(os.getenv("EXA_TEXT_LENGTH_LIMIT", "12000"))
+# Token budget and chunk count passed on to the model per tool result
+CONTENT_TOKEN_BUDGET = int(os.getenv("CONTENT_TOKEN_BUDGET", "1500"))
+CONTENT_TOP_K = int(os.getenv("CONTENT_TOP_K", "12"))
+CONTENT_CHUNK_TOKENS = int(os.getenv("CONTENT_CHUNK_TOKENS", "120"))
+
+# Local index of previously fetched research sources
+KNOWLEDGE_INDEX_ENABLED = os.getenv("KNOWLEDGE_INDEX_ENABLED", "true").lower() == "true"
+KNOWLEDGE_INDEX_PATH = os.getenv("KNOWLEDGE_INDEX_PATH", os.path.join(DATA_DIR, "knowledge.db"))
+# Indexed documents older than this are not used to answer searches
+KNOWLEDGE_MAX_AGE_SECONDS = int(os.getenv("KNOWLEDGE_MAX_AGE_SECONDS", "86400"))
+# A search is answered locally when this many documents cover enough of its terms
+KNOWLEDGE_MIN_RESULTS = int(os.getenv("KNOWLEDGE_MIN_RESULTS", "3"))
+KNOWLEDGE_MIN_COVERAGE = float(os.getenv("KNOWLEDGE_MIN_COVERAGE", "0.8"))
+# Compaction evicts the oldest documents beyond this many
+KNOWLEDGE_MAX_DOCUMENTS = int(os.getenv("KNOWLEDGE_MAX_DOCUMENTS", "50000"))
+# Documents written between automatic compactions (per worker)
+KNOWLEDGE_COMPACT_EVERY = int(os.getenv("KNOWLEDGE_COMPACT_EVERY", "1000"))
+
+# Append raw Exa results as JSON lines here (for the content reduction benchmark)
+EXA_RECORD_PATH = os.getenv("EXA_RECORD_PATH")
+
+# Append anonymized chat/research request shapes and timings here (for tests/benchmarks/replay_traffic.py)
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH")
+# Key for the research query fingerprints in the trace; set it to keep them from being matched against guessed queries
+TRAFFIC_RECORD_SALT = os.getenv("TRAFFIC_RECORD_SALT", "")
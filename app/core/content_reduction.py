@@ -0,0 +1,283 @@
+import html
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from app.core.research_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_BLOCK_TAGS = re.compile(r"<(script|style|noscript|nav|footer|header|aside|form|svg)\b.*?</\1\s*>", re.I | re.S)
+_TAGS = re.compile(r"<[^>]+>")
+_MD_IMAGES = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_MD_LINKS = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_BARE_URLS = re.compile(r"https?://\S+")
+_SPACES = re.compile(r"[ \t\f\v]+")
+_PARAGRAPHS = re.compile(r"\n\s*\n|\n(?=#)")
+_SENTENCES = re.compile(r"(?<=[.!?])\s+")
+_WORDS = re.compile(r"\w+")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were "
+    "what when where which who why will with about into than then there these those how do does".split()
+)
+
+_MASK64 = (1 << 64) - 1
+# SimHash distance at or below which two chunks count as near-duplicates
+NEAR_DUPLICATE_BITS = 3
+
+
+def extract_text(raw: str) -> str:
+    """
+    Extract readable text from HTML, markdown or plain page content.
+
+    Script/style/navigation blocks and tags are removed, links keep only their
+    text, and lines too short to carry content (menus, share buttons) are
+    dropped unless they look like headings.
+    """
+    if not raw:
+        return ""
+
+    text = raw
+    if "<" in text and ">" in text:
+        text = _BLOCK_TAGS.sub(" ", text)
+        text = re.sub(r"<(br|/p|/div|/li|/h\d)\b[^>]*>", "\n", text, flags=re.I)
+        text = _TAGS.sub(" ", text)
+        text = html.unescape(text)
+    text = _MD_IMAGES.sub(" ", text)
+    text = _MD_LINKS.sub(r"\1", text)
+    text = _BARE_URLS.sub(" ", text)
+
+    lines = []
+    for line in text.splitlines():
+        line = _SPACES.sub(" ", line).strip()
+        if not line:
+            lines.append("")
+        elif line.startswith("#") or len(line.split()) >= 4:
+            lines.append(line)
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def split_passages(text: str, max_tokens: int) -> List[str]:
+    """Split text into paragraphs, breaking paragraphs longer than max_tokens into sentences."""
+    passages: List[str] = []
+    for paragraph in _PARAGRAPHS.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            passages.append(paragraph)
+        else:
+            passages.extend(s for s in _SENTENCES.split(paragraph) if s)
+    return passages
+
+
+def group_passages(passages: List[str], chunk_tokens: int) -> List[List[int]]:
+    """Group consecutive passages into chunks of roughly chunk_tokens, as lists of passage indexes."""
+    groups: List[List[int]] = []
+    current: List[int] = []
+    size = 0
+    for i, passage in enumerate(passages):
+        passage_size = estimate_tokens(passage)
+        if current and size + passage_size > chunk_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(i)
+        size += passage_size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def split_chunks(text: str, chunk_tokens: int) -> List[str]:
+    """Split text into chunks of roughly chunk_tokens, on paragraph and then sentence boundaries."""
+    passages = split_passages(text, chunk_tokens)
+    return [" ".join(passages[i] for i in group) for group in group_passages(passages, chunk_tokens)]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens without stopwords."""
+    return [t for t in _WORDS.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def simhash(tokens: List[str]) -> int:
+    """
+    64-bit SimHash over word unigrams and bigrams.
+
+    The per-bit majority vote is done column-wise over the features' binary
+    strings, so the counting runs in C rather than a Python loop per bit.
+    """
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    if not features:
+        return 0
+    bits = [format(hash(f) & _MASK64, "064b") for f in features]
+    half = len(bits) / 2
+    value = 0
+    for column in zip(*bits):
+        value = (value << 1) | (column.count("1") > half)
+    return value
+
+
+def _bands(value: int) -> Iterable[Tuple[int, int]]:
+    # Four 16-bit bands: near-duplicates within 3 bits always share at least one band
+    for band in range(4):
+        yield band, (value >> (band * 16)) & 0xFFFF
+
+
+class BM25:
+    """Okapi BM25 over a fixed set of tokenized chunks."""
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(doc) for doc in documents]
+        self.lengths = [len(doc) for doc in documents]
+        self.avg_length = (sum(self.lengths) / len(documents)) if documents else 0.0
+        doc_freqs = Counter(term for tf in self.term_freqs for term in tf)
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def scores(self, query: List[str]) -> List[float]:
+        """Score every document against the query terms."""
+        terms = [t for t in set(query) if t in self.idf]
+        scores = [0.0] * len(self.term_freqs)
+        if not terms or not self.avg_length:
+            return scores
+        # Per-document length normalisation is shared by all query terms
+        norms = [self.k1 * (1 - self.b + self.b * length / self.avg_length) for length in self.lengths]
+        for term in terms:
+            idf = self.idf[term]
+            for i, tf in enumerate(self.term_freqs):
+                freq = tf.get(term)
+                if freq:
+                    scores[i] += idf * freq * (self.k1 + 1) / (freq + norms[i])
+        return scores
+
+
+@dataclass
+class ReductionStats:
+    """Size of the source material before and after reduction."""
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+    chunks: int = 0
+    duplicates: int = 0
+    selected: int = 0
+
+
+class ContentReducer:
+    """
+    Reduce fetched source content to the chunks most relevant to a query.
+
+    Text is extracted and split into passages, near-duplicate passages are
+    dropped (within a batch and against passages already passed on by this
+    reducer), the rest are grouped into chunks, ranked with BM25 and the best
+    are kept within a token budget.
+    """
+
+    def __init__(self, token_budget: int, top_k: int, chunk_tokens: int):
+        self.token_budget = token_budget
+        self.top_k = top_k
+        self.chunk_tokens = chunk_tokens
+        self._seen_bands: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        self.totals = ReductionStats()
+
+    def _is_duplicate(self, value: int, bands: Dict[Tuple[int, int], List[int]]) -> bool:
+        for band in _bands(value):
+            for other in bands.get(band, ()):
+                if (value ^ other).bit_count() <= NEAR_DUPLICATE_BITS:
+                    return True
+        return False
+
+    def reduce(self, results: List[Dict[str, Any]], query: str) -> Tuple[List[Dict[str, Any]], ReductionStats]:
+        """
+        Reduce Exa results to their most relevant chunks.
+
+        Args:
+            results: Parsed Exa results with url, title, text and highlights
+            query: The text chunks are ranked against
+
+        Returns:
+            The results with text replaced by the selected chunks (in page order,
+            highlights folded in) and statistics for this batch.
+        """
+        stats = ReductionStats()
+        candidates: List[Tuple[int, int, str, List[str], List[int]]] = []
+        batch_bands: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+        for source_index, result in enumerate(results):
+            raw = result.get("text") or ""
+            highlights = result.get("highlights")
+            if isinstance(highlights, list):
+                raw = "\n\n".join([raw] + [h for h in highlights if isinstance(h, str)])
+            stats.input_tokens += estimate_tokens(raw)
+
+            # Deduplicate per passage: syndicated paragraphs rarely line up into identical chunks
+            passages, passage_tokens, passage_hashes = [], [], []
+            for passage in split_passages(extract_text(raw), self.chunk_tokens):
+                tokens = tokenize(passage)
+                value = simhash(tokens)
+                if self._is_duplicate(value, batch_bands) or self._is_duplicate(value, self._seen_bands):
+                    stats.duplicates += 1
+                    continue
+                for band in _bands(value):
+                    batch_bands[band].append(value)
+                passages.append(passage)
+                passage_tokens.append(tokens)
+                passage_hashes.append(value)
+
+            for position, group in enumerate(group_passages(passages, self.chunk_tokens)):
+                stats.chunks += 1
+                candidates.append((
+                    source_index,
+                    position,
+                    " ".join(passages[i] for i in group),
+                    [t for i in group for t in passage_tokens[i]],
+                    [passage_hashes[i] for i in group],
+                ))
+
+        scores = BM25([c[3] for c in candidates]).scores(tokenize(query))
+        ranked = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        if not any(scores):
+            # Nothing matches the query: fall back to each source's opening chunks
+            ranked = sorted(range(len(candidates)), key=lambda i: (candidates[i][1], candidates[i][0]))
+
+        selected: Set[int] = set()
+        used = 0
+        for i in ranked:
+            if len(selected) >= self.top_k:
+                break
+            size = estimate_tokens(candidates[i][2])
+            if used + size > self.token_budget:
+                continue
+            selected.add(i)
+            used += size
+
+        by_source: Dict[int, List[Tuple[int, str]]] = defaultdict(list)
+        for i in selected:
+            source_index, position, chunk, _, values = candidates[i]
+            by_source[source_index].append((position, chunk))
+            for value in values:
+                for band in _bands(value):
+                    self._seen_bands[band].append(value)
+
+        reduced = []
+        for source_index, result in enumerate(results):
+            entry = {k: v for k, v in result.items() if k not in ("text", "highlights")}
+            chunks = [chunk for _, chunk in sorted(by_source.get(source_index, []))]
+            if chunks:
+                entry["text"] = "\n\n".join(chunks)
+            reduced.append(entry)
+
+        stats.selected = len(selected)
+        stats.output_tokens = used
+        for field in ("input_tokens", "output_tokens", "chunks", "duplicates", "selected"):
+            setattr(self.totals, field, getattr(self.totals, field) + getattr(stats, field))
+        logger.debug(
+            f"Reduced {stats.input_tokens} source tokens to {stats.output_tokens}",
+            extra={"chunks": stats.chunks, "duplicates": stats.duplicates, "selected": stats.selected}
+        )
+        return reduced, stats
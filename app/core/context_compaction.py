@@ -0,0 +1,225 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core import prefork, token_usage
+from app.core.metrics import CONTEXT_COMPACTIONS, CONTEXT_SUMMARY_DURATION, CONTEXT_TOKENS_SAVED, model_label
+from app.models.chat import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# Introduces the summary, sent as a system message in place of the turns it covers
+SUMMARY_HEADER = "Summary of the earlier conversation (older turns are not shown):"
+
+# Summarize(previous summary or None, messages to add) -> new summary
+Summarizer = Callable[[Optional[str], List[ChatMessage]], str]
+
+
+def prefix_keys(messages: Sequence[ChatMessage]) -> List[str]:
+    """
+    Keys identifying each prefix of a conversation: keys[i] covers messages[:i + 1].
+
+    Each key chains the previous one, so a summary stored under a prefix is
+    found again whenever a later request starts with the same messages.
+    """
+    keys = []
+    previous = b""
+    for message in messages:
+        digest = hashlib.blake2b(previous, digest_size=16)
+        digest.update(message.role.encode("utf-8") + b"\0" + message.content.encode("utf-8"))
+        previous = digest.digest()
+        keys.append(previous.hex())
+    return keys
+
+
+class SummaryStore(prefork.SQLiteStore):
+    """
+    Rolling summaries of conversation prefixes, in SQLite so every worker can reuse them.
+
+    Summaries not used for ttl seconds are deleted every prune_every writes.
+    """
+
+    def __init__(self, path: str, ttl: float, prune_every: int = 1000):
+        self._open(path)
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                used_at REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_used ON summaries (used_at)")
+
+    def latest(self, keys: Sequence[str]) -> Optional[Tuple[int, str]]:
+        """
+        Find the longest prefix with a stored summary.
+
+        Returns:
+            The number of messages the summary covers and the summary, or None.
+        """
+        if not keys:
+            return None
+        positions = {key: i for i, key in enumerate(keys)}
+        found = []
+        with self._lock:
+            # Stay below SQLite's default limit on bound parameters
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                found.extend(self._conn.execute(
+                    f"SELECT key, summary FROM summaries WHERE key IN ({','.join('?' * len(batch))})", batch
+                ))
+            if not found:
+                return None
+            key, summary = max(found, key=lambda row: positions[row[0]])
+            self._conn.execute("UPDATE summaries SET used_at = ? WHERE key = ?", (time.time(), key))
+        return positions[key] + 1, summary
+
+    def put(self, key: str, summary: str) -> None:
+        prune = False
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, used_at) VALUES (?, ?, ?)",
+                (key, summary, time.time()),
+            )
+            self._writes += 1
+            if self.prune_every and self._writes >= self.prune_every:
+                self._writes = 0
+                prune = True
+        if prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """Delete summaries unused for longer than the TTL; returns how many were deleted."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM summaries WHERE used_at < ?", (time.time() - self.ttl,)).rowcount
+
+
+class ContextCompactor:
+    """
+    Fits a conversation into a per-model token budget.
+
+    Leading system messages and the most recent turns are kept verbatim;
+    when the history exceeds the budget, older turns are replaced by a
+    summary sent as one system message. Summaries are rolling: the summary of
+    a longer prefix is built from the stored summary of a shorter one plus the
+    turns in between, so each turn only summarizes what is new. The
+    summarized part advances in steps of several messages, so one summary
+    serves the next few turns unchanged.
+    """
+
+    def __init__(
+        self,
+        summarize: Summarizer,
+        store: SummaryStore,
+        budget: int,
+        budgets: Optional[str] = None,
+        keep_recent: int = 4,
+        step: int = 6,
+        summary_tokens: int = 500,
+        input_tokens: int = 6000,
+    ):
+        """
+        Args:
+            summarize: Produces a summary from the previous one and the messages to add
+            store: Where summaries are kept between requests
+            budget: Default prompt token budget of a conversation
+            budgets: Per-model budgets as JSON ({"model": tokens}), matched by longest prefix
+            keep_recent: Most recent messages always kept verbatim
+            step: Messages by which the summarized part advances at a time
+            summary_tokens: Tokens reserved in the budget for the summary
+            input_tokens: Most tokens of messages summarized in one model request
+        """
+        self.summarize = summarize
+        self.store = store
+        self.budget = budget
+        self.budgets = {k: int(v) for k, v in json.loads(budgets).items()} if budgets else {}
+        self.keep_recent = max(1, keep_recent)
+        self.step = max(1, step)
+        self.summary_tokens = summary_tokens
+        self.input_tokens = input_tokens
+
+    def budget_for(self, model: str) -> int:
+        """The token budget for a model, matched by longest prefix."""
+        matches = [name for name in self.budgets if model == name or model.startswith(name + "-")]
+        return self.budgets[max(matches, key=len)] if matches else self.budget
+
+    def compact(self, messages: List[ChatMessage], model: str) -> Tuple[List[ChatMessage], Optional[Dict[str, Any]]]:
+        """
+        Fit messages (ending with the new one) into the model's budget.
+
+        Returns:
+            The messages to send, and a report of the savings, or None if the
+            conversation already fits.
+        """
+        counts = [
+            token_usage.count_tokens(m.content, model) + token_usage.MESSAGE_OVERHEAD_TOKENS for m in messages
+        ]
+        original = sum(counts)
+        budget = self.budget_for(model)
+        if original <= budget:
+            return messages, None
+
+        pinned = 0
+        while pinned < len(messages) - 1 and messages[pinned].role == "system":
+            pinned += 1
+        rest, rest_counts = messages[pinned:], counts[pinned:]
+
+        # Keep as many recent messages as fit next to the system messages and the summary
+        available = budget - sum(counts[:pinned]) - self.summary_tokens
+        split = len(rest) - self.keep_recent
+        kept = sum(rest_counts[split:]) if split > 0 else 0
+        while split > 0 and kept + rest_counts[split - 1] <= available:
+            split -= 1
+            kept += rest_counts[split]
+        if split <= 0:
+            return messages, None
+        # Round up to a step boundary, so the same summary serves the following turns
+        split = max(split, min(-(-split // self.step) * self.step, len(rest) - self.keep_recent))
+
+        keys = prefix_keys(rest[:split])
+        started = time.perf_counter()
+        stored = self.store.latest(keys)
+        covered, summary = stored if stored is not None else (0, None)
+        requests = 0
+        while covered < split:
+            end, tokens = covered, 0
+            while end < split and (end == covered or tokens + rest_counts[end] <= self.input_tokens):
+                tokens += rest_counts[end]
+                end += 1
+            summary = self.summarize(summary, rest[covered:end])
+            requests += 1
+            self.store.put(keys[end - 1], summary)
+            covered = end
+        elapsed = time.perf_counter() - started
+
+        outcome = "cached" if requests == 0 else "extended" if stored is not None else "new"
+        CONTEXT_COMPACTIONS.labels(outcome).inc()
+        if requests:
+            CONTEXT_SUMMARY_DURATION.observe(elapsed)
+
+        summary_message = ChatMessage.model_construct(role="system", content=f"{SUMMARY_HEADER}\n{summary}")
+        compacted = messages[:pinned] + [summary_message] + rest[split:]
+        sent = (
+            sum(counts[:pinned]) + sum(rest_counts[split:])
+            + token_usage.count_tokens(summary_message.content, model) + token_usage.MESSAGE_OVERHEAD_TOKENS
+        )
+        CONTEXT_TOKENS_SAVED.labels(model_label(model)).inc(max(0, original - sent))
+        logger.debug("Compacted %d messages into a summary (%s), %d -> %d tokens", split, outcome, original, sent)
+        return compacted, {
+            "original_tokens": original,
+            "sent_tokens": sent,
+            "saved_tokens": original - sent,
+            "summarized_messages": split,
+            "summary": outcome,
+            "summary_requests": requests,
+            "summary_ms": round(elapsed * 1000, 1),
+        }
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import signal
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Set, TypeVar
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import DRAIN_TIMEOUT_SECONDS
+from app.core.metrics import DRAIN_DURATION, DRAIN_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Seconds a refused client is asked to wait before retrying (by then it reaches another worker or replica)
+RETRY_AFTER_SECONDS = 1
+
+# Seconds cut streams get to send their terminal event and close once the deadline has passed
+CUT_GRACE_SECONDS = 2.0
+
+# Seconds between checks for requests still in flight
+POLL_SECONDS = 0.1
+
+
+class StreamCut(Exception):
+    """A stream was ended because the drain deadline passed before it finished."""
+
+    def __init__(self):
+        super().__init__("Server is shutting down, retry the request")
+
+
+class _Stream:
+    """A stream passing through Drain.guard()."""
+
+    __slots__ = ("task", "waiting", "cut")
+
+    def __init__(self, task: Optional[asyncio.Task]):
+        self.task = task
+        self.waiting = False
+        self.cut = False
+
+
+class Drain:
+    """
+    Lets a worker finish its requests in flight before it shuts down.
+
+    On SIGTERM (see install()) the worker starts draining instead of stopping
+    at once:
+
+    - New requests are refused with a 503, Retry-After and Connection: close
+      (see DrainMiddleware), so clients and load balancers retry elsewhere;
+      /readyz reports the worker as not ready.
+    - Requests and streams in flight may finish until the deadline (timeout
+      seconds after SIGTERM). Streams still open then end with an error
+      event (see guard()) instead of being dropped mid-reply; a request
+      still running after that is dropped when the server stops.
+    - Background tasks handed to track() (research runs) are waited for,
+      and on_begin() callbacks hear the deadline, so runs can wrap up.
+
+    Then the server's own shutdown runs as before. The drain's duration and
+    what became of the requests in flight are logged and recorded in the
+    drain_* metrics.
+    """
+
+    def __init__(self, timeout: float = 25.0, exempt_paths: Sequence[str] = ("/metrics", "/healthz", "/readyz")):
+        """
+        Args:
+            timeout: Seconds requests in flight may take to finish after SIGTERM
+            exempt_paths: Paths still served while draining (exact matches)
+        """
+        self.timeout = timeout
+        self.exempt_paths = frozenset(exempt_paths)
+        self.draining = False
+        self.deadline: Optional[float] = None
+        self.in_flight = 0
+        self.refused = 0
+        self.cut = 0
+        self.report: Optional[Dict[str, Any]] = None
+        self._expired = False
+        self._started = 0.0
+        self._streams: Set[_Stream] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._on_begin: List[Callable[[float], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def on_begin(self, callback: Callable[[float], None]) -> Callable[[float], None]:
+        """Register a callback called with the deadline (time.monotonic()) when draining begins."""
+        self._on_begin.append(callback)
+        return callback
+
+    def track(self, task: asyncio.Task) -> None:
+        """Wait for a background task (until the deadline) before the worker shuts down."""
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def install(self) -> bool:
+        """
+        Drain on SIGTERM before handing the signal to the server's own handler.
+
+        Call from the server's running event loop (e.g. in the app's lifespan),
+        after the server installed its handler. A second SIGTERM stops the
+        server at once.
+
+        Returns:
+            False if there is no handler to wrap (not the main thread, or no Python handler installed).
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return False
+        previous = signal.getsignal(signal.SIGTERM)
+        if not callable(previous):
+            return False
+        loop = asyncio.get_running_loop()
+
+        def handle_sigterm(sig, frame):
+            if self._task is not None:
+                previous(sig, frame)
+                return
+            loop.call_soon_threadsafe(self._start, previous, sig)
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
+        return True
+
+    def _start(self, previous: Callable, sig: int) -> None:
+        async def drain_then_stop():
+            try:
+                await self.drain()
+            except Exception as e:
+                logger.error(f"Drain failed: {str(e)}", exc_info=True)
+            finally:
+                previous(sig, None)
+
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(drain_then_stop())
+
+    def begin(self) -> None:
+        """Start refusing new requests and tell the on_begin callbacks the deadline."""
+        if self.draining:
+            return
+        self.draining = True
+        self._started = time.monotonic()
+        self.deadline = self._started + self.timeout
+        logger.info(
+            f"Draining before shutdown",
+            extra={"in_flight": self.in_flight, "background_tasks": len(self._tasks), "timeout_seconds": self.timeout}
+        )
+        for callback in self._on_begin:
+            try:
+                callback(self.deadline)
+            except Exception as e:
+                logger.error(f"Drain callback {callback.__qualname__} failed: {str(e)}")
+
+    async def drain(self) -> Dict[str, Any]:
+        """
+        Drain the worker: wait for requests in flight until the deadline, then cut the streams still open.
+
+        Returns:
+            The drain report (also kept in report): duration and the requests completed, cut, dropped and refused.
+        """
+        self.begin()
+        in_flight = self.in_flight
+        while (self.in_flight or self._tasks) and time.monotonic() < self.deadline:
+            await asyncio.sleep(POLL_SECONDS)
+
+        if self.in_flight:
+            self._expired = True
+            # Streams waiting for their next chunk are woken up; the others stop before awaiting it
+            for stream in list(self._streams):
+                if stream.waiting and stream.task is not None:
+                    stream.cut = True
+                    stream.task.cancel()
+            grace = time.monotonic() + CUT_GRACE_SECONDS
+            while self.in_flight and time.monotonic() < grace:
+                await asyncio.sleep(POLL_SECONDS)
+
+        duration = time.monotonic() - self._started
+        dropped = self.in_flight
+        completed = max(in_flight - self.cut - dropped, 0)
+        self.report = {
+            "duration_seconds": round(duration, 3),
+            "completed": completed,
+            "stream_cut": self.cut,
+            "dropped": dropped,
+            "refused": self.refused,
+            "unfinished_background_tasks": len(self._tasks),
+        }
+        DRAIN_DURATION.observe(duration)
+        for outcome in ("completed", "stream_cut", "dropped"):
+            DRAIN_REQUESTS.labels(outcome).inc(self.report[outcome])
+        log = logger.warning if self.cut or dropped else logger.info
+        log(f"Drained in {duration:.1f}s", extra=self.report)
+        return self.report
+
+    async def guard(self, chunks: AsyncIterator[T]) -> AsyncIterator[T]:
+        """
+        Pass a stream's chunks through, ending it with StreamCut once the drain deadline has passed.
+
+        The endpoint's error handling turns StreamCut into the stream's error
+        event, so clients get a terminal event telling them to retry rather
+        than a connection dropped mid-reply.
+        """
+        stream = _Stream(asyncio.current_task())
+        self._streams.add(stream)
+        try:
+            while True:
+                if self._expired:
+                    self.cut += 1
+                    raise StreamCut()
+                stream.waiting = True
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+                except asyncio.CancelledError:
+                    if not stream.cut:
+                        raise
+                    # Cancelled by drain() rather than by the server: carry on to the error event
+                    stream.task.uncancel()
+                    self.cut += 1
+                    raise StreamCut() from None
+                finally:
+                    stream.waiting = False
+                yield chunk
+        finally:
+            self._streams.discard(stream)
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+class DrainMiddleware:
+    """
+    Refuses new requests with a 503 while the worker drains, and counts the requests in flight.
+
+    Requests to the drain's exempt paths are neither refused nor counted.
+    """
+
+    def __init__(self, app: ASGIApp, drain: Drain):
+        """
+        Args:
+            app: The application to wrap
+            drain: Drain whose state decides whether requests are refused
+        """
+        self.app = app
+        self.drain = drain
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.drain.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        if self.drain.draining:
+            self.drain.refused += 1
+            DRAIN_REQUESTS.labels("refused").inc()
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server is shutting down, retry the request"},
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS), "Connection": "close"},
+            )
+            await response(scope, receive, send)
+            return
+        self.drain.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.drain.in_flight -= 1
+
+
+drain = Drain(timeout=DRAIN_TIMEOUT_SECONDS)
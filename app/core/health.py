@@ -0,0 +1,106 @@
+import math
+from typing import Any, Dict, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import capacity, offload
+from app.core.config import LOOP_BLOCK_THRESHOLD_MS, READY_MAX_LOAD_SCORE
+from app.core.drain import Drain, drain
+from app.core.loop_monitor import LoopMonitor
+from app.core.model_router import router as model_router
+
+# Response header carrying the worker's load score (see LoadScoreMiddleware)
+LOAD_SCORE_HEADER = b"x-load-score"
+
+
+class HealthProbe:
+    """
+    Readiness and load of this worker, from the saturation signals it already tracks.
+
+    The load score is the highest of:
+
+    - pool occupancy: offload calls running and waiting over the pool's threads
+    - concurrency: chat and research requests in flight over the capacity
+      controller's limit (when capacity control is enabled)
+    - loop lag: the event loop's average lag over the lag the loop monitor
+      reports as blocked (when the monitor runs)
+
+    capped at 1, so 0 is idle and 1 saturated: new work would wait for a
+    thread, be refused or be slowed by the loop. The worker is ready while
+    it is not draining and its score is below max_load_score.
+
+    Circuit breaker states are reported but don't affect readiness: an
+    upstream outage affects every worker alike, and the router already
+    routes around open circuits.
+    """
+
+    def __init__(self, drain: Drain, max_load_score: float = 1.0, lag_limit: float = 0.1):
+        """
+        Args:
+            drain: Drain whose state and in-flight count to report
+            max_load_score: Load score from which the worker reports not ready
+            lag_limit: Loop lag in seconds that counts as saturated
+        """
+        self.drain = drain
+        self.max_load_score = max_load_score
+        self.lag_limit = lag_limit
+        # Set by the app's lifespan when the loop monitor runs
+        self.monitor: Optional[LoopMonitor] = None
+
+    def load_score(self) -> float:
+        """This worker's load, from 0 (idle) to 1 (saturated)."""
+        usage = offload.usage()
+        score = (usage.busy + usage.queued) / max(usage.threads, 1)
+        if capacity.controller is not None:
+            score = max(score, capacity.controller.in_flight / max(capacity.controller.limit, 1))
+        if self.monitor is not None:
+            score = max(score, self.monitor.average_lag / self.lag_limit)
+        return min(score, 1.0)
+
+    def readiness(self) -> Dict[str, Any]:
+        """Whether the worker should get new requests, and the signals that decided it."""
+        usage = offload.usage()
+        score = self.load_score()
+        return {
+            "ready": not self.drain.draining and score < self.max_load_score,
+            "draining": self.drain.draining,
+            "load_score": round(score, 3),
+            "in_flight": self.drain.in_flight,
+            "concurrency_limit": capacity.controller.limit if capacity.controller is not None else None,
+            "offload_threads": usage.threads,
+            "offload_busy": usage.busy,
+            "offload_queued": usage.queued,
+            "loop_lag_ms": round(self.monitor.average_lag * 1000, 1) if self.monitor is not None else None,
+            "circuits": model_router.circuit_states(),
+        }
+
+
+class LoadScoreMiddleware:
+    """Adds the worker's load score to every HTTP response, for load balancers that weight workers by it."""
+
+    def __init__(self, app: ASGIApp, probe: HealthProbe):
+        """
+        Args:
+            app: The application to wrap
+            probe: Probe computing the load score
+        """
+        self.app = app
+        self.probe = probe
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_score(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # Rounded up, so only an idle worker reports 0
+                score = math.ceil(self.probe.load_score() * 100) / 100
+                message.setdefault("headers", [])
+                message["headers"].append((LOAD_SCORE_HEADER, f"{score:.2f}".encode("latin-1")))
+            await send(message)
+
+        await self.app(scope, receive, send_with_score)
+
+
+probe = HealthProbe(drain, max_load_score=READY_MAX_LOAD_SCORE, lag_limit=LOOP_BLOCK_THRESHOLD_MS / 1000)
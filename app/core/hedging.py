@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Tuple
+
+from app.core.metrics import HEDGE_DELAY, HEDGED_STREAMS
+
+logger = logging.getLogger(__name__)
+
+# Starts a stream of content for a model
+StreamFactory = Callable[[], AsyncIterator[str]]
+
+
+class HedgePolicy:
+    """
+    When to send a second (hedge) request for a stream that has not produced its first token.
+
+    The delay is a percentile of recent times to first token for the model,
+    so only the slowest few requests are hedged. Hedges are budgeted: every
+    stream earns budget_percent / 100 of a hedge, and a hedge is only sent
+    when a whole one has been earned, so they never exceed that share of
+    traffic (bursts of up to max_burst hedges are allowed after quiet periods).
+    Statistics and budget are kept per worker.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        min_delay: float = 0.5,
+        default_delay: float = 2.0,
+        budget_percent: float = 5.0,
+        window: int = 200,
+        min_samples: int = 20,
+        max_burst: float = 5.0,
+    ):
+        """
+        Args:
+            percentile: Percentile of recent times to first token used as the hedge delay
+            min_delay: Shortest hedge delay in seconds
+            default_delay: Hedge delay in seconds until a model has min_samples observations
+            budget_percent: Most hedges as a percentage of streams
+            window: Recent times to first token kept per model
+            min_samples: Observations before the percentile is used
+            max_burst: Most unspent hedges that can accumulate
+        """
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.budget_percent = budget_percent
+        self.window = window
+        self.min_samples = min_samples
+        self.max_burst = max_burst
+        self._ttft: Dict[str, Deque[float]] = {}
+        self._credit = 0.0
+        self._outcomes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def delay(self, model: str) -> float:
+        """Seconds to wait for the first token before hedging."""
+        with self._lock:
+            samples = sorted(self._ttft.get(model, ()))
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return max(self.min_delay, samples[index])
+
+    def observe(self, model: str, seconds: float) -> None:
+        """Record a time to first token (or a lower bound of it, for a request cancelled before its first token)."""
+        with self._lock:
+            samples = self._ttft.get(model)
+            if samples is None:
+                samples = self._ttft[model] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def earn(self) -> None:
+        """Credit the budget for one stream."""
+        with self._lock:
+            self._credit = min(self.max_burst, self._credit + self.budget_percent / 100)
+
+    def spend(self) -> bool:
+        """Take one hedge from the budget; False if it is used up."""
+        with self._lock:
+            if self._credit < 1:
+                return False
+            self._credit -= 1
+            return True
+
+    def count(self, outcome: str) -> None:
+        HEDGED_STREAMS.labels(outcome).inc()
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Outcome counts, hedge win rate and current delays of this worker."""
+        with self._lock:
+            outcomes = dict(self._outcomes)
+            models = list(self._ttft)
+            credit = self._credit
+        decided = outcomes.get("hedge_won", 0) + outcomes.get("primary_won", 0)
+        return {
+            "outcomes": outcomes,
+            "hedge_win_rate": round(outcomes.get("hedge_won", 0) / decided, 3) if decided else None,
+            "budget_available": round(credit, 2),
+            "delay_ms": {model: round(self.delay(model) * 1000, 1) for model in models},
+        }
+
+    async def stream(
+        self,
+        primary_model: str,
+        primary: StreamFactory,
+        hedge_model: str,
+        hedge: StreamFactory,
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Stream content from primary, hedged with a second request if its first token is late.
+
+        The first stream to produce a token wins and the other is cancelled. A
+        stream that fails before its first token leaves the other to finish;
+        if both fail, the primary's error is raised.
+
+        Yields:
+            (model, content) pairs from the winning stream.
+        """
+        self.earn()
+        delay = self.delay(primary_model)
+        HEDGE_DELAY.observe(delay)
+        primary_stream = primary()
+        pending = {
+            asyncio.ensure_future(primary_stream.__anext__()): ("primary", primary_model, primary_stream, time.perf_counter())
+        }
+
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        hedged = False
+        if not done:
+            if self.spend():
+                hedged = True
+                logger.info(f"No first token from {primary_model} after {delay:.2f}s, hedging with {hedge_model}")
+                hedge_stream = hedge()
+                pending[asyncio.ensure_future(hedge_stream.__anext__())] = ("hedge", hedge_model, hedge_stream, time.perf_counter())
+            else:
+                self.count("budget_exhausted")
+        elif self.budget_percent > 0:
+            self.count("not_needed")
+
+        winner, first, error = None, None, None
+        try:
+            while pending and winner is None:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    role, model, stream, started = pending.pop(task)
+                    try:
+                        first = task.result()
+                    except StopAsyncIteration:
+                        # Ended without content, which is still an answer
+                        winner = (role, model, stream, started)
+                        break
+                    except Exception as e:
+                        if role == "primary" or error is None:
+                            error = e
+                        continue
+                    winner = (role, model, stream, started)
+                    self.observe(model, time.perf_counter() - started)
+                    break
+        finally:
+            # Cancel the loser (or both, if the consumer went away)
+            for task, (role, model, stream, started) in pending.items():
+                task.cancel()
+                if role == "primary":
+                    # At least this long; leaving it out would make the percentile ignore slow requests
+                    self.observe(model, time.perf_counter() - started)
+            await asyncio.gather(*pending, return_exceptions=True)
+            # Then close it, so its upstream request and connection are released now rather than when collected
+            # (a stream whose first chunk arrived along with the winner's is still open)
+            await asyncio.gather(*(stream.aclose() for _, _, stream, _ in pending.values()), return_exceptions=True)
+
+        if winner is None:
+            if hedged:
+                self.count("failed")
+            raise error
+        role, model, stream, _ = winner
+        if hedged:
+            self.count("hedge_won" if role == "hedge" else "primary_won")
+        if first is None:
+            return
+        try:
+            yield model, first
+            async for content in stream:
+                yield model, content
+        finally:
+            await stream.aclose()
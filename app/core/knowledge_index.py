@@ -0,0 +1,285 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from app.core import prefork
+from app.core.content_reduction import extract_text, split_chunks, tokenize
+from app.core.metrics import KNOWLEDGE_SEARCHES
+
+logger = logging.getLogger(__name__)
+
+# Chunk rowids are (document id << CHUNK_BITS) | position, so a document's
+# chunks form one rowid range that can be replaced without a table scan
+CHUNK_BITS = 10
+MAX_CHUNKS_PER_DOCUMENT = 1 << CHUNK_BITS
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """Build an FTS5 query matching any of the query's terms."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+class KnowledgeIndex(prefork.SQLiteStore):
+    """
+    On-disk inverted index over research sources fetched from Exa.
+
+    Documents are split into chunks and stored in an SQLite FTS5 table, which
+    keeps an inverted index with BM25 ranking. Adds are incremental (FTS5
+    writes new segments and merges them in the background); compact() evicts
+    the oldest documents beyond the size limit and merges all segments.
+    """
+
+    # Must be set before the first table is created to take effect
+    PRAGMAS = ("auto_vacuum=INCREMENTAL",)
+
+    def __init__(self, path: str, chunk_tokens: int, max_documents: int, compact_every: int):
+        """
+        Open (or create) the index.
+
+        Args:
+            path: Location of the SQLite database file
+            chunk_tokens: Target chunk size in tokens
+            max_documents: Documents kept by compaction (oldest are evicted first)
+            compact_every: Document writes between automatic compactions; 0 disables them
+        """
+        self._open(path)
+        self.chunk_tokens = chunk_tokens
+        self.max_documents = max_documents
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL UNIQUE,
+                title TEXT,
+                published_date TEXT,
+                content_hash TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_fetched_at ON documents (fetched_at)")
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(text, tokenize='unicode61')")
+
+        self._writes_since_compaction = 0
+        self.documents_added = 0
+        self.lookups = 0
+        self.lookup_ms_total = 0.0
+        self.lookup_ms_max = 0.0
+        self.local_answers = 0
+        self.remote_searches = 0
+        self.last_compaction: Optional[float] = None
+        logger.info(f"Knowledge index opened at {path}")
+
+    def add(self, results: List[Dict[str, Any]]) -> int:
+        """
+        Index fetched Exa results.
+
+        Documents already indexed with the same content only have their fetch
+        time refreshed; changed documents have their chunks replaced.
+
+        Args:
+            results: Parsed Exa results with url, title, published_date and text
+
+        Returns:
+            The number of documents (re)indexed.
+        """
+        indexed = 0
+        now = time.time()
+        with self._lock:
+            for result in results:
+                url = result.get("url")
+                text = extract_text(result.get("text") or "")
+                if not url or not text:
+                    continue
+                content_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+                row = self._conn.execute("SELECT id, content_hash FROM documents WHERE url = ?", (url,)).fetchone()
+                if row is not None and row[1] == content_hash:
+                    self._conn.execute("UPDATE documents SET fetched_at = ? WHERE id = ?", (now, row[0]))
+                    continue
+
+                chunks = split_chunks(text, self.chunk_tokens)[:MAX_CHUNKS_PER_DOCUMENT]
+                self._conn.execute("BEGIN")
+                try:
+                    if row is None:
+                        doc_id = self._conn.execute(
+                            "INSERT INTO documents (url, title, published_date, content_hash, fetched_at) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (url, result.get("title"), result.get("published_date"), content_hash, now),
+                        ).lastrowid
+                    else:
+                        doc_id = row[0]
+                        self._delete_chunks(doc_id)
+                        self._conn.execute(
+                            "UPDATE documents SET title = ?, published_date = ?, content_hash = ?, fetched_at = ? "
+                            "WHERE id = ?",
+                            (result.get("title"), result.get("published_date"), content_hash, now, doc_id),
+                        )
+                    self._conn.executemany(
+                        "INSERT INTO chunks (rowid, text) VALUES (?, ?)",
+                        [((doc_id << CHUNK_BITS) | position, chunk) for position, chunk in enumerate(chunks)],
+                    )
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                indexed += 1
+
+            self.documents_added += indexed
+            self._writes_since_compaction += indexed
+            due = self.compact_every and self._writes_since_compaction >= self.compact_every
+
+        if due:
+            self.compact()
+        return indexed
+
+    def _delete_chunks(self, doc_id: int) -> None:
+        first = doc_id << CHUNK_BITS
+        self._conn.execute(
+            "DELETE FROM chunks WHERE rowid BETWEEN ? AND ?",
+            (first, first + MAX_CHUNKS_PER_DOCUMENT - 1),
+        )
+
+    def search(self, query: str, num_results: int, max_age: float) -> List[Dict[str, Any]]:
+        """
+        Find indexed documents matching a query.
+
+        Args:
+            query: The search query
+            num_results: Maximum number of documents to return
+            max_age: Only documents fetched within this many seconds are returned
+
+        Returns:
+            Exa-style results (url, title, published_date, text) in BM25 order,
+            where text holds the document's matching chunks in page order and
+            coverage the share of query terms they contain.
+        """
+        expression = _match_expression(query)
+        if expression is None or num_results <= 0:
+            return []
+
+        started = time.perf_counter()
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT d.id, d.url, d.title, d.published_date, chunks.rowid, chunks.text
+                FROM chunks JOIN documents d ON d.id = (chunks.rowid >> ?)
+                WHERE chunks MATCH ? AND d.fetched_at >= ?
+                ORDER BY bm25(chunks)
+                LIMIT ?
+                """,
+                (CHUNK_BITS, expression, time.time() - max_age, num_results * 4),
+            ).fetchall()
+
+        documents: Dict[int, Dict[str, Any]] = {}
+        chunks: Dict[int, List[Any]] = defaultdict(list)
+        for doc_id, url, title, published_date, rowid, text in rows:
+            if doc_id not in documents:
+                if len(documents) >= num_results:
+                    continue
+                documents[doc_id] = {"url": url, "title": title, "published_date": published_date}
+            chunks[doc_id].append((rowid, text))
+
+        terms = set(tokenize(query))
+        results = []
+        for doc_id, document in documents.items():
+            ordered = [text for _, text in sorted(chunks[doc_id])]
+            found = terms.intersection(tokenize(" ".join(ordered)))
+            results.append(dict(
+                {k: v for k, v in document.items() if v is not None},
+                text="\n\n".join(ordered),
+                coverage=len(found) / len(terms),
+            ))
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.lookups += 1
+            self.lookup_ms_total += elapsed_ms
+            self.lookup_ms_max = max(self.lookup_ms_max, elapsed_ms)
+        return results
+
+    def answer(self, query: str, num_results: int, max_age: float, min_results: int, min_coverage: float) -> Optional[List[Dict[str, Any]]]:
+        """
+        Answer a search from the index when enough documents cover the query.
+
+        Args:
+            query: The search query
+            num_results: Maximum number of documents to return
+            max_age: Only documents fetched within this many seconds are used
+            min_results: Documents required to answer locally
+            min_coverage: Share of query terms a document must contain to count
+
+        Returns:
+            The local results, or None when the search should go to Exa.
+        """
+        results = [r for r in self.search(query, num_results, max_age) if r["coverage"] >= min_coverage]
+        with self._lock:
+            if len(results) < max(min_results, 1):
+                self.remote_searches += 1
+                KNOWLEDGE_SEARCHES.labels("remote").inc()
+                return None
+            self.local_answers += 1
+        KNOWLEDGE_SEARCHES.labels("local").inc()
+        logger.info(f"Answered search from knowledge index: query='{query}'", extra={"results": len(results)})
+        return results
+
+    def compact(self) -> int:
+        """
+        Evict the oldest documents beyond the size limit and merge the index.
+
+        Returns:
+            The number of evicted documents.
+        """
+        with self._lock:
+            evicted = self._conn.execute(
+                "SELECT id FROM documents ORDER BY fetched_at DESC LIMIT -1 OFFSET ?",
+                (self.max_documents,),
+            ).fetchall()
+            self._conn.execute("BEGIN")
+            try:
+                for (doc_id,) in evicted:
+                    self._delete_chunks(doc_id)
+                    self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # Merge all FTS5 segments into one and return freed pages to the filesystem
+            self._conn.execute("INSERT INTO chunks (chunks) VALUES ('optimize')")
+            self._conn.execute("PRAGMA incremental_vacuum")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._writes_since_compaction = 0
+            self.last_compaction = time.time()
+
+        logger.info(f"Compacted knowledge index, evicted {len(evicted)} documents")
+        return len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return index size, lookup latency and this worker's search counters."""
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            chunks = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+            searches = self.local_answers + self.remote_searches
+            return {
+                "documents": documents,
+                "chunks": chunks,
+                "size_bytes": page_count * page_size,
+                "documents_added": self.documents_added,
+                "lookups": self.lookups,
+                "lookup_ms_avg": round(self.lookup_ms_total / self.lookups, 2) if self.lookups else 0.0,
+                "lookup_ms_max": round(self.lookup_ms_max, 2),
+                "remote_searches": self.remote_searches,
+                "remote_searches_avoided": self.local_answers,
+                "avoided_ratio": round(self.local_answers / searches, 3) if searches else 0.0,
+                "last_compaction": self.last_compaction,
+            }
@@ -1,9 +1,23 @@
+import atexit
+import contextvars
 import logging
 import logging.config
+import logging.handlers
 import os
+import queue
+import random
 import sys
+from typing import Optional
 from pythonjsonlogger import jsonlogger
-from app.core.config import LOG_LEVEL, ENVIRONMENT
+from app.core import prefork
+from app.core.config import LOG_LEVEL, LOG_SAMPLE_RATE, ENVIRONMENT
+from app.core.tracing import current_span, get_request_id
+
+# Whether the info logs of the request being handled are kept
+_request_sampled: contextvars.ContextVar[bool] = contextvars.ContextVar("request_logs_sampled", default=True)
+
+# Background thread writing queued records to stdout
+_listener: Optional[logging.handlers.QueueListener] = None
 
 class CustomJsonFormatter(jsonlogger.JsonFormatter):
     def add_fields(self, log_record, record, message_dict):
@@ -13,36 +27,114 @@ class CustomJsonFormatter(jsonlogger.JsonFormatter):
         log_record['level'] = record.levelname
         log_record['logger'] = record.name
 
+class RequestContextFilter(logging.Filter):
+    """
+    Attach the current request id and trace id to every log record.
+
+    Info and debug records of requests not selected by sample_request_logs()
+    are dropped here, before they are queued.
+    """
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and not _request_sampled.get():
+            return False
+        if getattr(record, "request_id", None) is None:
+            record.request_id = get_request_id()
+        span = current_span()
+        if span is not None and span.trace_id:
+            record.trace_id = span.trace_id
+        return True
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records for the background writer without formatting them.
+
+    The stdlib QueueHandler formats every record in the calling thread so it
+    can be pickled; records here never leave the process, so only the message
+    arguments are merged (they may be mutated later) and exception info is
+    kept for the real formatter.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def sample_request_logs() -> bool:
+    """Decide whether the info logs of the request being handled are kept (LOG_SAMPLE_RATE)."""
+    sampled = LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE
+    _request_sampled.set(sampled)
+    return sampled
+
+def _stop_listener():
+    """Write out whatever is still queued and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(_stop_listener)
+
+@prefork.after_fork
+def _restart_listener():
+    """Start a writer thread in a forked worker (the master's does not survive the fork)."""
+    global _listener
+    if _listener is None:
+        return
+    # A new queue: records still queued in the master are the master's to write
+    log_queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, LocalQueueHandler):
+            handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
 def setup_logging():
-    """Configure logging based on environment."""
-    
+    """
+    Configure logging based on environment.
+
+    Loggers only put records on an in-memory queue; a background thread
+    formats them and writes them to stdout, so request handling never waits
+    on JSON encoding or a slow stdout pipe.
+    """
+    global _listener
+
     log_level = getattr(logging, LOG_LEVEL)
-    
+
+    # Neither format uses the caller's file or line; skip the stack walk made for
+    # every record (see "Optimization" in the logging HOWTO)
+    logging._srcfile = None
+    logging.logMultiprocessing = False
+    log_handler = logging.StreamHandler(sys.stdout)
+
     if ENVIRONMENT == "production":
         # JSON logging for production
-        log_handler = logging.StreamHandler(sys.stdout)
         formatter = CustomJsonFormatter('%(timestamp)s %(level)s %(name)s %(message)s')
-        log_handler.setFormatter(formatter)
-        
-        # Configure root logger
-        logging.basicConfig(
-            level=log_level,
-            handlers=[log_handler]
-        )
     else:
         # Human-readable logging for development
-        logging.basicConfig(
-            level=log_level,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[logging.StreamHandler(sys.stdout)]
-        )
-    
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    log_handler.setFormatter(formatter)
+
+    _stop_listener()
+    log_queue = queue.SimpleQueue()
+    queue_handler = LocalQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    _listener = logging.handlers.QueueListener(log_queue, log_handler, respect_handler_level=True)
+    _listener.start()
+
+    # Configure root logger
+    logging.basicConfig(
+        level=log_level,
+        handlers=[queue_handler]
+    )
+
     # Reduce noise from third-party libraries
     for logger_name in ['uvicorn.access', 'urllib3.connectionpool']:
         logging.getLogger(logger_name).setLevel(logging.WARNING)
-    
+
     # Create logger for this module
     logger = logging.getLogger(__name__)
-    logger.debug(f"Logging configured with level: {LOG_LEVEL}")
-    
-    return logger 
\ No newline at end of file
+    logger.debug("Logging configured with level: %s", LOG_LEVEL)
+
+    return logger
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.core.metrics import EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG
+
+logger = logging.getLogger(__name__)
+
+# Innermost frames kept from the stack of a blocked loop
+STACK_LIMIT = 30
+
+# Weight of each new measurement in the average lag
+LAG_SMOOTHING = 0.2
+
+
+@dataclass
+class BlockedLoop:
+    """A stall of the event loop caught while it was happening."""
+
+    stalled_seconds: float
+    stack: str
+
+
+class LoopMonitor:
+    """
+    Measure event loop lag and catch code that blocks the loop.
+
+    A task on the loop wakes up every interval and records how late it was
+    in the event_loop_lag_seconds histogram. A watchdog thread checks that
+    the task keeps waking up; when the loop has been stalled for longer than
+    the threshold, it captures the loop thread's stack, which shows the code
+    holding the loop, and logs it.
+
+    Also usable in tests:
+
+        async with LoopMonitor(threshold=0.05) as monitor:
+            ...
+        monitor.assert_not_blocked()
+    """
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1):
+        """
+        Args:
+            interval: Seconds between lag measurements
+            threshold: Seconds the loop may stall before it is reported as blocked
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked: List[BlockedLoop] = []
+        self.max_lag = 0.0
+        # Exponential moving average of the lag, weighted towards the last few measurements
+        self.average_lag = 0.0
+        self._recent_max_lag = 0.0
+        self._heartbeat = time.perf_counter()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start monitoring the running event loop."""
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """Stop monitoring."""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+    async def __aenter__(self) -> "LoopMonitor":
+        self.start()
+        # Let the first measurement start before the monitored code runs
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    async def _tick(self) -> None:
+        while True:
+            due = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(now - due, 0.0)
+            self._heartbeat = now
+            self.max_lag = max(self.max_lag, lag)
+            self.average_lag += LAG_SMOOTHING * (lag - self.average_lag)
+            self._recent_max_lag = max(self._recent_max_lag, lag)
+            EVENT_LOOP_LAG.observe(lag)
+
+    def take_recent_max_lag(self) -> float:
+        """The largest lag measured since the previous call (for the capacity controller)."""
+        lag, self._recent_max_lag = self._recent_max_lag, 0.0
+        return lag
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stop.wait(self.threshold / 4):
+            heartbeat = self._heartbeat
+            stalled = time.perf_counter() - heartbeat - self.interval
+            if stalled < self.threshold or heartbeat == reported:
+                continue
+            # One report per stall, taken while the blocking code is still on the stack
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame is not None else ""
+            self.blocked.append(BlockedLoop(stalled, stack))
+            EVENT_LOOP_BLOCKED.inc()
+            logger.warning(
+                f"Event loop blocked for over {stalled * 1000:.0f}ms, loop thread stack:\n{stack}",
+                extra={"stalled_ms": round(stalled * 1000, 1)}
+            )
+
+    def assert_not_blocked(self) -> None:
+        """Fail with the offending stacks if the loop was blocked while monitored."""
+        if self.blocked:
+            stacks = "\n".join(f"--- stalled {b.stalled_seconds * 1000:.0f}ms\n{b.stack}" for b in self.blocked)
+            raise AssertionError(f"Event loop was blocked {len(self.blocked)} time(s):\n{stacks}")
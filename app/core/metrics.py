@@ -0,0 +1,305 @@
+import os
+import time
+from typing import Any, Iterable, Optional, Set, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+from app.core import codec
+from app.core.config import COMPARE_MODELS, CONTEXT_SUMMARY_MODEL, HEDGE_MODEL, MODEL_NAME, ROUTER_MODELS
+from app.core.research_budget import estimate_tokens
+
+# With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py), every worker writes
+# its samples to memory-mapped files in that directory and a scrape of any
+# worker aggregates all of them. Without it, metrics cover this process only.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, 30, 60)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 250, 500)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time until the full response body was sent, per route and model",
+    ["method", "route", "model", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Bytes of response body sent, per route (the whole stream for streaming responses)",
+    ["method", "route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Requests currently being handled",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+STREAM_TIME_TO_FIRST_TOKEN = Histogram(
+    "stream_time_to_first_token_seconds",
+    "Time from request to the first content chunk of a stream",
+    ["endpoint", "model"],
+    buckets=TTFT_BUCKETS,
+)
+STREAM_TOKENS_PER_SECOND = Histogram(
+    "stream_tokens_per_second",
+    "Output tokens per second after the first token (estimated from content length)",
+    ["endpoint", "model"],
+    buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+STREAMS_IN_PROGRESS = Gauge(
+    "streams_in_progress",
+    "Streaming responses currently open",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total",
+    "Failed calls to upstream services",
+    ["upstream", "model"],
+)
+MODEL_TOKENS = Counter(
+    "model_tokens_total",
+    "Model tokens used, by model, client (X-Client-ID) and kind (prompt or completion)",
+    ["model", "client", "kind"],
+)
+MODEL_COST = Counter(
+    "model_cost_usd_total",
+    "Model cost in US dollars at list prices, by model and client",
+    ["model", "client"],
+)
+RESEARCH_RUNS_IN_PROGRESS = Gauge(
+    "research_runs_in_progress",
+    "Research agent runs currently executing",
+    multiprocess_mode="livesum",
+)
+RESEARCH_RUNS_JOINED = Counter(
+    "research_runs_joined_total",
+    "Research requests that joined an identical in-flight run",
+)
+REPORT_CACHE_LOOKUPS = Counter(
+    "research_report_cache_lookups_total",
+    "Research report store lookups",
+    ["result"],
+)
+KNOWLEDGE_SEARCHES = Counter(
+    "knowledge_searches_total",
+    "Research searches by where they were answered",
+    ["source"],
+)
+RESEARCH_SOURCE_TOKENS = Counter(
+    "research_source_tokens_total",
+    "Source content tokens fetched and passed on to the model after reduction",
+    ["stage"],
+)
+SESSION_CACHE_LOOKUPS = Counter(
+    "session_cache_lookups_total",
+    "Conversation session reads by how the in-memory cache served them (hit, refresh or miss)",
+    ["result"],
+)
+SESSION_CACHE_EVICTIONS = Counter(
+    "session_cache_evictions_total",
+    "Sessions evicted from the in-memory cache to stay within its bounds",
+)
+SESSION_CACHE_BYTES = Gauge(
+    "session_cache_bytes",
+    "Approximate memory held by cached conversation histories",
+    multiprocess_mode="livesum",
+)
+CONTEXT_COMPACTIONS = Counter(
+    "context_compactions_total",
+    "Chat histories compacted to fit the model's token budget, by how their summary was obtained",
+    ["summary"],
+)
+CONTEXT_TOKENS_SAVED = Counter(
+    "context_prompt_tokens_saved_total",
+    "Prompt tokens removed from chat histories by compaction",
+    ["model"],
+)
+CONTEXT_SUMMARY_DURATION = Histogram(
+    "context_summary_duration_seconds",
+    "Time spent summarizing earlier conversation turns, per compacted request that needed a new summary",
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32),
+)
+MODEL_ROUTER_DECISIONS = Counter(
+    "model_router_decisions_total",
+    "Models chosen for model_name=auto requests, by reason (preferred, degraded, circuit_open, no_healthy_model, failed_over)",
+    ["model", "reason"],
+)
+MODEL_CIRCUIT_STATE = Gauge(
+    "model_circuit_state",
+    "Circuit breaker state of a model in the worker that last changed it (0 closed, 1 half-open, 2 open)",
+    ["model"],
+    multiprocess_mode="mostrecent",
+)
+HEDGED_STREAMS = Counter(
+    "hedged_streams_total",
+    "Streaming chats by hedging outcome (not_needed, budget_exhausted, primary_won, hedge_won, failed)",
+    ["outcome"],
+)
+HEDGE_DELAY = Histogram(
+    "hedge_delay_seconds",
+    "Wait for the first token before a streaming chat is hedged",
+    buckets=TTFT_BUCKETS,
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of the event loop monitor's periodic wake-up past its due time",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+EVENT_LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total",
+    "Times the event loop was stalled longer than the blocking threshold",
+)
+OFFLOAD_THREADS_BUSY = Gauge(
+    "offload_threads_busy",
+    "Offload pool threads running blocking calls",
+    multiprocess_mode="livesum",
+)
+OFFLOAD_TASKS_QUEUED = Gauge(
+    "offload_tasks_queued",
+    "Blocking calls waiting for an offload pool thread",
+    multiprocess_mode="livesum",
+)
+OFFLOAD_THREADS_TOTAL = Gauge(
+    "offload_threads",
+    "Offload pool size",
+    multiprocess_mode="livesum",
+)
+
+CAPACITY_CONCURRENCY_LIMIT = Gauge(
+    "capacity_concurrency_limit",
+    "Chat and research requests admitted at once, set by the capacity controller",
+    multiprocess_mode="livesum",
+)
+CAPACITY_REJECTED = Counter(
+    "capacity_rejected_requests_total",
+    "Chat and research requests refused with a 503 because the worker was at its in-flight limit",
+)
+CAPACITY_RECOMMENDED_WORKERS = Gauge(
+    "capacity_recommended_workers",
+    "Worker processes recommended by the capacity controller from CPU use and event loop lag",
+    multiprocess_mode="livemax",
+)
+
+DRAIN_DURATION = Histogram(
+    "drain_duration_seconds",
+    "Time a worker took to drain after SIGTERM, until its requests in flight finished or were cut",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+DRAIN_REQUESTS = Counter(
+    "drain_requests_total",
+    "Requests affected by a worker draining, by outcome (completed, stream_cut, dropped, refused)",
+    ["outcome"],
+)
+
+
+def render() -> Tuple[bytes, str]:
+    """Render all metrics in the Prometheus text format, aggregated across workers when enabled."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def route_of(scope: dict) -> str:
+    """The route template a request matched (e.g. /api/v1/chat), keeping label cardinality bounded."""
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # Recent FastAPI versions keep included routes unprefixed and record the full path separately
+    effective = (scope.get("fastapi") or {}).get("effective_route_context")
+    return getattr(effective, "path", None) or route.path
+
+
+# Models with a label value of their own: the configured ones and those with known prices (see add_known_models)
+_known_models: Set[str] = {
+    m.strip() for m in [MODEL_NAME, CONTEXT_SUMMARY_MODEL, HEDGE_MODEL or "", *ROUTER_MODELS.split(","), *COMPARE_MODELS.split(",")]
+    if m.strip()
+}
+
+
+def add_known_models(models: Iterable[str]) -> None:
+    """Give these models a label value of their own."""
+    _known_models.update(models)
+
+
+def model_label(model: Optional[str]) -> str:
+    """
+    The model label value for a model name, keeping label cardinality bounded.
+
+    Clients choose model names, so any name that is not configured or priced
+    counts as "other". Versions of a known model (gpt-4o-2024-08-06) count as
+    that model; no model gives an empty label.
+    """
+    if not model:
+        return ""
+    if model in _known_models:
+        return model
+    families = [name for name in _known_models if model.startswith(name + "-")]
+    return max(families, key=len) if families else "other"
+
+
+class StreamMeter:
+    """
+    Time-to-first-token and throughput of one streaming response.
+
+    Label children are resolved once per stream so recording a chunk is a
+    couple of arithmetic operations. When given a trace span, the stream's
+    TTFT, token count and time spent serializing events are added to it.
+    """
+
+    def __init__(self, endpoint: str, model: str, started: Optional[float] = None, span: Optional[Any] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.tokens = 0
+        self.serialize_seconds = 0.0
+        self.span = span
+        self._ttft = STREAM_TIME_TO_FIRST_TOKEN.labels(endpoint, model_label(model))
+        self._throughput = STREAM_TOKENS_PER_SECOND.labels(endpoint, model_label(model))
+        self._open = STREAMS_IN_PROGRESS.labels(endpoint)
+        self._open.inc()
+        self._finished = False
+
+    def content(self, text: str) -> None:
+        """Record a content chunk."""
+        if not text:
+            return
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+            self._ttft.observe(self.first_token - self.started)
+        self.tokens += estimate_tokens(text)
+
+    def sse(self, payload: Any) -> bytes:
+        """Serialize payload (a dict or model) as a server-sent event, timing the encoding."""
+        started = time.perf_counter()
+        event = codec.sse(payload)
+        self.serialize_seconds += time.perf_counter() - started
+        return event
+
+    def finish(self) -> None:
+        """Record the end of the stream (idempotent)."""
+        if self._finished:
+            return
+        self._finished = True
+        self._open.dec()
+        if self.first_token is not None:
+            elapsed = time.perf_counter() - self.first_token
+            if elapsed > 0 and self.tokens > 1:
+                self._throughput.observe(self.tokens / elapsed)
+        if self.span is not None:
+            if self.first_token is not None:
+                self.span.set_attribute("stream.ttft_ms", round((self.first_token - self.started) * 1000, 1))
+            self.span.set_attribute("stream.tokens", self.tokens)
+            self.span.set_attribute("stream.serialize_ms", round(self.serialize_seconds * 1000, 2))
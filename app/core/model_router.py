@@ -0,0 +1,320 @@
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.core import token_usage
+from app.core.config import (
+    MODEL_NAME,
+    ROUTER_BREAKER_COOLDOWN_SECONDS,
+    ROUTER_BREAKER_FAILURES,
+    ROUTER_DEGRADED_ERROR_RATE,
+    ROUTER_DEGRADED_LATENCY_FACTOR,
+    ROUTER_LONG_PROMPT_TOKENS,
+    ROUTER_MODELS,
+)
+from app.core.metrics import MODEL_CIRCUIT_STATE, MODEL_ROUTER_DECISIONS
+from app.models.chat import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# The model_name that asks for routing
+AUTO = "auto"
+
+# Smoothing of the live latency and error averages, and of the latency baseline they are compared with
+FAST_ALPHA = 0.2
+BASELINE_ALPHA = 0.02
+# Observations before a model's latency is judged against its baseline
+MIN_SAMPLES = 10
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_REASONING = re.compile(
+    r"\b(why|prove|derive|analy[sz]e|compare|step[- ]by[- ]step|trade-?offs?|architecture|design|debug|optimi[sz]e|explain how)\b",
+    re.IGNORECASE,
+)
+_CODE = re.compile(r"```|\bdef |\bclass |\bfunction\b|\bSELECT\b|=>|#include")
+
+
+def complexity(messages: Sequence[ChatMessage], prompt_tokens: int, long_prompt_tokens: int) -> float:
+    """
+    Score how demanding a conversation is: 0 for short, simple requests, about 1 per sign of a harder one.
+
+    Signs are a long prompt, code, reasoning or comparison requests, several
+    questions at once, and a long latest message.
+    """
+    last = messages[-1].content if messages else ""
+    score = 0.0
+    if prompt_tokens > long_prompt_tokens:
+        score += 1
+    if _CODE.search(last):
+        score += 1
+    if _REASONING.search(last):
+        score += 1
+    if last.count("?") >= 3:
+        score += 0.5
+    if len(last) > 1500:
+        score += 0.5
+    return score
+
+
+class LatencyAverage:
+    """A live latency average and the long-run baseline it is compared with."""
+
+    def __init__(self):
+        self.value: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self.samples = 0
+
+    def update(self, seconds: float) -> None:
+        self.samples += 1
+        if self.value is None:
+            self.value = self.baseline = seconds
+        else:
+            self.value += FAST_ALPHA * (seconds - self.value)
+            self.baseline += BASELINE_ALPHA * (seconds - self.baseline)
+
+    def slow(self, factor: float) -> bool:
+        return self.samples >= MIN_SAMPLES and self.value > factor * self.baseline
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class ModelHealth:
+    """
+    Live latency and error averages and the circuit breaker of one model (per worker).
+
+    Streamed requests report their time to the first token and the others
+    their full response time, which are not comparable, so each has its own
+    average and baseline.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.ttft = LatencyAverage()
+        self.latency = LatencyAverage()
+        self.errors = 0.0
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.probe_at = 0.0
+        self.updated_at = 0.0
+
+    def degraded(self, error_rate: float, latency_factor: float, stale_after: float) -> bool:
+        if time.time() - self.updated_at >= stale_after:
+            # Nothing heard for a while (it was being avoided): give it traffic again to find out
+            return False
+        if self.errors >= error_rate:
+            return True
+        return self.ttft.slow(latency_factor) or self.latency.slow(latency_factor)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ttft_ms": _ms(self.ttft.value),
+            "baseline_ttft_ms": _ms(self.ttft.baseline),
+            "latency_ms": _ms(self.latency.value),
+            "baseline_latency_ms": _ms(self.latency.baseline),
+            "error_rate": round(self.errors, 3),
+            "samples": self.samples,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class RouteDecision:
+    """The model chosen for a request, why, and the models to fall back to in order."""
+
+    def __init__(self, model: str, reason: str, candidates: List[str], complexity: float):
+        self.model = model
+        self.reason = reason
+        self.candidates = candidates
+        self.complexity = complexity
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"model": self.model, "reason": self.reason, "complexity": self.complexity}
+
+
+class ModelRouter:
+    """
+    Chooses a model for model_name="auto" requests.
+
+    models are ordered from the cheapest to the most capable. A request's
+    complexity score picks the preferred one; it is skipped when its circuit
+    is open or it is degraded, with an error average at or above
+    degraded_error_rate or a latency average (time to first token or full
+    response time) more than degraded_latency_factor times its own long-run
+    baseline. The next choices are the models nearest to the preferred one, more capable first.
+    Averages not updated for breaker_cooldown seconds no longer count as
+    degraded, so an avoided model gets traffic again to show it recovered.
+
+    Every upstream model request reports its latency and outcome through
+    observe(), streamed requests their time to the first token and the
+    others their full response time, so statistics cover all traffic of this
+    worker, routed or not. breaker_failures consecutive failures open
+    a model's circuit; after breaker_cooldown seconds one probe request is
+    let through and its outcome closes or reopens the circuit. Statistics are
+    only kept for the routed models and default_model; requests to any other
+    model a client names are not tracked, so they can't grow the statistics
+    (and the circuit state metric) without bound.
+    """
+
+    def __init__(
+        self,
+        models: Sequence[str],
+        default_model: Optional[str] = None,
+        long_prompt_tokens: int = 2000,
+        degraded_error_rate: float = 0.3,
+        degraded_latency_factor: float = 2.0,
+        breaker_failures: int = 5,
+        breaker_cooldown: float = 30.0,
+    ):
+        self.models = list(models)
+        self.tracked = frozenset(self.models) | ({default_model} if default_model else frozenset())
+        self.long_prompt_tokens = long_prompt_tokens
+        self.degraded_error_rate = degraded_error_rate
+        self.degraded_latency_factor = degraded_latency_factor
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self._health: Dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model: str) -> ModelHealth:
+        health = self._health.get(model)
+        if health is None:
+            health = self._health[model] = ModelHealth(model)
+        return health
+
+    def _set_state(self, health: ModelHealth, state: str) -> None:
+        if health.state != state:
+            logger.warning(f"Model {health.model} circuit {state}")
+        health.state = state
+        MODEL_CIRCUIT_STATE.labels(health.model).set(_STATE_VALUES[state])
+
+    def _available(self, health: ModelHealth, now: float) -> bool:
+        """Whether the circuit lets a request through, moving an open circuit past its cooldown to half-open."""
+        if health.state == OPEN and now - health.opened_at >= self.breaker_cooldown:
+            self._set_state(health, HALF_OPEN)
+            health.probing = False
+        if health.state == HALF_OPEN:
+            # One probe at a time; a probe that never reported back is replaced after another cooldown
+            return not health.probing or now - health.probe_at >= self.breaker_cooldown
+        return health.state == CLOSED
+
+    @staticmethod
+    def _start_probe(health: ModelHealth, now: float) -> None:
+        if health.state == HALF_OPEN:
+            health.probing = True
+            health.probe_at = now
+
+    def route(self, messages: Sequence[ChatMessage]) -> RouteDecision:
+        """
+        Choose a model for a conversation.
+
+        Raises:
+            ValueError: If no models are configured for routing.
+        """
+        if not self.models:
+            raise ValueError("Model routing is not configured (set ROUTER_MODELS)")
+        prompt_tokens = token_usage.count_prompt_tokens((m.content for m in messages), self.models[0])
+        score = complexity(messages, prompt_tokens, self.long_prompt_tokens)
+        preferred = min(len(self.models) - 1, int(score))
+        # Nearest to the preferred model first, the more capable one before the cheaper one at equal distance
+        order = sorted(range(len(self.models)), key=lambda i: (abs(i - preferred), i < preferred))
+        candidates = [self.models[i] for i in order]
+
+        now = time.time()
+        chosen, reason = None, "preferred"
+        with self._lock:
+            for i, model in enumerate(candidates):
+                health = self._get(model)
+                if not self._available(health, now):
+                    reason = "circuit_open" if i == 0 else reason
+                    continue
+                if health.degraded(self.degraded_error_rate, self.degraded_latency_factor, self.breaker_cooldown):
+                    reason = "degraded" if i == 0 else reason
+                    continue
+                chosen = model
+                self._start_probe(health, now)
+                break
+            if chosen is None:
+                # Nothing healthy: any model whose circuit lets a request through, else the preferred one
+                reason = "no_healthy_model"
+                chosen = next((m for m in candidates if self._available(self._get(m), now)), candidates[0])
+                self._start_probe(self._get(chosen), now)
+        MODEL_ROUTER_DECISIONS.labels(chosen, reason).inc()
+        candidates.remove(chosen)
+        return RouteDecision(chosen, reason, [chosen] + candidates, score)
+
+    def fail_over(self, decision: RouteDecision) -> Optional[str]:
+        """
+        Move a decision whose model failed on to its next candidate.
+
+        Returns:
+            The model to try next, or None if there is none.
+        """
+        if len(decision.candidates) < 2:
+            return None
+        decision.candidates.pop(0)
+        decision.model, decision.reason = decision.candidates[0], "failed_over"
+        MODEL_ROUTER_DECISIONS.labels(decision.model, decision.reason).inc()
+        return decision.model
+
+    def observe(self, model: str, seconds: float, ok: bool, stream: bool = False) -> None:
+        """
+        Record the latency and outcome of one upstream request to a model (ignored for untracked models).
+
+        Args:
+            model: The model requested
+            seconds: Time to the first token if stream, else to the complete response
+            ok: Whether the request succeeded
+            stream: Whether the response was streamed
+        """
+        if model not in self.tracked:
+            return
+        with self._lock:
+            health = self._get(model)
+            health.samples += 1
+            health.updated_at = time.time()
+            health.errors += FAST_ALPHA * ((0.0 if ok else 1.0) - health.errors)
+            if ok:
+                (health.ttft if stream else health.latency).update(seconds)
+                health.consecutive_failures = 0
+                if health.state != CLOSED:
+                    self._set_state(health, CLOSED)
+                health.probing = False
+                return
+            health.consecutive_failures += 1
+            if health.state == HALF_OPEN or health.consecutive_failures >= self.breaker_failures:
+                health.opened_at = time.time()
+                health.probing = False
+                self._set_state(health, OPEN)
+
+    def circuit_states(self) -> Dict[str, str]:
+        """The circuit state of every tracked model this worker has used."""
+        with self._lock:
+            return {model: health.state for model, health in self._health.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        """Routed models and the live statistics of every tracked model this worker has used."""
+        with self._lock:
+            return {
+                "models": self.models,
+                "health": {model: health.as_dict() for model, health in self._health.items()},
+            }
+
+
+router = ModelRouter(
+    [m.strip() for m in ROUTER_MODELS.split(",") if m.strip()],
+    default_model=MODEL_NAME,
+    long_prompt_tokens=ROUTER_LONG_PROMPT_TOKENS,
+    degraded_error_rate=ROUTER_DEGRADED_ERROR_RATE,
+    degraded_latency_factor=ROUTER_DEGRADED_LATENCY_FACTOR,
+    breaker_failures=ROUTER_BREAKER_FAILURES,
+    breaker_cooldown=ROUTER_BREAKER_COOLDOWN_SECONDS,
+)
@@ -0,0 +1,186 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Any, AsyncIterator, Callable, Iterator, TypeVar
+
+from app.core.config import OFFLOAD_THREADS
+from app.core import prefork, profiling, tracing
+from app.core.metrics import OFFLOAD_TASKS_QUEUED, OFFLOAD_THREADS_BUSY, OFFLOAD_THREADS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Blocking Agno calls run here so they don't stall the event loop
+executor = ThreadPoolExecutor(max_workers=OFFLOAD_THREADS, thread_name_prefix="offload")
+OFFLOAD_THREADS_TOTAL.set(OFFLOAD_THREADS)
+
+
+@dataclass
+class PoolUsage:
+    """Running totals of this process's offload pool use (see usage())."""
+
+    threads: int
+    submitted: int = 0
+    started: int = 0
+    completed: int = 0
+    # Time completed calls held a thread, and time started calls waited for one
+    held_seconds: float = 0.0
+    queued_seconds: float = 0.0
+
+    @property
+    def busy(self) -> int:
+        return self.started - self.completed
+
+    @property
+    def queued(self) -> int:
+        return self.submitted - self.started
+
+
+_usage = PoolUsage(OFFLOAD_THREADS)
+_usage_lock = threading.Lock()
+
+
+def usage() -> PoolUsage:
+    """A consistent copy of the pool's running totals."""
+    with _usage_lock:
+        return replace(_usage)
+
+
+def resize(threads: int) -> None:
+    """
+    Change the pool size.
+
+    Later calls go to a new pool of the given size; calls already submitted
+    finish in the old one, whose threads exit once it is drained.
+    """
+    global executor
+    with _usage_lock:
+        if threads == _usage.threads:
+            return
+        previous, executor = executor, ThreadPoolExecutor(max_workers=threads, thread_name_prefix="offload")
+        _usage.threads = threads
+    previous.shutdown(wait=False)
+    OFFLOAD_THREADS_TOTAL.set(threads)
+
+
+@prefork.after_fork
+def _new_executor() -> None:
+    """Give a forked worker its own pool (threads started in the master are gone) and its own gauge sample."""
+    global executor, _usage
+    executor = ThreadPoolExecutor(max_workers=OFFLOAD_THREADS, thread_name_prefix="offload")
+    _usage = PoolUsage(OFFLOAD_THREADS)
+    OFFLOAD_THREADS_TOTAL.set(OFFLOAD_THREADS)
+
+
+_DONE = object()
+
+
+def _submit(loop: asyncio.AbstractEventLoop, func: Callable[[], T]) -> "asyncio.Future[T]":
+    """
+    Submit func to the offload pool with the caller's context.
+
+    Queue and busy gauges are kept up to date, the time spent waiting for a
+    thread is noted on the caller's active span, and calls made for a request
+    being profiled are added to its profile.
+    """
+    ctx = contextvars.copy_context()
+    submitted = time.perf_counter()
+
+    def call() -> T:
+        span = tracing.current_span()
+        if span is not None:
+            span.add_event("offload.started", {"queued_ms": round((time.perf_counter() - submitted) * 1000, 2)})
+        profile = profiling.current_profile()
+        if profile is not None:
+            return profile.run(func)
+        return func()
+
+    def tracked() -> T:
+        started = time.perf_counter()
+        OFFLOAD_TASKS_QUEUED.dec()
+        OFFLOAD_THREADS_BUSY.inc()
+        with _usage_lock:
+            _usage.started += 1
+            _usage.queued_seconds += started - submitted
+        try:
+            return ctx.run(call)
+        finally:
+            OFFLOAD_THREADS_BUSY.dec()
+            with _usage_lock:
+                _usage.completed += 1
+                _usage.held_seconds += time.perf_counter() - started
+
+    OFFLOAD_TASKS_QUEUED.inc()
+    with _usage_lock:
+        _usage.submitted += 1
+    return loop.run_in_executor(executor, tracked)
+
+
+async def run_in_thread(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking callable in the offload pool, preserving context variables."""
+    return await _submit(asyncio.get_running_loop(), functools.partial(func, *args, **kwargs))
+
+
+async def iterate_in_thread(factory: Callable[[], Iterator[T]]) -> AsyncIterator[T]:
+    """
+    Consume a blocking iterator in the offload pool and yield its items asynchronously.
+
+    The iterator is created by calling factory inside the worker thread. If the
+    consumer stops early (break, cancellation or a timeout), the worker stops
+    pulling items at the next opportunity and closes the iterator.
+
+    Args:
+        factory: Callable returning the blocking iterator to consume
+
+    Yields:
+        The iterator's items in order.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def put(item: Any) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # The loop has shut down; nobody is listening any more
+            stop.set()
+
+    def produce() -> None:
+        iterator = None
+        try:
+            iterator = factory()
+            for item in iterator:
+                if stop.is_set():
+                    break
+                put((item, None))
+        except BaseException as e:
+            put((_DONE, e))
+        else:
+            put((_DONE, None))
+        finally:
+            close = getattr(iterator, "close", None)
+            if stop.is_set() and close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    logger.debug(f"Error closing abandoned iterator: {str(e)}")
+
+    _submit(loop, produce)
+
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,179 @@
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from agno.models.message import Message
+from agno.models.openai import OpenAIChat
+
+from app.core import token_usage, tracing
+from app.core.model_router import router
+
+
+def _delta_text(chunk: Any) -> str:
+    """Generated text (content and tool call arguments) in a streamed chunk."""
+    parts = []
+    for choice in getattr(chunk, "choices", None) or []:
+        delta = choice.delta
+        if delta.content:
+            parts.append(delta.content)
+        for call in delta.tool_calls or []:
+            if call.function is not None and call.function.arguments:
+                parts.append(call.function.arguments)
+    return "".join(parts)
+
+
+def _message_text(response: Any) -> str:
+    """Generated text (content and tool call arguments) of a complete response."""
+    parts = []
+    for choice in getattr(response, "choices", None) or []:
+        message = choice.message
+        if message.content:
+            parts.append(message.content)
+        for call in message.tool_calls or []:
+            parts.append(call.function.arguments or "")
+    return "".join(parts)
+
+
+class _StreamUsage:
+    """Completion tokens of a stream, counted as chunks arrive until upstream usage replaces them."""
+
+    def __init__(self, model: OpenAIChat, messages: List[Message]):
+        self.model = model
+        self.messages = messages
+        self.completion_tokens = 0
+        self.chunks = 0
+        self.upstream: Optional[Any] = None
+
+    def chunk(self, chunk: Any) -> None:
+        self.chunks += 1
+        if getattr(chunk, "usage", None) is not None:
+            self.upstream = chunk.usage
+        text = _delta_text(chunk)
+        if text:
+            self.completion_tokens += token_usage.count_tokens(text, self.model.id)
+
+    def record(self, span: tracing.Span) -> None:
+        """Record the stream's usage, estimated when it ended without upstream usage (errors, disconnects)."""
+        if self.upstream is not None:
+            prompt_tokens, completion_tokens = self.upstream.prompt_tokens, self.upstream.completion_tokens
+        elif self.chunks:
+            prompt_tokens, completion_tokens = self.model._prompt_tokens(self.messages), self.completion_tokens
+        else:
+            # Failed before anything was generated
+            return
+        token_usage.record(self.model.id, prompt_tokens, completion_tokens, estimated=self.upstream is None)
+        span.set_attribute("prompt_tokens", prompt_tokens)
+        span.set_attribute("completion_tokens", completion_tokens)
+
+
+class TracedOpenAIChat(OpenAIChat):
+    """
+    OpenAIChat that records a span and token usage for every request to the OpenAI API.
+
+    An agent run makes one model request per turn (a tool-calling run makes
+    several), so each shows up as its own child span of the active span.
+    Streaming requests also record the time to the first chunk. Usage comes
+    from the API response, or is counted locally when the response has none.
+    Outcome and latency also feed the model router's live statistics: the
+    time to the first chunk for streaming requests, the full response time
+    for the others.
+    """
+
+    def _start_span(self, messages: List[Message], stream: bool) -> tracing.Span:
+        return tracing.start_span("openai.chat", attributes={
+            "model": self.id,
+            "messages": len(messages),
+            "stream": stream,
+        })
+
+    def _prompt_tokens(self, messages: List[Message]) -> int:
+        return token_usage.count_prompt_tokens((m.content for m in messages), self.id)
+
+    def _record_usage(self, messages: List[Message], response: Any, span: tracing.Span) -> None:
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            prompt_tokens = self._prompt_tokens(messages)
+            completion_tokens = token_usage.count_tokens(_message_text(response), self.id)
+        token_usage.record(self.id, prompt_tokens, completion_tokens, estimated=usage is None)
+        span.set_attribute("prompt_tokens", prompt_tokens)
+        span.set_attribute("completion_tokens", completion_tokens)
+
+    def invoke(self, messages: List[Message]) -> Any:
+        span = self._start_span(messages, stream=False)
+        started = time.perf_counter()
+        try:
+            response = super().invoke(messages)
+            self._record_usage(messages, response, span)
+            router.observe(self.id, time.perf_counter() - started, ok=True)
+            return response
+        except Exception as e:
+            span.record_error(e)
+            router.observe(self.id, time.perf_counter() - started, ok=False)
+            raise
+        finally:
+            span.end()
+
+    async def ainvoke(self, messages: List[Message]) -> Any:
+        span = self._start_span(messages, stream=False)
+        started = time.perf_counter()
+        try:
+            response = await super().ainvoke(messages)
+            self._record_usage(messages, response, span)
+            router.observe(self.id, time.perf_counter() - started, ok=True)
+            return response
+        except Exception as e:
+            span.record_error(e)
+            router.observe(self.id, time.perf_counter() - started, ok=False)
+            raise
+        finally:
+            span.end()
+
+    def invoke_stream(self, messages: List[Message]) -> Iterator[Any]:
+        span = self._start_span(messages, stream=True)
+        usage = _StreamUsage(self, messages)
+        started = time.perf_counter()
+        ttft, failed = None, False
+        try:
+            for chunk in super().invoke_stream(messages):
+                if usage.chunks == 0:
+                    ttft = time.perf_counter() - started
+                    span.set_attribute("ttft_ms", round(ttft * 1000, 1))
+                usage.chunk(chunk)
+                yield chunk
+        except Exception as e:
+            failed = True
+            span.record_error(e)
+            raise
+        finally:
+            usage.record(span)
+            # A consumer that stops early (client disconnect) is not an upstream failure
+            router.observe(
+                self.id, ttft if ttft is not None else time.perf_counter() - started, ok=not failed, stream=True
+            )
+            span.set_attribute("chunks", usage.chunks)
+            span.end()
+
+    async def ainvoke_stream(self, messages: List[Message]) -> AsyncIterator[Any]:
+        span = self._start_span(messages, stream=True)
+        usage = _StreamUsage(self, messages)
+        started = time.perf_counter()
+        ttft, failed = None, False
+        try:
+            async for chunk in super().ainvoke_stream(messages):
+                if usage.chunks == 0:
+                    ttft = time.perf_counter() - started
+                    span.set_attribute("ttft_ms", round(ttft * 1000, 1))
+                usage.chunk(chunk)
+                yield chunk
+        except Exception as e:
+            failed = True
+            span.record_error(e)
+            raise
+        finally:
+            usage.record(span)
+            router.observe(
+                self.id, ttft if ttft is not None else time.perf_counter() - started, ok=not failed, stream=True
+            )
+            span.set_attribute("chunks", usage.chunks)
+            span.end()
@@ -1,10 +1,38 @@
+import asyncio
 import logging
 import time
 from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Union
-from app.core.config import OPENAI_API_KEY, MODEL_NAME
-from app.models.chat import ChatMessage, ChatResponse, StreamingChunk
+from app.core.config import (
+    CONTEXT_COMPACT_STEP,
+    CONTEXT_COMPACTION_ENABLED,
+    CONTEXT_KEEP_RECENT,
+    CONTEXT_SUMMARY_INPUT_TOKENS,
+    CONTEXT_SUMMARY_MAX_TOKENS,
+    CONTEXT_SUMMARY_MODEL,
+    CONTEXT_SUMMARY_STORE_PATH,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_TOKEN_BUDGETS,
+    HEDGE_BUDGET_PERCENT,
+    HEDGE_DEFAULT_DELAY_MS,
+    HEDGE_ENABLED,
+    HEDGE_MIN_DELAY_MS,
+    HEDGE_MODEL,
+    HEDGE_PERCENTILE,
+    MODEL_NAME,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    SESSION_TTL_SECONDS,
+)
+from app.core import prefork, token_usage, tracing
+from app.core.context_compaction import ContextCompactor, SummaryStore
+from app.core.hedging import HedgePolicy
+from app.core.metrics import UPSTREAM_ERRORS, model_label
+from app.core.model_router import AUTO, RouteDecision, router as model_router
+from app.core.offload import iterate_in_thread, run_in_thread
+from app.core.openai_model import TracedOpenAIChat
+from app.models.chat import ChatMessage, ChatResponse, CompareChunk, CompareResult, StreamingChunk
 from agno.agent import Agent, RunResponse
-from agno.models.openai import OpenAIChat
+from agno.models.message import Message
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +40,12 @@ logger = logging.getLogger(__name__)
 if not OPENAI_API_KEY:
     raise ValueError("OpenAI API key not found in environment variables")
 
+SUMMARY_INSTRUCTIONS = (
+    "You maintain the memory of a conversation between a user and an assistant. "
+    "Merge the new messages into the summary so far. Keep facts, names, numbers, decisions, "
+    "the user's preferences and open questions; drop pleasantries. Write plain, concise notes."
+)
+
 class AgnoService:
     """Service for interacting with the Agno agent."""
     
@@ -38,9 +72,10 @@ class AgnoService:
             
             # Create a new Agno agent
             cls._agents[model_to_use] = Agent(
-                model=OpenAIChat(
+                model=TracedOpenAIChat(
                     id=model_to_use,
-                    api_key=OPENAI_API_KEY
+                    api_key=OPENAI_API_KEY,
+                    base_url=OPENAI_BASE_URL
                 ),
                 description="You are a helpful assistant that provides clear and concise answers.",
                 markdown=True
@@ -49,15 +84,45 @@ class AgnoService:
         return cls._agents[model_to_use]
 
     @classmethod
-    def chat_completion(cls, messages: List[ChatMessage], max_tokens: int = 1000, model_name: Optional[str] = None, stream: bool = False) -> Union[ChatResponse, AsyncIterator[StreamingChunk]]:
+    def _agent_for_run(cls, model_to_use: str, history: Optional[List[ChatMessage]] = None) -> Agent:
+        """
+        Build an agent for a single run.
+
+        Runs execute in parallel on offload threads and Agno keeps per-run state
+        on the agent, so each run gets its own agent sharing the cached agent's
+        OpenAI client and connection pool.
+
+        Args:
+            model_to_use: The model to run
+            history: Earlier messages of the conversation, sent between the system prompt and the new message
+        """
+        template = cls.get_agent(model_to_use)
+        return Agent(
+            model=TracedOpenAIChat(
+                id=model_to_use,
+                api_key=OPENAI_API_KEY,
+                base_url=OPENAI_BASE_URL,
+                client=template.model.get_client()
+            ),
+            description=template.description,
+            markdown=template.markdown,
+            add_messages=[Message(role=m.role, content=m.content) for m in history] if history else None
+        )
+
+    @classmethod
+    def chat_completion(cls, messages: List[ChatMessage], max_tokens: int = 1000, model_name: Optional[str] = None, stream: bool = False, route: Optional[RouteDecision] = None) -> Union[ChatResponse, AsyncIterator[StreamingChunk]]:
         """
         Generate a chat completion using Agno agent.
         
+        The non-streaming call blocks until the agent is done and must run off the
+        event loop (see run_in_thread); streaming runs the agent in the offload pool itself.
+        
         Args:
             messages: List of chat messages
             max_tokens: Maximum number of tokens to generate
-            model_name: The name of the model to use. If None, the default from config is used.
+            model_name: The name of the model to use. If None, the default from config is used; "auto" routes the request.
             stream: Whether to stream the response or not
+            route: A routing decision already made for this request (model_name is then its model)
             
         Returns:
             ChatResponse object with the agent's response or an async iterator of StreamingChunk objects.
@@ -67,14 +132,6 @@ class AgnoService:
         # Use the provided model or default
         model_to_use = model_name or MODEL_NAME
         
-        # Log which model is being used
-        logger.info(f"Using model: {model_to_use} with streaming={stream}")
-        
-        # Get the agent for this model
-        agent = cls.get_agent(model_to_use)
-        
-        # Extract the last user message for Agno
-        # Agno processes only the current message, not the full conversation
         if not messages:
             raise ValueError("No messages provided in request")
         
@@ -83,24 +140,183 @@ class AgnoService:
         if not last_message or last_message.strip() == "":
             raise ValueError("Empty message content")
         
+        if route is None and model_to_use == AUTO:
+            route = model_router.route(messages)
+        if route is not None:
+            model_to_use = route.model
+        
+        # Log which model is being used
+        logger.info("Using model: %s with streaming=%s", model_to_use, stream)
+        
         # Handle streaming differently from non-streaming
         if stream:
-            return cls._handle_streaming_response(agent, last_message, model_to_use)
+            return cls._handle_streaming_response(messages, model_to_use, route)
         else:
-            return cls._handle_normal_response(agent, last_message, model_to_use, start_time)
+            return cls._handle_normal_response(messages, model_to_use, start_time, route)
+
+    @classmethod
+    def compare(cls, messages: List[ChatMessage], models: List[str], max_tokens: int = 1000) -> AsyncIterator[CompareChunk]:
+        """
+        Stream one conversation from several models at once.
+        
+        Every model streams in its own task, so a slow model never holds up the
+        others: content is yielded as it arrives, tagged with its model. When a
+        model's reply is complete (or has failed) a finished chunk with its
+        result follows, and the last chunk has the results of all models in the
+        order given. Streams still running are cancelled if iteration stops early.
+        
+        Args:
+            messages: List of chat messages, sent to every model
+            models: The models to compare
+            max_tokens: Maximum number of tokens to generate per model
+            
+        Raises:
+            ValueError: If there are no models or no message to send (before anything is streamed).
+        """
+        if not models:
+            raise ValueError("No models to compare")
+        if AUTO in models:
+            raise ValueError(f"Models to compare must be named, not {AUTO}")
+        streams = {
+            model: cls.chat_completion(messages=messages, max_tokens=max_tokens, model_name=model, stream=True)
+            for model in models
+        }
+        return cls._merge_streams(streams)
+
+    @classmethod
+    async def _merge_streams(cls, streams: Dict[str, AsyncIterator[StreamingChunk]]) -> AsyncIterator[CompareChunk]:
+        """Interleave the streams of several models as their chunks arrive (see compare)."""
+        queue: asyncio.Queue = asyncio.Queue()
+        started = time.perf_counter()
+        
+        def elapsed_ms(since):
+            return round((since - started) * 1000, 1)
+        
+        async def run(model, stream):
+            first_token, final, error = None, None, None
+            try:
+                async for chunk in stream:
+                    if chunk.done:
+                        # Carries the usage, or the error message of a failed run (which raises next)
+                        final = chunk
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    queue.put_nowait(CompareChunk(model=model, content=chunk.content))
+            except Exception as e:
+                # Already logged by the model's stream; the other models carry on
+                error = str(e)
+            result = CompareResult(
+                model=model,
+                usage=final.usage if final is not None else None,
+                latency_ms=elapsed_ms(time.perf_counter()),
+                ttft_ms=elapsed_ms(first_token) if first_token is not None else None,
+                error=error
+            )
+            queue.put_nowait(CompareChunk(model=model, finished=True, result=result))
+        
+        tasks = [asyncio.ensure_future(run(model, stream)) for model, stream in streams.items()]
+        results = {}
+        try:
+            while len(results) < len(tasks):
+                chunk = await queue.get()
+                if chunk.finished:
+                    results[chunk.model] = chunk.result
+                yield chunk
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        yield CompareChunk(done=True, results=[results[model] for model in streams])
+
+    @classmethod
+    def _prepare_run(cls, messages: List[ChatMessage], model_to_use: str):
+        """
+        Fit the conversation into the model's token budget and build the agent for it.
+
+        Blocks while earlier turns are summarized. A failed summary does not fail
+        the request: the conversation is then sent as it is.
+
+        Returns:
+            The agent, with the earlier messages as context, and the compaction report (or None).
+        """
+        context = None
+        if context_compactor is not None:
+            try:
+                messages, context = context_compactor.compact(messages, model_to_use)
+            except Exception as e:
+                logger.warning(f"Context compaction failed, sending the full conversation: {str(e)}")
+        return cls._agent_for_run(model_to_use, history=messages[:-1]), context
 
     @classmethod
-    def _handle_normal_response(cls, agent, last_message, model_to_use, start_time):
+    def _summarize(cls, previous: Optional[str], messages: List[ChatMessage]) -> str:
+        """Merge messages into the previous summary of a conversation with the summary model."""
+        model = TracedOpenAIChat(
+            id=CONTEXT_SUMMARY_MODEL,
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL,
+            max_tokens=CONTEXT_SUMMARY_MAX_TOKENS,
+            client=cls.get_agent(CONTEXT_SUMMARY_MODEL).model.get_client()
+        )
+        transcript = "\n\n".join(f"{m.role}: {m.content}" for m in messages)
+        prompt = f"Summary so far:\n{previous}\n\nNew messages:\n{transcript}" if previous else f"Messages:\n{transcript}"
+        with tracing.span("context.summarize", model=CONTEXT_SUMMARY_MODEL, messages=len(messages)):
+            response = model.invoke([
+                Message(role="system", content=SUMMARY_INSTRUCTIONS),
+                Message(role="user", content=prompt)
+            ])
+        return response.choices[0].message.content or ""
+
+    @classmethod
+    def _handle_normal_response(cls, messages, model_to_use, start_time, route=None):
         """Handle non-streaming response with retries."""
+        with tracing.span("agno.chat_completion", model=model_to_use, stream=False) as span:
+            with token_usage.track() as usage:
+                if route is None:
+                    agent, context = cls._prepare_run(messages, model_to_use)
+                    result = cls._run_with_retries(agent, messages[-1].content, model_to_use, start_time)
+                else:
+                    result, context = cls._run_routed(messages, route, start_time)
+                    span.set_attribute("model", route.model)
+                    result.routing = route.as_dict()
+            # Includes the tokens of failed attempts and of summaries, which are billed too
+            result.usage = usage.as_dict()
+            if context is not None:
+                result.usage["context"] = context
+            return result
+
+    @classmethod
+    def _run_routed(cls, messages, route, start_time):
+        """
+        Run on the routed model, failing over to the next candidate instead of retrying with backoff.
+
+        Returns:
+            The response and the compaction report of the run that succeeded.
+        """
+        while True:
+            agent, context = cls._prepare_run(messages, route.model)
+            # The last candidate keeps the usual retries
+            max_retries = 1 if len(route.candidates) > 1 else 3
+            try:
+                return cls._run_with_retries(agent, messages[-1].content, route.model, start_time, max_retries=max_retries), context
+            except Exception as e:
+                failed = route.model
+                if model_router.fail_over(route) is None:
+                    raise
+                logger.warning(f"Model {failed} failed, failing over to {route.model}: {str(e)}")
+
+    @classmethod
+    def _run_with_retries(cls, agent, last_message, model_to_use, start_time, max_retries=3):
+        """Run the agent, retrying failed attempts with exponential backoff."""
         # Implement retry logic for API calls
-        max_retries = 3
         retry_count = 0
         last_error = None
         
         while retry_count < max_retries:
             try:
                 # Get response from the agent
-                logger.debug(f"Sending request to Agno agent with model {model_to_use} (attempt {retry_count + 1}/{max_retries})")
+                logger.debug("Sending request to Agno agent with model %s (attempt %d/%d)", model_to_use, retry_count + 1, max_retries)
                 response = agent.run(last_message)
                 
                 # Handle generator objects by consuming the generator
@@ -132,18 +348,18 @@ class AgnoService:
                         role="assistant", 
                         content=content
                     ),
-                    usage=None,  # Agno doesn't provide usage statistics
                     model=model_to_use  # Include the model used in the response
                 )
                 
                 elapsed_time = time.time() - start_time
-                logger.info(f"Processed request with model {model_to_use} in {elapsed_time:.2f} seconds")
+                logger.info("Processed request with model %s in %.2f seconds", model_to_use, elapsed_time)
                 
                 return result
                 
             except Exception as e:
                 retry_count += 1
                 last_error = e
+                UPSTREAM_ERRORS.labels("openai", model_label(model_to_use)).inc()
                 
                 if retry_count < max_retries:
                     backoff_time = 2 ** retry_count  # Exponential backoff
@@ -157,47 +373,129 @@ class AgnoService:
         raise last_error
 
     @classmethod
-    async def _handle_streaming_response(cls, agent, last_message, model_to_use) -> AsyncIterator[StreamingChunk]:
+    async def _agent_contents(cls, agent, last_message) -> AsyncIterator[str]:
+        """Stream the content of an agent run, skipping chunks without content."""
+        # Use Agno's native streaming functionality, which returns an iterator of RunResponse objects
+        # The agent runs in the offload pool so waiting for chunks never blocks the event loop
+        async for chunk in iterate_in_thread(lambda: agent.run(last_message, stream=True)):
+            if chunk and getattr(chunk, 'content', None):
+                yield chunk.content
+
+    @classmethod
+    def _stream_contents(cls, agent, messages, model_to_use, route) -> AsyncIterator:
+        """
+        Stream (model, content) pairs of a run.
+        
+        With hedging enabled, a second run is started if the first token is late
+        (see HedgePolicy): on the next candidate of a routed request, HEDGE_MODEL,
+        or the same model.
+        """
+        last_message = messages[-1].content
+        if hedge_policy is None:
+            return ((model_to_use, content) async for content in cls._agent_contents(agent, last_message))
+        
+        if route is not None and len(route.candidates) > 1:
+            hedge_model = route.candidates[1]
+        else:
+            hedge_model = HEDGE_MODEL or model_to_use
+        
+        async def hedge():
+            hedge_agent, _ = await run_in_thread(cls._prepare_run, messages, hedge_model)
+            async for content in cls._agent_contents(hedge_agent, last_message):
+                yield content
+        
+        return hedge_policy.stream(model_to_use, lambda: cls._agent_contents(agent, last_message), hedge_model, hedge)
+
+    @classmethod
+    async def _handle_streaming_response(cls, messages, model_to_use, route=None) -> AsyncIterator[StreamingChunk]:
         """Handle streaming response by yielding chunks."""
-        logger.debug(f"Starting streaming response with model {model_to_use}")
+        logger.debug("Starting streaming response with model %s", model_to_use)
         
-        try:
-            # Use Agno's native streaming functionality
-            # This returns an iterator of RunResponse objects
-            run_response_iterator = agent.run(last_message, stream=True)
+        # The span stays active across yields: model calls made while iterating become its children
+        span = tracing.start_span("agno.chat_completion", attributes={"model": model_to_use, "stream": True})
+        with tracing.use_span(span), token_usage.track() as usage:
+            try:
+                while True:
+                    agent, context = await run_in_thread(cls._prepare_run, messages, model_to_use)
+                    sent = False
+                    try:
+                        # Process each chunk as it comes
+                        async for model_used, content in cls._stream_contents(agent, messages, model_to_use, route):
+                            # Log the chunk content (formatted only when debug logging is on)
+                            logger.debug("Streaming chunk: %.30s", content)
+                            
+                            if model_used != model_to_use:
+                                # A hedge request on another model answered first
+                                model_to_use = model_used
+                                span.set_attribute("model", model_to_use)
+                            
+                            # Yield a streaming chunk with the content
+                            sent = True
+                            yield StreamingChunk(
+                                content=content,
+                                done=False,
+                                model=model_to_use
+                            )
+                        break
+                    except Exception as e:
+                        # A routed request fails over to the next model while nothing has been sent yet
+                        if route is None or sent or model_router.fail_over(route) is None:
+                            raise
+                        UPSTREAM_ERRORS.labels("openai", model_label(model_to_use)).inc()
+                        logger.warning(f"Model {model_to_use} failed, failing over to {route.model}: {str(e)}")
+                        model_to_use = route.model
+                        span.set_attribute("model", model_to_use)
             
-            # Process each chunk as it comes
-            for chunk in run_response_iterator:
-                # Skip empty chunks
-                if not chunk or not hasattr(chunk, 'content') or not chunk.content:
-                    continue
-                
-                # Log the chunk content
-                logger.debug(f"Streaming chunk: {chunk.content[:30]}..." if len(chunk.content) > 30 else f"Streaming chunk: {chunk.content}")
-                
-                # Yield a streaming chunk with the content
+                # Send a final chunk to indicate we're done
+                final_usage = usage.as_dict()
+                if context is not None:
+                    final_usage["context"] = context
                 yield StreamingChunk(
-                    content=chunk.content,
-                    done=False,
-                    model=model_to_use
+                    content="",
+                    done=True,
+                    model=model_to_use,
+                    usage=final_usage,
+                    routing=route.as_dict() if route is not None else None
                 )
             
-            # Send a final chunk to indicate we're done
-            yield StreamingChunk(
-                content="",
-                done=True,
-                model=model_to_use
-            )
-            
-            logger.info(f"Completed streaming response with model {model_to_use}")
+                logger.info("Completed streaming response with model %s", model_to_use)
             
-        except Exception as e:
-            logger.error(f"Error streaming response from model {model_to_use}: {str(e)}", exc_info=True)
-            # Yield an error message as a final chunk
-            yield StreamingChunk(
-                content=f"\n\nError: {str(e)}",
-                done=True,
-                model=model_to_use
-            )
-            # Re-raise the exception to be handled by the caller
-            raise 
\ No newline at end of file
+            except Exception as e:
+                UPSTREAM_ERRORS.labels("openai", model_label(model_to_use)).inc()
+                span.record_error(e)
+                logger.error(f"Error streaming response from model {model_to_use}: {str(e)}", exc_info=True)
+                # Yield an error message as a final chunk
+                yield StreamingChunk(
+                    content=f"\n\nError: {str(e)}",
+                    done=True,
+                    model=model_to_use,
+                    usage=usage.as_dict()
+                )
+                # Re-raise the exception to be handled by the caller
+                raise
+            finally:
+                span.end()
+
+
+# Histories over the model's token budget are compacted before each run (None when disabled)
+context_compactor = ContextCompactor(
+    AgnoService._summarize,
+    SummaryStore(CONTEXT_SUMMARY_STORE_PATH, ttl=SESSION_TTL_SECONDS),
+    budget=CONTEXT_TOKEN_BUDGET,
+    budgets=CONTEXT_TOKEN_BUDGETS,
+    keep_recent=CONTEXT_KEEP_RECENT,
+    step=CONTEXT_COMPACT_STEP,
+    summary_tokens=CONTEXT_SUMMARY_MAX_TOKENS,
+    input_tokens=CONTEXT_SUMMARY_INPUT_TOKENS
+) if CONTEXT_COMPACTION_ENABLED else None
+
+# Cached agents hold OpenAI clients and their connection pools, which a forked worker must not share
+prefork.after_fork(AgnoService._agents.clear)
+
+# Late first tokens of streaming chats are hedged with a second request (None when disabled)
+hedge_policy = HedgePolicy(
+    percentile=HEDGE_PERCENTILE,
+    min_delay=HEDGE_MIN_DELAY_MS / 1000,
+    default_delay=HEDGE_DEFAULT_DELAY_MS / 1000,
+    budget_percent=HEDGE_BUDGET_PERCENT
+) if HEDGE_ENABLED else None
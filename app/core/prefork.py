@@ -0,0 +1,106 @@
+import gc
+import logging
+import os
+import sqlite3
+from typing import Callable, List, Tuple
+
+from app.core.config import SQLITE_MMAP_BYTES
+
+logger = logging.getLogger(__name__)
+
+_warm_ups: List[Callable[[], None]] = []
+_before_fork: List[Callable[[], None]] = []
+_after_fork: List[Callable[[], None]] = []
+_warmed = False
+
+
+def warm_up(callback: Callable[[], None]) -> Callable[[], None]:
+    """
+    Register work to do once in the gunicorn master before workers are forked.
+
+    With the app preloaded (see gunicorn.conf.py), whatever is loaded here is
+    shared copy-on-write by every worker instead of being loaded by each.
+    Without preloading it is loaded lazily, as before.
+    """
+    _warm_ups.append(callback)
+    return callback
+
+
+def before_fork(callback: Callable[[], None]) -> Callable[[], None]:
+    """Register a callback that releases what a forked worker must not inherit (e.g. SQLite connections)."""
+    _before_fork.append(callback)
+    return callback
+
+
+def after_fork(callback: Callable[[], None]) -> Callable[[], None]:
+    """
+    Register a callback that recreates per-process state in a forked worker.
+
+    Threads are gone after a fork, and SQLite connections and HTTP connection
+    pools would otherwise be shared with the master and every other worker.
+    """
+    _after_fork.append(callback)
+    return callback
+
+
+def prepare_master() -> None:
+    """In the master, before each worker is forked: warm shared caches (once), release, and freeze what exists."""
+    global _warmed
+    if not _warmed:
+        _warmed = True
+        for callback in _warm_ups:
+            try:
+                callback()
+            except Exception as e:
+                # A cache that could not be warmed is loaded lazily by each worker
+                logger.warning(f"Warm-up {callback.__qualname__} failed: {str(e)}")
+    for callback in _before_fork:
+        callback()
+    # Frozen objects are never visited by the collector again, so collections in
+    # the workers don't write to (and copy) the pages holding them
+    gc.freeze()
+
+
+def prepare_worker() -> None:
+    """In a worker just forked from the master: recreate threads, connections and clients."""
+    for callback in _after_fork:
+        callback()
+
+
+class SQLiteStore:
+    """
+    Base of the SQLite-backed stores: one connection per process, carried safely across a fork.
+
+    _open() creates the database's directory and opens this process's
+    connection, then has it closed in the master before each fork and opened
+    again in each worker (see before_fork and after_fork).
+    """
+
+    # Run on every new connection before the shared ones (e.g. auto_vacuum, which must precede the first table)
+    PRAGMAS: Tuple[str, ...] = ()
+
+    path: str
+    _conn: sqlite3.Connection
+
+    def _open(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._connect()
+        before_fork(self._close)
+        after_fork(self._connect)
+
+    def _connect(self) -> None:
+        """Open this process's connection (again in each forked worker)."""
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        for pragma in self.PRAGMAS:
+            self._conn.execute(f"PRAGMA {pragma}")
+        # WAL lets several gunicorn workers read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Reads come from the OS page cache, shared by all workers, rather than each connection's own cache
+        self._conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+
+    def _close(self) -> None:
+        self._conn.close()
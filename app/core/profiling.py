@@ -0,0 +1,337 @@
+import cProfile
+import contextvars
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+
+from app.core.config import (
+    CONTINUOUS_PROFILING_FLUSH_SECONDS,
+    CONTINUOUS_PROFILING_INTERVAL_MS,
+    PROFILE_DIR,
+    PROFILE_MAX_ARTIFACTS,
+    PROFILE_SAMPLE_INTERVAL_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# cpu: deterministic (cProfile, saved as .prof); sample: statistical (collapsed stacks, saved as .folded)
+PROFILE_MODES = {"cpu": "prof", "sample": "folded"}
+ARTIFACT_NAME = re.compile(r"^(request-[A-Za-z0-9._:-]+\.(prof|folded)|stacks-\d+\.folded)$")
+
+# Leaf frames of threads that are waiting rather than running; samples of them are dropped
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+_active_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("active_profile", default=None)
+# cProfile can only profile the event loop thread for one request at a time
+_cpu_profile_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename.replace(os.sep, "/").rsplit("/", 2)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> Optional[str]:
+    """
+    Render a thread's stack in the collapsed format read by flame graph tools.
+
+    Returns:
+        Frames from the outermost to the innermost joined with ';', or None
+        when the thread is idle.
+    """
+    leaf = frame.f_code
+    if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+        return None
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """
+    Sample the Python stacks of running threads at a fixed interval.
+
+    Samples are counted per collapsed stack, ready for flamegraph.pl,
+    speedscope or inferno. Sampling reads sys._current_frames() from a
+    background thread, so the sampled code is not instrumented at all.
+    """
+
+    def __init__(self, interval: float, thread_ids: Optional[Callable[[], Iterable[int]]] = None):
+        """
+        Args:
+            interval: Seconds between samples
+            thread_ids: Returns the threads to sample; all threads when omitted
+        """
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        """Record the current stack of every selected thread."""
+        frames = sys._current_frames()
+        own = threading.get_ident()
+        ids = self.thread_ids() if self.thread_ids is not None else frames.keys()
+        stacks = []
+        for thread_id in ids:
+            frame = frames.get(thread_id)
+            if frame is None or thread_id == own:
+                continue
+            stack = collapse_stack(frame)
+            if stack is not None:
+                stacks.append(stack)
+        with self._lock:
+            self.samples += 1
+            self.counts.update(stacks)
+
+    def folded(self) -> str:
+        """All samples so far in the collapsed stack format."""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class RequestProfile:
+    """
+    Profile of a single request.
+
+    Covers the event loop thread while the request is in flight and every
+    blocking call the request hands to the offload pool (see offload.py).
+    The event loop is shared, so work for concurrent requests on the same
+    worker shows up in the profile too.
+    """
+
+    def __init__(self, mode: str, request_id: str):
+        self.mode = mode
+        self.request_id = request_id
+        # Request ids can come from clients and repeat, so the time and a random suffix keep names unique
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        self.name = f"request-{request_id}-{stamp}-{os.urandom(3).hex()}.{PROFILE_MODES[mode]}"
+        self._lock = threading.Lock()
+        self._profiler: Optional[cProfile.Profile] = None
+        self._thread_profilers: List[cProfile.Profile] = []
+        self._threads: Dict[int, int] = {}
+        self._sampler: Optional[StackSampler] = None
+        self._finished = False
+
+    def start(self) -> bool:
+        """Start profiling the calling (event loop) thread; False if another cpu profile is running."""
+        if self.mode == "cpu":
+            if not _cpu_profile_lock.acquire(blocking=False):
+                return False
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._threads[threading.get_ident()] = 1
+            self._sampler = StackSampler(PROFILE_SAMPLE_INTERVAL_MS / 1000, self._sampled_threads)
+            self._sampler.start()
+        return True
+
+    def _sampled_threads(self) -> List[int]:
+        with self._lock:
+            return list(self._threads)
+
+    def run(self, func: Callable[[], T]) -> T:
+        """Run a blocking call in the current (offload) thread as part of the profile."""
+        if self._finished:
+            return func()
+        if self.mode == "cpu":
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(func)
+            finally:
+                with self._lock:
+                    self._thread_profilers.append(profiler)
+
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._threads[thread_id] = self._threads.get(thread_id, 0) + 1
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self._threads[thread_id] -= 1
+                if not self._threads[thread_id]:
+                    del self._threads[thread_id]
+
+    def finish(self) -> Optional[str]:
+        """
+        Stop profiling and write the artifact (idempotent).
+
+        Returns:
+            The artifact path, or None if it was already written or could not be.
+        """
+        if not self.stop():
+            return None
+        return self.write()
+
+    def stop(self) -> bool:
+        """
+        Stop profiling, in the thread that started it (idempotent).
+
+        Returns:
+            False if the profile was already stopped.
+        """
+        if self._finished:
+            return False
+        self._finished = True
+        if self._profiler is not None:
+            self._profiler.disable()
+            _cpu_profile_lock.release()
+        else:
+            self._sampler.stop()
+        return True
+
+    def write(self) -> Optional[str]:
+        """
+        Write the artifact of a stopped profile. Blocks on disk, so run it off the event loop (run_in_thread).
+
+        Returns:
+            The artifact path, or None if it could not be written.
+        """
+        path = os.path.join(PROFILE_DIR, self.name)
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            if self._profiler is not None:
+                stats = pstats.Stats(self._profiler)
+                with self._lock:
+                    for profiler in self._thread_profilers:
+                        stats.add(profiler)
+                stats.dump_stats(path)
+            else:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(self._sampler.folded())
+        except Exception as e:
+            logger.warning(f"Could not write profile {self.name}: {str(e)}")
+            return None
+        _prune_artifacts()
+        logger.info(f"Wrote request profile {self.name}", extra={"request_id": self.request_id})
+        return path
+
+
+def current_profile() -> Optional[RequestProfile]:
+    """Return the profile of the request being handled, if it is being profiled."""
+    return _active_profile.get()
+
+
+def start_request_profile(mode: str, request_id: str) -> Optional[RequestProfile]:
+    """
+    Start profiling the current request and make the profile active in this context.
+
+    Returns:
+        The profile, or None if the mode is unknown or a cpu profile is already running.
+    """
+    if mode not in PROFILE_MODES:
+        return None
+    profile = RequestProfile(mode, request_id)
+    if not profile.start():
+        logger.warning("Request profile skipped: another cpu profile is running in this worker")
+        return None
+    _active_profile.set(profile)
+    return profile
+
+
+def artifact_path(name: str) -> Optional[str]:
+    """Return the path of a stored profile artifact, or None if the name is invalid or unknown."""
+    if not ARTIFACT_NAME.match(name):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def list_artifacts() -> List[Dict[str, object]]:
+    """List stored profile artifacts, newest first."""
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    artifacts = []
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(PROFILE_DIR, name))
+        except FileNotFoundError:
+            continue
+        artifacts.append({"name": name, "size_bytes": stat.st_size, "modified": stat.st_mtime})
+    return sorted(artifacts, key=lambda a: a["modified"], reverse=True)
+
+
+def _prune_artifacts() -> None:
+    requests = [a for a in list_artifacts() if str(a["name"]).startswith("request-")]
+    for artifact in requests[PROFILE_MAX_ARTIFACTS:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, str(artifact["name"])))
+        except FileNotFoundError:
+            pass
+
+
+class ContinuousProfiler:
+    """
+    Low-rate stack sampler that runs for the life of a worker.
+
+    Collapsed stacks are rewritten to PROFILE_DIR/stacks-<pid>.folded every
+    flush interval, with counts since the worker started.
+    """
+
+    def __init__(self, interval: float, flush_interval: float):
+        self.flush_interval = flush_interval
+        self.sampler = StackSampler(interval)
+        self.path = os.path.join(PROFILE_DIR, f"stacks-{os.getpid()}.folded")
+
+    def start(self) -> None:
+        self.sampler.start()
+        threading.Thread(target=self._flush_periodically, name="stack-flusher", daemon=True).start()
+        logger.info(f"Continuous profiling started, writing {self.path}")
+
+    def _flush_periodically(self) -> None:
+        # Waiting on an event keeps this thread out of its own samples (see IDLE_FRAMES)
+        stop = threading.Event()
+        while not stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.sampler.folded())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write stack samples: {str(e)}")
+
+
+def start_continuous_profiler() -> ContinuousProfiler:
+    """Start sampling every thread of this worker in the background."""
+    profiler = ContinuousProfiler(CONTINUOUS_PROFILING_INTERVAL_MS / 1000, CONTINUOUS_PROFILING_FLUSH_SECONDS)
+    profiler.start()
+    return profiler
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Mapping, Optional
+
+from app.core import prefork
+from app.core.metrics import REPORT_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Complete reports, and partial reports of runs cut short by a draining worker
+_TABLES = ("reports", "partial_reports")
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a research query so trivially different phrasings share a key.
+
+    Unicode is NFKC-normalized and case-folded, punctuation is dropped and
+    whitespace is collapsed. Word order is preserved.
+    """
+    text = unicodedata.normalize("NFKC", query).casefold()
+    text = _NON_WORD.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def report_key(query: str, model_name: str, budget: Optional[Mapping[str, Any]] = None) -> str:
+    """
+    Build the store key for a query and model.
+
+    Args:
+        query: The research query
+        model_name: The model the report is produced with
+        budget: Non-default research limits the report was produced under; reports under other limits differ
+    """
+    raw = f"{model_name}\x00{normalize_query(query)}"
+    if budget:
+        raw += "\x00" + json.dumps(budget, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ReportStore(prefork.SQLiteStore):
+    """
+    SQLite-backed store of completed research reports.
+
+    Partial reports of runs cut short by a draining worker are kept in a
+    table of their own: they are never served or counted as hits, and never
+    replace a complete report, but a retry can resume from them (see
+    get_partial()). A complete report stored later supersedes its partial.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the report store.
+
+        Args:
+            path: Location of the SQLite database file
+        """
+        self._open(path)
+        self._lock = threading.Lock()
+        for table in _TABLES:
+            self._conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    normalized_query TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    usage TEXT,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_model ON {table} (model)")
+
+        self.hits = 0
+        self.misses = 0
+        logger.info(f"Report store opened at {path}")
+
+    def get(
+        self, query: str, model_name: str, max_age: float, budget: Optional[Mapping[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return a stored report if it is younger than max_age seconds.
+
+        Args:
+            query: The research query
+            model_name: The model the report was produced with
+            max_age: Freshness window in seconds; 0 or less disables reuse
+            budget: Non-default research limits the report must have been produced under (see report_key)
+
+        Returns:
+            A dict with content, usage, created_at and age, or None on a miss.
+        """
+        if max_age <= 0:
+            return None
+
+        report = self._get("reports", query, model_name, max_age, budget)
+        if report is None:
+            self.misses += 1
+            REPORT_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+        self.hits += 1
+        REPORT_CACHE_LOOKUPS.labels("hit").inc()
+        return report
+
+    def get_partial(
+        self, query: str, model_name: str, max_age: float, budget: Optional[Mapping[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return the partial report of a run cut short by a draining worker, if younger than max_age seconds.
+
+        Returns:
+            A dict with content, usage, created_at and age, or None.
+        """
+        return self._get("partial_reports", query, model_name, max_age, budget)
+
+    def _get(
+        self, table: str, query: str, model_name: str, max_age: float, budget: Optional[Mapping[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT content, usage, created_at FROM {table} WHERE key = ?",
+                (report_key(query, model_name, budget),),
+            ).fetchone()
+
+        age = time.time() - row[2] if row else None
+        if row is None or age > max_age:
+            return None
+        return {
+            "content": row[0],
+            "usage": json.loads(row[1]) if row[1] else None,
+            "created_at": row[2],
+            "age": age,
+        }
+
+    def put(
+        self,
+        query: str,
+        model_name: str,
+        content: str,
+        usage: Optional[Dict[str, Any]] = None,
+        budget: Optional[Mapping[str, Any]] = None,
+        partial: bool = False,
+    ) -> None:
+        """
+        Store (or replace) the report for a query and model, produced under the given non-default limits.
+
+        Args:
+            partial: Whether the report is the partial one of a run cut short by a draining worker; it is
+                stored apart from the complete report (see get_partial()), which storing one supersedes
+        """
+        key = report_key(query, model_name, budget)
+        with self._lock:
+            if not partial:
+                self._conn.execute("DELETE FROM partial_reports WHERE key = ?", (key,))
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {_TABLES[partial]} "
+                "(key, query, normalized_query, model, content, usage, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    query,
+                    normalize_query(query),
+                    model_name,
+                    content,
+                    json.dumps(usage) if usage else None,
+                    time.time(),
+                ),
+            )
+
+    def invalidate(self, query: Optional[str] = None, model_name: Optional[str] = None) -> int:
+        """
+        Delete stored reports.
+
+        Args:
+            query: Only delete reports matching this query (normalized)
+            model_name: Only delete reports produced with this model
+
+        Returns:
+            The number of deleted reports.
+        """
+        clauses = []
+        params = []
+        if query is not None:
+            clauses.append("normalized_query = ?")
+            params.append(normalize_query(query))
+        if model_name is not None:
+            clauses.append("model = ?")
+            params.append(model_name)
+
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+
+        with self._lock:
+            deleted = sum(self._conn.execute(f"DELETE FROM {table}{where}", params).rowcount for table in _TABLES)
+
+        logger.info(f"Invalidated {deleted} stored reports", extra={"query": query, "model": model_name})
+        return deleted
+
+    def stats(self) -> Dict[str, int]:
+        """Return entry count and hit/miss counters for this worker."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,165 @@
+import logging
+import time
+from typing import Callable, Optional
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import metrics, profiling, token_usage, tracing, traffic_recorder
+from app.core.logging_config import sample_request_logs
+from app.core.offload import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMiddleware:
+    """
+    Request id, tracing, profiling, metrics and logging for every HTTP request.
+
+    A plain ASGI middleware: it runs in the task serving the request, so the
+    context it sets up (request id, log sampling, client id, root span) is
+    inherited by the endpoint, and response messages are passed on as they
+    are, without the extra task and memory stream of a function middleware
+    (@app.middleware("http")). Only the response start message is touched, to
+    add the X-Request-ID (and X-Profile-ID) headers.
+
+    Everything is recorded once the last body chunk is sent, so the duration
+    and size cover the whole of a streamed response. Endpoints can add the
+    model (request.state.model) to the latency metric and a traffic shape
+    (request.state.traffic_shape) to record.
+    """
+
+    def __init__(self, app: ASGIApp, is_admin: Callable[[Optional[str]], bool]):
+        """
+        Args:
+            app: The application to wrap
+            is_admin: Whether an X-Admin-Key value allows profiling a request
+        """
+        self.app = app
+        self.is_admin = is_admin
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            # Lifespan and websockets pass straight through
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.time()
+        started = time.perf_counter()
+        method = scope["method"]
+        path = scope["path"]
+        headers = Headers(scope=scope)
+        # Shared with every Request made for this scope, so endpoint state is visible here afterwards
+        state = scope.setdefault("state", {})
+        in_progress = metrics.REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+
+        # The request id and root span are inherited by everything handling this request
+        request_id = tracing.resolve_request_id(headers.get("X-Request-ID"))
+        tracing.request_id_var.set(request_id)
+        sample_request_logs()
+        # Token usage metrics are broken down by the caller's X-Client-ID
+        token_usage.client_var.set(token_usage.resolve_client(headers.get("X-Client-ID")))
+        span = tracing.start_span(
+            f"{method} {path}",
+            parent=None,
+            attributes={"http.method": method, "http.target": path, "request.id": request_id},
+            remote_parent=tracing.parse_traceparent(headers.get("traceparent"))
+        )
+
+        # Admins can profile a single request with X-Profile (or ?profile=) set to cpu or sample
+        profile = None
+        profile_mode = headers.get("X-Profile")
+        if not profile_mode and b"profile=" in scope.get("query_string", b""):
+            profile_mode = QueryParams(scope["query_string"]).get("profile")
+        if profile_mode:
+            if self.is_admin(headers.get("X-Admin-Key")):
+                profile = profiling.start_request_profile(profile_mode, request_id)
+            else:
+                logger.warning("Ignoring profile request without a valid admin key")
+
+        client = scope.get("client")
+        logger.info(
+            "Request: %s %s",
+            method,
+            path,
+            extra={
+                "method": method,
+                "path": path,
+                "client_ip": client[0] if client else "unknown",
+                "request_id": request_id,
+            }
+        )
+
+        status_code = 500
+        response_started = False
+        bytes_sent = 0
+        first_byte: Optional[float] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_started, bytes_sent, first_byte
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                # Header lists are appended to in place; the message itself is passed on as it is
+                message.setdefault("headers", [])
+                message["headers"].append((b"x-request-id", request_id.encode("latin-1")))
+                if profile is not None:
+                    message["headers"].append((b"x-profile-id", profile.name.encode("latin-1")))
+            elif message["type"] == "http.response.body":
+                body = message.get("body")
+                if body:
+                    if first_byte is None:
+                        first_byte = time.perf_counter()
+                    bytes_sent += len(body)
+            await send(message)
+
+        try:
+            with tracing.use_span(span):
+                await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            span.record_error(e)
+            logger.error("Request failed: %s", e, exc_info=True)
+            if response_started:
+                # Part of the response is out; the server closes the connection
+                raise
+            await JSONResponse(status_code=500, content={"detail": "Internal server error"})(scope, receive, send_wrapper)
+        finally:
+            # Also reached when the client goes away in the middle of a stream
+            stopped = profile is not None and profile.stop()
+            self._record(scope, state, span, in_progress, start_time, started, first_byte, status_code, bytes_sent)
+            if stopped:
+                # Profiles take a while to serialize and write: kept off the event loop
+                await run_in_thread(profile.write)
+
+    @staticmethod
+    def _record(scope, state, span, in_progress, start_time, started, first_byte, status_code, bytes_sent) -> None:
+        """Record a finished (or abandoned) request: metrics, span, traffic shape and the response log."""
+        duration = time.perf_counter() - started
+        in_progress.dec()
+        method = scope["method"]
+        route = metrics.route_of(scope)
+        metrics.REQUEST_LATENCY.labels(method, route, metrics.model_label(state.get("model")), str(status_code)).observe(duration)
+        metrics.RESPONSE_SIZE.labels(method, route).observe(bytes_sent)
+        span.name = f"{method} {route}"
+        span.set_attribute("http.status_code", status_code)
+        span.set_attribute("http.response_bytes", bytes_sent)
+        span.end()
+        shape = state.get("traffic_shape")
+        if shape is not None:
+            traffic_recorder.recorder.record(route, start_time, shape, status_code, duration)
+
+        time_to_first_byte = first_byte - started if first_byte is not None else None
+        logger.info(
+            "Response: %s took %.3fs (%d bytes)",
+            status_code,
+            duration,
+            bytes_sent,
+            extra={
+                "status_code": status_code,
+                "process_time": duration,
+                "time_to_first_byte": time_to_first_byte,
+                "bytes_sent": bytes_sent,
+            }
+        )
@@ -0,0 +1,173 @@
+import json
+import logging
+import math
+import time
+import weakref
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Set
+
+from app.core.config import (
+    RESEARCH_DEADLINE_SECONDS,
+    RESEARCH_MAX_OUTPUT_TOKENS,
+    RESEARCH_MAX_SOURCES,
+    RESEARCH_MAX_TOOL_CALLS,
+    RESEARCH_WRITEUP_RESERVE_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token)."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+@dataclass
+class ResearchBudget:
+    """Limits applied to a single research run."""
+
+    max_tool_calls: int = RESEARCH_MAX_TOOL_CALLS
+    max_output_tokens: int = RESEARCH_MAX_OUTPUT_TOKENS
+    max_sources: int = RESEARCH_MAX_SOURCES
+    deadline_seconds: float = RESEARCH_DEADLINE_SECONDS
+
+    @classmethod
+    def from_request(cls, request: Any) -> "ResearchBudget":
+        """
+        Build the budget for a research request.
+
+        Per-request values can tighten the server defaults but never exceed them.
+        """
+        def pick(requested: Optional[float], default: float) -> float:
+            return default if requested is None else min(requested, default)
+
+        return cls(
+            max_tool_calls=pick(request.max_tool_calls, RESEARCH_MAX_TOOL_CALLS),
+            max_output_tokens=pick(request.max_output_tokens, RESEARCH_MAX_OUTPUT_TOKENS),
+            max_sources=pick(request.max_sources, RESEARCH_MAX_SOURCES),
+            deadline_seconds=pick(request.deadline_seconds, RESEARCH_DEADLINE_SECONDS),
+        )
+
+    def variant(self) -> Optional[Dict[str, float]]:
+        """
+        The limits that tell this budget's reports apart in stored report and in-flight run keys.
+
+        Returns:
+            None for the server defaults, so their keys stay the same; the limits otherwise.
+        """
+        return None if self == ResearchBudget() else asdict(self)
+
+
+class BudgetTracker:
+    """Track what a research run has consumed against its budget."""
+
+    def __init__(self, budget: ResearchBudget):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.tool_calls = 0
+        self.output_tokens = 0
+        self.sources: Set[str] = set()
+        self.exhausted: Optional[str] = None
+        # Earlier hard deadline set by cut_short()
+        self.cut_off: Optional[float] = None
+        _running.add(self)
+
+    @property
+    def deadline(self) -> float:
+        deadline = self.started + self.budget.deadline_seconds
+        return deadline if self.cut_off is None else min(deadline, self.cut_off)
+
+    @property
+    def deadline_reason(self) -> str:
+        """The budget_exhausted reason when the deadline passes: drain if cut_short() brought it forward."""
+        brought_forward = self.cut_off is not None and self.cut_off < self.started + self.budget.deadline_seconds
+        return "drain" if brought_forward else "deadline"
+
+    @property
+    def gather_deadline(self) -> float:
+        """When tool use must stop so the write-up still fits before the hard deadline."""
+        reserve = min(RESEARCH_WRITEUP_RESERVE_SECONDS, self.budget.deadline_seconds / 2)
+        return self.deadline - reserve
+
+    def time_left(self, writing: bool) -> float:
+        """Seconds until the applicable deadline (the hard deadline once the agent is writing)."""
+        return (self.deadline if writing else self.gather_deadline) - time.monotonic()
+
+    def exhaust(self, reason: str) -> None:
+        """Record the first budget that ran out."""
+        if self.exhausted is None:
+            self.exhausted = reason
+            logger.info(f"Research budget exhausted: {reason}", extra=self.usage())
+
+    def record_tool_call(self) -> None:
+        self.tool_calls += 1
+        if self.tool_calls >= self.budget.max_tool_calls:
+            self.exhaust("tool_calls")
+
+    def record_tool_result(self, result: Any) -> None:
+        """Count the distinct source URLs returned by a tool call."""
+        try:
+            items = json.loads(result) if isinstance(result, str) else result
+        except ValueError:
+            return
+        if isinstance(items, dict):
+            items = [items]
+        if not isinstance(items, list):
+            return
+        for item in items:
+            if isinstance(item, dict) and item.get("url"):
+                self.sources.add(item["url"])
+        if len(self.sources) >= self.budget.max_sources:
+            self.exhaust("sources")
+
+    def sources_left(self) -> int:
+        """Distinct sources the run may still gather."""
+        return max(self.budget.max_sources - len(self.sources), 0)
+
+    def record_output(self, text: str) -> bool:
+        """
+        Count generated output.
+
+        Returns:
+            False once the output token budget is used up.
+        """
+        self.output_tokens += estimate_tokens(text)
+        if self.output_tokens >= self.budget.max_output_tokens:
+            self.exhaust("output_tokens")
+            return False
+        return True
+
+    def usage(self) -> Dict[str, Any]:
+        """Budget consumed so far, as reported in the response's usage field."""
+        return {
+            "tool_calls": self.tool_calls,
+            "sources": len(self.sources),
+            "output_tokens": self.output_tokens,
+            "elapsed_ms": int((time.monotonic() - self.started) * 1000),
+            "budget_exhausted": self.exhausted,
+        }
+
+
+# Trackers of the runs in progress in this process
+_running: "weakref.WeakSet[BudgetTracker]" = weakref.WeakSet()
+
+
+def cut_short(until: float) -> int:
+    """
+    Bring the deadline of every running research run forward to until (time.monotonic()).
+
+    Runs still gathering then write up what they have; a run notices its new
+    deadline when the agent's next chunk arrives. Runs stopped by it report
+    "drain" as the budget exhausted, not "deadline".
+
+    Returns:
+        The number of runs whose deadline was brought forward.
+    """
+    count = 0
+    for tracker in list(_running):
+        if tracker.deadline > until:
+            tracker.cut_off = until
+            count += 1
+    if count:
+        logger.info(f"Research deadlines brought forward for {count} runs")
+    return count
@@ -0,0 +1,141 @@
+import asyncio
+import inspect
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from app.core.drain import drain
+from app.core.metrics import RESEARCH_RUNS_IN_PROGRESS
+
+logger = logging.getLogger(__name__)
+
+
+class ResearchRun:
+    """
+    A research run executing as a background task.
+
+    Chunks produced by the run are kept so that any number of subscribers,
+    including ones that join late, receive the full stream. The run keeps
+    going when subscribers disconnect so its report can still be stored.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks: List[Dict[str, Any]] = []
+        self.content: Optional[str] = None
+        self.usage: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.content is not None or self.error is not None
+
+    def _notify(self) -> None:
+        # Wake current waiters and arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _execute(
+        self,
+        source: AsyncIterator[Dict[str, Any]],
+        on_complete: Optional[Callable[[str, Optional[Dict[str, Any]]], Optional[Awaitable[None]]]]
+    ) -> None:
+        parts = []
+        RESEARCH_RUNS_IN_PROGRESS.inc()
+        try:
+            async for chunk in source:
+                parts.append(chunk.get("content", ""))
+                if chunk.get("done", False):
+                    self.usage = chunk.get("usage")
+                self.chunks.append(chunk)
+                self._notify()
+            content = "".join(parts)
+            if on_complete is not None:
+                result = on_complete(content, self.usage)
+                if inspect.isawaitable(result):
+                    await result
+            self.content = content
+        except Exception as e:
+            logger.error(f"Research run failed: {str(e)}")
+            self.error = e
+        finally:
+            RESEARCH_RUNS_IN_PROGRESS.dec()
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every chunk of the run from the start, then live chunks until it finishes."""
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.error is not None:
+                raise self.error
+            if self.content is not None:
+                return
+            await changed.wait()
+
+    async def result(self) -> str:
+        """Wait for the run to finish and return the full report content."""
+        while not self.finished:
+            await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+        return self.content
+
+
+class InflightRuns:
+    """
+    Registry of research runs currently executing in this worker.
+
+    The first request for a key launches the run; identical requests arriving
+    while it executes subscribe to it instead of starting another agent run.
+    """
+
+    def __init__(self):
+        self._runs: Dict[str, ResearchRun] = {}
+        self._unregistered: Set[ResearchRun] = set()
+
+    def get(self, key: str) -> Optional[ResearchRun]:
+        """Return the running research run for key, if any."""
+        return self._runs.get(key)
+
+    def launch(
+        self,
+        key: str,
+        source: AsyncIterator[Dict[str, Any]],
+        on_complete: Optional[Callable[[str, Optional[Dict[str, Any]]], Optional[Awaitable[None]]]] = None,
+        register: bool = True,
+    ) -> ResearchRun:
+        """
+        Start consuming source in a background task.
+
+        Args:
+            key: The report key of the run
+            source: Async iterator of research chunks
+            on_complete: Called with the full content and usage once the run succeeds (awaited if it returns an awaitable)
+            register: Whether later identical requests may join this run
+
+        Returns:
+            The launched ResearchRun.
+        """
+        run = ResearchRun(key)
+        if register:
+            self._runs[key] = run
+        else:
+            self._unregistered.add(run)
+        run.task = asyncio.create_task(run._execute(source, on_complete))
+        run.task.add_done_callback(lambda _: self._release(run))
+        # A draining worker waits for its runs, so ones finishing in time still store their reports
+        drain.track(run.task)
+        return run
+
+    def _release(self, run: ResearchRun) -> None:
+        if self._runs.get(run.key) is run:
+            del self._runs[run.key]
+        self._unregistered.discard(run)
+
+    def __len__(self) -> int:
+        return len(self._runs) + len(self._unregistered)
@@ -1,94 +1,458 @@
+import asyncio
+import json
 import logging
 import os
+import time
+from dataclasses import asdict
 from datetime import datetime
-from typing import AsyncGenerator, Dict, List, Optional, AsyncIterator, Any
+from typing import AsyncGenerator, Callable, Dict, List, Optional, AsyncIterator, Any
 
 from agno.agent import Agent
-from agno.models.openai import OpenAIChat
-from agno.tools.exa import ExaTools
-from agno.run.response import RunResponse
+from agno.run.response import RunEvent, RunResponse
 from fastapi import HTTPException
 
-from app.core.config import MODEL_NAME, OPENAI_API_KEY
+from app.core.config import (
+    CONTENT_CHUNK_TOKENS,
+    CONTENT_REDUCTION_ENABLED,
+    CONTENT_TOKEN_BUDGET,
+    CONTENT_TOP_K,
+    EXA_TEXT_LENGTH_LIMIT,
+    KNOWLEDGE_MAX_AGE_SECONDS,
+    MODEL_NAME,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+)
+from app.core.content_reduction import ContentReducer
+from app.core.knowledge_index import KnowledgeIndex
+from app.core import prefork, token_usage, tracing
+from app.core.drain import drain
+from app.core.metrics import RESEARCH_SOURCE_TOKENS, UPSTREAM_ERRORS, model_label
+from app.core.openai_model import TracedOpenAIChat
+from app.core.offload import iterate_in_thread, run_in_thread
+from app.core.research_budget import BudgetTracker, ResearchBudget, cut_short
+from app.core.research_tools import ResearchExaTools
 from app.models.research import ResearchRequest, ResearchResponse, StreamingChunk
 
 logger = logging.getLogger(__name__)
 
+# Seconds before the drain deadline by which research runs should have finished, to send their (partial) report
+# and store it for a retry to resume from
+DRAIN_MARGIN_SECONDS = 1.0
+
+
+@drain.on_begin
+def _cut_short_for_drain(deadline: float) -> None:
+    """Have running research runs write up what they gathered and finish before a draining worker stops."""
+    cut_short(deadline - DRAIN_MARGIN_SECONDS)
+
+
+class ToolCallTimer:
+    """
+    Translate Agno tool call run events into typed stream events.
+
+    Agno attaches the cumulative list of tool calls to every tool event, so calls
+    are tracked by id and each one is announced once when it starts and once
+    when it finishes. Each call is also recorded as a span under parent_span.
+    """
+
+    def __init__(self, parent_span: Optional[tracing.Span] = None):
+        self._started: Dict[str, float] = {}
+        self._spans: Dict[str, tracing.Span] = {}
+        self._parent_span = parent_span
+        self._finished = set()
+        # Results of finished tool calls, in completion order
+        self.results: List[str] = []
+
+    def events(self, chunk: RunResponse) -> List[Dict[str, Any]]:
+        """Return the tool_call_started/tool_call_finished events new in this chunk."""
+        events = []
+        for tool in chunk.tools or []:
+            call_id = tool.get("tool_call_id")
+            if call_id is None or call_id in self._finished:
+                continue
+
+            if call_id not in self._started:
+                self._started[call_id] = time.perf_counter()
+                self._spans[call_id] = tracing.start_span(
+                    f"tool.{tool.get('tool_name')}",
+                    parent=self._parent_span,
+                    attributes={"tool.call_id": call_id}
+                )
+                events.append({
+                    "type": "tool_call_started",
+                    "content": "",
+                    "done": False,
+                    "tool": {
+                        "id": call_id,
+                        "name": tool.get("tool_name"),
+                        "args": tool.get("tool_args"),
+                    },
+                })
+
+            # Completed calls carry their result content
+            if "content" in tool:
+                self._finished.add(call_id)
+                duration_ms = (time.perf_counter() - self._started[call_id]) * 1000
+                metrics = tool.get("metrics")
+                if metrics is not None and getattr(metrics, "time", None):
+                    duration_ms = metrics.time * 1000
+                result = tool.get("content")
+                result = result if isinstance(result, str) else str(result or "")
+                result_size = len(result)
+                # ExaTools reports failures as an "Error: ..." result rather than raising
+                error = bool(tool.get("tool_call_error")) or result.startswith("Error:")
+                self.results.append(result)
+                span = self._spans.pop(call_id)
+                span.set_attribute("result_size", result_size)
+                if error:
+                    span.error = result[:200]
+                span.end(duration_s=duration_ms / 1000)
+                logger.info(
+                    f"Tool call {tool.get('tool_name')} finished in {duration_ms:.0f}ms",
+                    extra={
+                        "tool": tool.get("tool_name"),
+                        "duration_ms": round(duration_ms, 1),
+                        "result_size": result_size,
+                    }
+                )
+                events.append({
+                    "type": "tool_call_finished",
+                    "content": "",
+                    "done": False,
+                    "tool": {
+                        "id": call_id,
+                        "name": tool.get("tool_name"),
+                        "duration_ms": round(duration_ms, 1),
+                        "result_size": result_size,
+                        "error": error,
+                    },
+                })
+        return events
+
+
+RESEARCH_DESCRIPTION = """You are a distinguished research analyst specializing in synthesizing 
+information from multiple sources. Your expertise lies in creating clear, factual 
+reports that combine academic rigor with engaging narrative."""
+
+RESEARCH_INSTRUCTIONS = """
+1. Begin by running targeted searches to gather comprehensive information
+2. Analyze and cross-reference sources for accuracy and relevance
+3. Structure your findings in a clear, logical format
+4. Include only verifiable facts with proper citations
+5. Create an engaging narrative that guides through complex topics
+"""
+
+RESEARCH_EXPECTED_OUTPUT = """
+A professional research report in markdown format:
+
+# {Topic Title}
+
+## Key Findings
+{Major discoveries or developments with citations}
+
+## Analysis
+{Detailed analysis of the findings}
+
+## Sources
+{Numbered list of sources with relevant quotes}
+"""
+
+# Upper bound on gathered tool output handed to the write-up when the deadline hits
+WRITEUP_CONTEXT_CHARS = 24000
+
+KNOWN_SOURCES_CONTEXT = """Sources already retrieved for this question (fetched earlier, reuse them and
+search only for what they do not cover):
+{sources}"""
+
+INTERRUPTED_REPORT_CONTEXT = """A previous run on this question was interrupted (the server shut down) and left
+this partial report. Build on it: keep what it established and research only what it left open:
+{report}"""
+
+
 class ResearchService:
     """Service for handling research queries using Agno and Exa tools."""
     
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, knowledge: Optional[KnowledgeIndex] = None):
         """
         Initialize the research service with Exa tools.
+
+        Args:
+            model_name: The default model
+            knowledge: Index of previously fetched sources used to pre-seed runs and answer searches
         """
         try:
-            today = datetime.now().strftime("%Y-%m-%d")
-            self.agent = Agent(
-                model=OpenAIChat(
-                    id=model_name,
-                    api_key=OPENAI_API_KEY
-                ),
-                tools=[ExaTools(start_published_date=today, type="keyword")],
-                description="""You are a distinguished research analyst specializing in synthesizing 
-                information from multiple sources. Your expertise lies in creating clear, factual 
-                reports that combine academic rigor with engaging narrative.""",
-                instructions="""
-                1. Begin by running targeted searches to gather comprehensive information
-                2. Analyze and cross-reference sources for accuracy and relevance
-                3. Structure your findings in a clear, logical format
-                4. Include only verifiable facts with proper citations
-                5. Create an engaging narrative that guides through complex topics
-                """,
-                expected_output="""
-                A professional research report in markdown format:
-
-                # {Topic Title}
-
-                ## Key Findings
-                {Major discoveries or developments with citations}
-
-                ## Analysis
-                {Detailed analysis of the findings}
-
-                ## Sources
-                {Numbered list of sources with relevant quotes}
-                """,
-                markdown=True,
-                show_tool_calls=True
-            )
+            self.model_name = model_name
+            self.knowledge = knowledge
+            self.agent = self._create_agent()
+            # Runs share this agent's OpenAI client; a forked worker builds its own connection pool
+            prefork.after_fork(self._reset_agent)
             logger.info("Research service initialized with Exa tools")
         except Exception as e:
             logger.error(f"Error initializing research service: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
-    async def research(self, query: str, stream: bool = False) -> AsyncGenerator[Dict[str, Any], None]:
+    def _reset_agent(self) -> None:
+        self.agent = self._create_agent()
+
+    def _create_agent(
+        self,
+        budget: Optional[ResearchBudget] = None,
+        model_name: Optional[str] = None,
+        tools: bool = True,
+        query: str = "",
+        reducer: Optional[ContentReducer] = None,
+        context: Optional[str] = None,
+        sources_left: Optional[Callable[[], int]] = None
+    ) -> Agent:
+        """
+        Build a research agent.
+
+        Each run gets its own agent so budgets apply per request and concurrent
+        runs don't share Agno's per-run state. Agents after the first reuse the
+        service's OpenAI client and its connection pool.
+
+        Args:
+            budget: Limits for the run; None builds an unbudgeted agent
+            model_name: The model to use. If None, the service's model is used.
+            tools: Whether to attach the Exa tools (the deadline write-up runs without them)
+            query: The research query, used to rank fetched content
+            reducer: Reduces fetched page content before prompting; None passes it through
+            context: Extra context for the system message (sources known before the run)
+            sources_left: Sources the run's budget has left, capping each search's results (the budget
+                itself is enforced by the run's BudgetTracker)
+        """
+        agent_model = self.agent.model if hasattr(self, "agent") else None
+        today = datetime.now().strftime("%Y-%m-%d")
+        return Agent(
+            model=TracedOpenAIChat(
+                id=model_name or self.model_name,
+                api_key=OPENAI_API_KEY,
+                base_url=OPENAI_BASE_URL,
+                max_completion_tokens=budget.max_output_tokens if budget else None,
+                client=agent_model.get_client() if agent_model else None
+            ),
+            tools=[ResearchExaTools(
+                research_query=query,
+                reducer=reducer,
+                knowledge=self.knowledge,
+                sources_left=sources_left,
+                start_published_date=today,
+                type="keyword",
+                # Fetch fuller pages when they will be reduced locally
+                text_length_limit=EXA_TEXT_LENGTH_LIMIT if reducer else 1000
+            )] if tools else None,
+            tool_call_limit=budget.max_tool_calls if budget and tools else None,
+            description=RESEARCH_DESCRIPTION,
+            instructions=RESEARCH_INSTRUCTIONS,
+            expected_output=RESEARCH_EXPECTED_OUTPUT,
+            additional_context=context,
+            markdown=True,
+            show_tool_calls=tools
+        )
+
+    async def research(
+        self,
+        query: str,
+        stream: bool = False,
+        budget: Optional[ResearchBudget] = None,
+        model_name: Optional[str] = None,
+        resume: Optional[str] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Perform research using the agent and Exa tools.
+        
+        Args:
+            query: The research query
+            stream: Whether to yield events as they happen or only the final report
+            budget: Limits for the run. If None, the server defaults are used.
+            model_name: The model to use. If None, the service's model is used.
+            resume: Partial report of an earlier run on the query that a draining worker cut short, to build on
+            
+        Yields:
+            Stream event dicts; the final one is marked done and carries the budget
+            consumed and the token usage of every model request in its usage field. Without streaming only the final event is
+            yielded, with the full report as its content.
         """
+        # Active across yields so model and tool calls made during the run become its children
+        span = tracing.start_span("research.run", attributes={"model": model_name or self.model_name, "stream": stream})
+        with tracing.use_span(span), token_usage.track() as tokens:
+            try:
+                parts = []
+                async for event in self._run(query, budget or ResearchBudget(), model_name, resume):
+                    if event["done"]:
+                        event["usage"] = dict(event.get("usage") or {}, **tokens.as_dict())
+                        for key, value in (event.get("usage") or {}).items():
+                            span.set_attribute(f"usage.{key}", value)
+                    if stream:
+                        yield event
+                        continue
+                    parts.append(event["content"])
+                    if event["done"]:
+                        yield dict(event, content="".join(parts))
+            except Exception as e:
+                span.record_error(e)
+                raise
+            finally:
+                span.end()
+
+    async def _run(
+        self, query: str, budget: ResearchBudget, model_name: Optional[str], resume: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Run the agent within its budget, writing up gathered material if the deadline hits."""
+        tracker = BudgetTracker(budget)
+        reducer = ContentReducer(
+            token_budget=CONTENT_TOKEN_BUDGET,
+            top_k=CONTENT_TOP_K,
+            chunk_tokens=CONTENT_CHUNK_TOKENS
+        ) if CONTENT_REDUCTION_ENABLED else None
+        known_sources = await run_in_thread(self._known_sources, query, budget, reducer)
+        context = []
+        if known_sources:
+            context.append(KNOWN_SOURCES_CONTEXT.format(sources=known_sources))
+        if resume:
+            context.append(INTERRUPTED_REPORT_CONTEXT.format(report=resume[:WRITEUP_CONTEXT_CHARS]))
+        agent = self._create_agent(
+            budget,
+            model_name,
+            query=query,
+            reducer=reducer,
+            context="\n\n".join(context) or None,
+            sources_left=tracker.sources_left
+        )
+        model_id = agent.model.id
+        tool_timer = ToolCallTimer(parent_span=tracing.current_span())
+        if known_sources:
+            tracker.record_tool_result(known_sources)
+        results_seen = 0
+        draft = []
+        # Whether the agent is writing (content arrived since its last tool call)
+        writing = False
+        
         try:
-            logger.info(f"Starting research for query: query='{query}' model_name='{self.agent.model.id}' stream={stream}")
+            logger.info(
+                f"Starting research for query: query='{query}' model_name='{model_id}'",
+                extra={"budget": asdict(budget), "resumed": resume is not None}
+            )
+            
+            # @doc: https://docs.agno.com/agents/run
+            chunks = iterate_in_thread(lambda: agent.run(query, stream=True, stream_intermediate_steps=True))
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(tracker.time_left(writing), 0))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        tracker.exhaust(tracker.deadline_reason)
+                        break
+                    
+                    if isinstance(chunk, RunResponse):
+                        if chunk.event in (RunEvent.tool_call_started.value, RunEvent.tool_call_completed.value):
+                            for event in tool_timer.events(chunk):
+                                if event["type"] == "tool_call_started":
+                                    writing = False
+                                    tracker.record_tool_call()
+                                else:
+                                    tracker.record_tool_result(tool_timer.results[results_seen])
+                                    results_seen += 1
+                                    if event["tool"]["error"]:
+                                        UPSTREAM_ERRORS.labels("exa", model_label(model_id)).inc()
+                                event["model"] = model_id
+                                yield event
+                            # Out of tool calls or sources: make the agent write up what it has
+                            if tracker.exhausted is not None:
+                                agent.model.tool_choice = "none"
+                            continue
+                        # Skip other intermediate steps; RunCompleted repeats the full content
+                        if chunk.event != RunEvent.run_response.value or not chunk.content:
+                            continue
+                        content = chunk.content
+                    elif isinstance(chunk, dict):
+                        content = chunk.get("content", str(chunk))
+                    else:
+                        content = str(chunk)
+                    
+                    writing = True
+                    draft.append(content)
+                    yield {"type": "content", "content": content, "done": False, "model": model_id}
+                    if not tracker.record_output(content):
+                        break
+            finally:
+                await chunks.aclose()
             
-            if not stream:
-                response = self.agent.run(query)
-                if isinstance(response, dict):
-                    yield {"content": response.get("content", str(response)), "done": True}
-                elif isinstance(response, RunResponse):
-                    yield {"content": response.content, "done": True}
-                else:
-                    yield {"content": str(response), "done": True}
-                return
-
-            is_first_chunk = True
-            for chunk in self.agent.run(query, stream=True):
-                if isinstance(chunk, dict):
-                    yield {"content": chunk.get("content", str(chunk)), "done": False}
-                elif isinstance(chunk, RunResponse):
-                    yield {"content": chunk.content, "done": False}
-                else:
-                    yield {"content": str(chunk), "done": False}
-                is_first_chunk = False
+            # The deadline (or a draining worker) cut the agent off while it was still gathering
+            if tracker.exhausted in ("deadline", "drain") and not writing:
+                material = ([known_sources] if known_sources else []) + tool_timer.results
+                async for content in self._write_up(query, material, "".join(draft), budget, tracker, model_name):
+                    yield {"type": "content", "content": content, "done": False, "model": model_id}
             
-            yield {"content": "", "done": True}
+            usage = tracker.usage()
+            if reducer is not None:
+                usage["source_tokens_fetched"] = reducer.totals.input_tokens
+                usage["source_tokens_used"] = reducer.totals.output_tokens
+                RESEARCH_SOURCE_TOKENS.labels("fetched").inc(reducer.totals.input_tokens)
+                RESEARCH_SOURCE_TOKENS.labels("used").inc(reducer.totals.output_tokens)
+            if self.knowledge is not None:
+                tools = getattr(agent, "tools", None) or []
+                usage["local_searches"] = sum(getattr(t, "local_searches", 0) for t in tools)
+            yield {"type": "done", "content": "", "done": True, "model": model_id, "usage": usage}
         except Exception as e:
+            UPSTREAM_ERRORS.labels("openai", model_label(model_id)).inc()
             logger.error(f"Error during research: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=str(e))
+
+    def _known_sources(self, query: str, budget: ResearchBudget, reducer: Optional[ContentReducer]) -> Optional[str]:
+        """Look the query up in the knowledge index and return matching sources as JSON, if any."""
+        if self.knowledge is None:
+            return None
+        try:
+            results = self.knowledge.search(query, num_results=budget.max_sources, max_age=KNOWLEDGE_MAX_AGE_SECONDS)
+        except Exception as e:
+            logger.warning(f"Knowledge index lookup failed: {str(e)}")
+            return None
+        if not results:
+            return None
+
+        results = [{k: v for k, v in r.items() if k != "coverage"} for r in results]
+        logger.info(f"Pre-seeding research with {len(results)} indexed sources")
+        if reducer is not None:
+            results, _ = reducer.reduce(results, query)
+        return json.dumps(results, separators=(",", ":"))
+
+    async def _write_up(
+        self,
+        query: str,
+        results: List[str],
+        draft: str,
+        budget: ResearchBudget,
+        tracker: BudgetTracker,
+        model_name: Optional[str]
+    ) -> AsyncIterator[str]:
+        """Write the report from the material gathered before the deadline, without further tool use."""
+        material = "\n\n".join(results)[:WRITEUP_CONTEXT_CHARS]
+        prompt = (
+            f"Research question: {query}\n\n"
+            "The research time budget has run out. Write the report now using only the material "
+            "gathered so far, and note where coverage is incomplete.\n\n"
+            f"Gathered material:\n{material or 'None'}\n\n"
+            f"Notes so far:\n{draft or 'None'}"
+        )
+        writer = self._create_agent(budget, model_name, tools=False)
+        logger.info(f"Writing up research after deadline from {len(results)} tool results")
+        
+        # @doc: https://docs.agno.com/agents/run
+        chunks = iterate_in_thread(lambda: writer.run(prompt, stream=True))
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(tracker.time_left(writing=True), 0))
+                except (StopAsyncIteration, asyncio.TimeoutError):
+                    break
+                content = chunk.content if isinstance(chunk, RunResponse) else str(chunk)
+                if not content:
+                    continue
+                yield content
+                if not tracker.record_output(content):
+                    break
+        finally:
+            await chunks.aclose()
@@ -0,0 +1,120 @@
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from agno.tools.exa import ExaTools
+from exa_py import Exa
+
+from app.core.config import (
+    EXA_BASE_URL,
+    EXA_RECORD_PATH,
+    KNOWLEDGE_MAX_AGE_SECONDS,
+    KNOWLEDGE_MIN_COVERAGE,
+    KNOWLEDGE_MIN_RESULTS,
+)
+from app.core.content_reduction import ContentReducer
+from app.core.knowledge_index import KnowledgeIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ResearchExaTools(ExaTools):
+    """
+    Exa tools for the research agent.
+
+    Every result set returned by search, contents and similar-page lookups
+    passes through _parse_results, where fetched documents are added to the
+    knowledge index and page text is reduced to the chunks most relevant to
+    the research query before the model sees it. Searches the index can
+    already cover are answered locally without calling Exa.
+    """
+
+    def __init__(
+        self,
+        research_query: str = "",
+        reducer: Optional[ContentReducer] = None,
+        knowledge: Optional[KnowledgeIndex] = None,
+        sources_left: Optional[Callable[[], int]] = None,
+        **kwargs: Any
+    ):
+        """
+        Args:
+            research_query: The query results are ranked against
+            reducer: Reducer applied to result text; None passes results through unchanged
+            knowledge: Index fetched documents are added to and searches answered from
+            sources_left: Sources the run's budget has left, capping the results a search asks for
+            **kwargs: Passed on to ExaTools
+        """
+        # @see: https://docs.agno.com/tools/toolkits/search/exa
+        super().__init__(**kwargs)
+        if EXA_BASE_URL:
+            # ExaTools always talks to the public API
+            self.exa = Exa(self.api_key, base_url=EXA_BASE_URL)
+        self.research_query = research_query
+        self.reducer = reducer
+        self.knowledge = knowledge
+        self.sources_left = sources_left
+        # Searches answered from the knowledge index during this run
+        self.local_searches = 0
+
+    def search_exa(self, query: str, num_results: int = 5, category: Optional[str] = None) -> str:
+        """Use this function to search Exa (a web search engine) for a query.
+
+        Args:
+            query (str): The query to search for.
+            num_results (int): Number of results to return. Defaults to 5.
+            category (Optional[str]): The category to filter search results.
+                Options are "company", "research paper", "news", "pdf", "github",
+                "tweet", "personal site", "linkedin profile", "financial report".
+
+        Returns:
+            str: The search results in JSON format.
+        """
+        if self.sources_left is not None:
+            num_results = max(min(num_results, self.sources_left()), 1)
+        if self.knowledge is not None and not category:
+            try:
+                local = self.knowledge.answer(
+                    query,
+                    num_results=self.num_results or num_results,
+                    max_age=KNOWLEDGE_MAX_AGE_SECONDS,
+                    min_results=KNOWLEDGE_MIN_RESULTS,
+                    min_coverage=KNOWLEDGE_MIN_COVERAGE,
+                )
+            except Exception as e:
+                logger.warning(f"Knowledge index lookup failed: {str(e)}")
+                local = None
+            if local is not None:
+                self.local_searches += 1
+                return self._present([{k: v for k, v in r.items() if k != "coverage"} for r in local])
+        return super().search_exa(query, num_results=num_results, category=category)
+
+    def _parse_results(self, exa_results: Any) -> str:
+        parsed = super()._parse_results(exa_results)
+        if EXA_RECORD_PATH:
+            self._record(parsed)
+        if self.knowledge is None and self.reducer is None:
+            return parsed
+
+        results = json.loads(parsed)
+        if self.knowledge is not None:
+            try:
+                self.knowledge.add(results)
+            except Exception as e:
+                logger.warning(f"Could not index Exa results: {str(e)}")
+        return self._present(results)
+
+    def _present(self, results: List[Dict[str, Any]]) -> str:
+        """Serialize results for the model, reducing their text first when a reducer is set."""
+        if self.reducer is None:
+            return json.dumps(results, indent=4)
+        reduced, _ = self.reducer.reduce(results, self.research_query)
+        return json.dumps(reduced, separators=(",", ":"))
+
+    def _record(self, parsed: str) -> None:
+        # Recorded results feed tests/benchmarks/bench_content_reduction.py
+        try:
+            with open(EXA_RECORD_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"query": self.research_query, "results": json.loads(parsed)}) + "\n")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not record Exa results: {str(e)}")
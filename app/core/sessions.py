@@ -0,0 +1,244 @@
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core import prefork
+from app.core.metrics import SESSION_CACHE_BYTES, SESSION_CACHE_EVICTIONS, SESSION_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# (role, content)
+Turn = Tuple[str, str]
+
+# Approximate per-message memory beyond its content (tuple, str headers, list slot)
+MESSAGE_OVERHEAD_BYTES = 120
+
+
+def _size(turns: Sequence[Turn]) -> int:
+    return sum(len(content) + MESSAGE_OVERHEAD_BYTES for _, content in turns)
+
+
+class _CachedSession:
+    __slots__ = ("turns", "size")
+
+    def __init__(self, turns: List[Turn]):
+        self.turns = turns
+        self.size = _size(turns)
+
+
+class SessionStore(prefork.SQLiteStore):
+    """
+    Conversation histories, kept in SQLite with an in-memory LRU in front.
+
+    Every turn is written to SQLite as it is appended, so evicting a session
+    from memory loses nothing and gunicorn workers see each other's turns;
+    a cached history is checked against the stored message count on every
+    read and topped up with only the turns it is missing. Cache memory is
+    bounded by max_bytes (content plus per-message overhead) and
+    max_sessions, evicting the least recently used sessions first.
+    """
+
+    def __init__(self, path: str, max_bytes: int, max_sessions: int, ttl: float, prune_every: int = 1000):
+        """
+        Args:
+            path: Location of the SQLite database file
+            max_bytes: Memory budget of the cached histories
+            max_sessions: Most sessions cached at once
+            ttl: Sessions idle longer than this many seconds are deleted
+            prune_every: Appends between deletions of idle sessions (per worker)
+        """
+        self._open(path)
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, _CachedSession]" = OrderedDict()
+        self._cache_bytes = 0
+        self._appends_since_prune = 0
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                messages INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)")
+
+        self.hits = 0
+        self.refreshes = 0
+        self.misses = 0
+        self.evictions = 0
+        logger.info(f"Session store opened at {path}")
+
+    def create(self) -> str:
+        """Start an empty session and return its id."""
+        session_id = secrets.token_urlsafe(16)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (id, messages, created_at, updated_at) VALUES (?, 0, ?, ?)",
+                (session_id, now, now),
+            )
+        return session_id
+
+    def get(self, session_id: str) -> Optional[List[Turn]]:
+        """
+        Return the session's history, or None if the session does not exist.
+
+        Served from memory when the cached copy is current; a copy that is
+        behind (turns appended by another worker) only loads the missing turns.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT messages FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                self._drop(session_id)
+                return None
+            stored = row[0]
+
+            cached = self._cache.get(session_id)
+            if cached is not None and len(cached.turns) == stored:
+                self.hits += 1
+                SESSION_CACHE_LOOKUPS.labels("hit").inc()
+                self._cache.move_to_end(session_id)
+                return list(cached.turns)
+
+            if cached is not None and len(cached.turns) < stored:
+                self.refreshes += 1
+                SESSION_CACHE_LOOKUPS.labels("refresh").inc()
+                turns = cached.turns + self._load(session_id, len(cached.turns))
+            else:
+                self.misses += 1
+                SESSION_CACHE_LOOKUPS.labels("miss").inc()
+                turns = self._load(session_id, 0)
+            self._put(session_id, turns)
+            return list(turns)
+
+    def append(self, session_id: str, turns: Sequence[Turn]) -> bool:
+        """
+        Add turns to the end of a session.
+
+        Returns:
+            False if the session does not exist.
+        """
+        if not turns:
+            return True
+        prune = False
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT messages FROM sessions WHERE id = ?", (session_id,)).fetchone()
+                if row is None:
+                    self._conn.execute("ROLLBACK")
+                    self._drop(session_id)
+                    return False
+                start = row[0]
+                self._conn.executemany(
+                    "INSERT INTO session_messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [(session_id, start + i, role, content) for i, (role, content) in enumerate(turns)],
+                )
+                self._conn.execute(
+                    "UPDATE sessions SET messages = ?, updated_at = ? WHERE id = ?",
+                    (start + len(turns), time.time(), session_id),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            cached = self._cache.get(session_id)
+            if cached is not None and len(cached.turns) == start:
+                self._put(session_id, cached.turns + list(turns))
+            elif cached is not None:
+                # Another worker appended in between; reload on the next read
+                self._drop(session_id)
+
+            self._appends_since_prune += 1
+            if self.prune_every and self._appends_since_prune >= self.prune_every:
+                self._appends_since_prune = 0
+                prune = True
+
+        if prune:
+            self.prune()
+        return True
+
+    def delete(self, session_id: str) -> bool:
+        """Delete a session and its history; returns whether it existed."""
+        with self._lock:
+            self._drop(session_id)
+            self._conn.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+            return self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def prune(self) -> int:
+        """Delete sessions idle for longer than the TTL; returns how many were deleted."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [r[0] for r in self._conn.execute("SELECT id FROM sessions WHERE updated_at < ?", (cutoff,))]
+            for session_id in expired:
+                self._drop(session_id)
+                self._conn.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        if expired:
+            logger.info(f"Deleted {len(expired)} idle sessions")
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return stored and cached session counts, cache memory and this worker's cache counters."""
+        with self._lock:
+            sessions, messages = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(messages), 0) FROM sessions").fetchone()
+            return {
+                "sessions": sessions,
+                "messages": messages,
+                "cached_sessions": len(self._cache),
+                "cache_bytes": self._cache_bytes,
+                "cache_max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "refreshes": self.refreshes,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _load(self, session_id: str, start: int) -> List[Turn]:
+        return self._conn.execute(
+            "SELECT role, content FROM session_messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+            (session_id, start),
+        ).fetchall()
+
+    def _put(self, session_id: str, turns: List[Turn]) -> None:
+        """Cache a history as most recently used and evict down to the memory bounds."""
+        self._drop(session_id)
+        entry = _CachedSession(turns)
+        if entry.size > self.max_bytes:
+            # Larger than the whole budget: always served from SQLite
+            return
+        self._cache[session_id] = entry
+        self._cache_bytes += entry.size
+        while self._cache_bytes > self.max_bytes or len(self._cache) > self.max_sessions:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted.size
+            self.evictions += 1
+            SESSION_CACHE_EVICTIONS.inc()
+        SESSION_CACHE_BYTES.set(self._cache_bytes)
+
+    def _drop(self, session_id: str) -> None:
+        entry = self._cache.pop(session_id, None)
+        if entry is not None:
+            self._cache_bytes -= entry.size
+            SESSION_CACHE_BYTES.set(self._cache_bytes)
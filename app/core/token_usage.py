@@ -0,0 +1,180 @@
+import contextvars
+import json
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from app.core import prefork
+from app.core.config import MODEL_NAME, MODEL_PRICES, TIKTOKEN_ENABLED, USAGE_MAX_CLIENTS
+from app.core.metrics import MODEL_COST, MODEL_TOKENS, add_known_models, model_label
+from app.core.research_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# List prices in USD per million (prompt, completion) tokens; the longest matching prefix wins
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o3-mini": (1.10, 4.40),
+    "o4-mini": (1.10, 4.40),
+}
+PRICES = dict(DEFAULT_PRICES, **{k: tuple(v) for k, v in json.loads(MODEL_PRICES).items()}) if MODEL_PRICES else DEFAULT_PRICES
+# Priced models get label values of their own in the token and cost metrics
+add_known_models(PRICES)
+
+# Chat formatting adds a few tokens per message (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CLIENT_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+client_var: contextvars.ContextVar[str] = contextvars.ContextVar("usage_client", default="anonymous")
+_usage_var: contextvars.ContextVar[Optional["TokenUsage"]] = contextvars.ContextVar("token_usage", default=None)
+_clients = set()
+_clients_lock = threading.Lock()
+
+# Encodings by name (o200k_base, cl100k_base, ...): a handful, however many model names clients send
+_encodings: Dict[str, Any] = {}
+_tokenizer_available = TIKTOKEN_ENABLED
+
+
+def resolve_client(header: Optional[str]) -> str:
+    """
+    Metrics label for the calling client, from its X-Client-ID header.
+
+    Label cardinality is bounded: malformed ids count as anonymous and clients
+    beyond USAGE_MAX_CLIENTS per worker as "other".
+    """
+    if not header or not _CLIENT_ID.match(header):
+        return "anonymous"
+    with _clients_lock:
+        if header in _clients:
+            return header
+        if len(_clients) >= USAGE_MAX_CLIENTS:
+            return "other"
+        _clients.add(header)
+        return header
+
+
+def _encoding(model: str) -> Any:
+    global _tokenizer_available
+    if not _tokenizer_available:
+        return None
+    try:
+        import tiktoken
+        from tiktoken.model import encoding_name_for_model
+        try:
+            name = encoding_name_for_model(model)
+        except KeyError:
+            # Unknown models count with the current models' encoding
+            name = "o200k_base"
+        if name not in _encodings:
+            _encodings[name] = tiktoken.get_encoding(name)
+    except Exception as e:
+        # Not installed, or the encoding could not be downloaded (offline hosts)
+        logger.warning(f"Token counts fall back to a length estimate, tiktoken is unavailable: {str(e)}")
+        _tokenizer_available = False
+        return None
+    return _encodings[name]
+
+
+@prefork.warm_up
+def _load_encodings() -> None:
+    """Load the tokenizers of the default and all priced models (tiktoken's BPE tables take tens of MB)."""
+    for model in [MODEL_NAME, *PRICES]:
+        _encoding(model)
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Count the tokens of text with the model's tokenizer, or estimate them from its length."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_prompt_tokens(contents: Iterable[Any], model: str) -> int:
+    """Estimate the prompt tokens of a list of message contents."""
+    return sum(count_tokens(c if isinstance(c, str) else str(c or ""), model) + MESSAGE_OVERHEAD_TOKENS for c in contents)
+
+
+def price(model: str) -> Optional[Tuple[float, float]]:
+    """USD per million (prompt, completion) tokens for a model, matched by longest prefix."""
+    matches = [name for name in PRICES if model == name or model.startswith(name + "-")]
+    return PRICES[max(matches, key=len)] if matches else None
+
+
+class TokenUsage:
+    """Tokens used by the model requests made for one API request."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.model_requests = 0
+        self.cost_usd = 0.0
+        self.priced = True
+        self.estimated = False
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens: int, completion_tokens: int, cost_usd: Optional[float], estimated: bool) -> None:
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.model_requests += 1
+            if cost_usd is None:
+                self.priced = False
+            else:
+                self.cost_usd += cost_usd
+            self.estimated = self.estimated or estimated
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Usage as returned in responses."""
+        with self._lock:
+            return {
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.prompt_tokens + self.completion_tokens,
+                "model_requests": self.model_requests,
+                # "estimate" when any model request came back without upstream usage
+                "token_source": "estimate" if self.estimated else "upstream",
+                "cost_usd": round(self.cost_usd, 6) if self.priced and self.model_requests else None,
+            }
+
+
+@contextmanager
+def track() -> Iterator[TokenUsage]:
+    """Collect the usage of every model request made in this context (including offloaded calls)."""
+    usage = TokenUsage()
+    token = _usage_var.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            _usage_var.reset(token)
+        except ValueError:
+            # Exited from another context (an async generator closed elsewhere)
+            pass
+
+
+def record(model: str, prompt_tokens: int, completion_tokens: int, estimated: bool) -> None:
+    """Record one model request in the per-model/per-client metrics and the tracked usage, if any."""
+    client = client_var.get()
+    label = model_label(model)
+    MODEL_TOKENS.labels(label, client, "prompt").inc(prompt_tokens)
+    MODEL_TOKENS.labels(label, client, "completion").inc(completion_tokens)
+    prices = price(model)
+    cost = None
+    if prices is not None:
+        cost = (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+        MODEL_COST.labels(label, client).inc(cost)
+    usage = _usage_var.get()
+    if usage is not None:
+        usage.add(prompt_tokens, completion_tokens, cost, estimated)
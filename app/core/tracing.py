@@ -0,0 +1,378 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.core.config import (
+    TRACE_BACKUP_COUNT,
+    TRACE_DIR,
+    TRACE_MAX_FILE_BYTES,
+    TRACE_MAX_TOTAL_BYTES,
+    TRACE_SAMPLE_RATE,
+    TRACING_ENABLED,
+)
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "agno-api"
+# Caller-supplied request ids are used only if they look like ids (keeps logs clean)
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+# Request id of the request being handled (from X-Request-ID or generated)
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    """Return the id of the request being handled, if any."""
+    return request_id_var.get()
+
+
+def resolve_request_id(header: Optional[str]) -> str:
+    """Use the caller's X-Request-ID when it is well formed, otherwise generate one."""
+    if header and _REQUEST_ID.match(header):
+        return header
+    return uuid.uuid4().hex
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    # OTLP/JSON AnyValue
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    sampled = True
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes or {}})
+
+    def record_error(self, error: BaseException) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self, duration_s: Optional[float] = None) -> None:
+        """
+        Finish the span and hand it to the exporter (idempotent).
+
+        Args:
+            duration_s: Known duration of the operation; the start is moved back
+                so the span ends now and lasts this long
+        """
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if duration_s is not None:
+            self.start_ns = self.end_ns - int(duration_s * 1e9)
+        if _exporter is not None:
+            _exporter.export(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """The span in OTLP/JSON form."""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _attribute_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = [
+                {
+                    "name": e["name"],
+                    "timeUnixNano": str(e["time_ns"]),
+                    "attributes": [{"key": k, "value": _attribute_value(v)} for k, v in e["attributes"].items()],
+                }
+                for e in self.events
+            ]
+        return span
+
+
+class _NoopSpan(Span):
+    """Stand-in for spans that are not recorded (tracing off or trace not sampled)."""
+
+    sampled = False
+
+    def __init__(self):
+        self.name = ""
+        self.trace_id = ""
+        self.span_id = ""
+        self.parent_id = None
+        self.attributes = {}
+        self.events = []
+        self.error = None
+        self.end_ns = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+    def end(self, duration_s: Optional[float] = None) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_INHERIT = object()
+
+
+def current_span() -> Optional[Span]:
+    """Return the active span, if any."""
+    return _current_span.get()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """Extract (trace_id, parent span id) from a W3C traceparent header."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def start_span(name: str, parent: Any = _INHERIT, attributes: Optional[Dict[str, Any]] = None, remote_parent: Optional[tuple] = None) -> Span:
+    """
+    Start a span without making it the active one.
+
+    Args:
+        name: Operation name
+        parent: Parent span; defaults to the active span, None starts a new trace
+        attributes: Initial attributes
+        remote_parent: (trace_id, span_id) of a caller's span, for new traces
+
+    Returns:
+        The span, or a no-op span when tracing is off or the trace is not sampled.
+    """
+    if _exporter is None:
+        return NOOP_SPAN
+    if parent is _INHERIT:
+        parent = _current_span.get()
+    if parent is not None:
+        if not parent.sampled:
+            return NOOP_SPAN
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+    if TRACE_SAMPLE_RATE < 1.0 and random.random() >= TRACE_SAMPLE_RATE:
+        return NOOP_SPAN
+    trace_id, parent_id = remote_parent or (os.urandom(16).hex(), None)
+    return Span(name, trace_id, parent_id, attributes)
+
+
+@contextmanager
+def use_span(span: Span) -> Iterator[Span]:
+    """Make span the active span for the duration of the block, without ending it."""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Exited from another context (an async generator closed elsewhere)
+            pass
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Run the block in a new child span of the active span."""
+    s = start_span(name, attributes=attributes)
+    with use_span(s):
+        try:
+            yield s
+        except BaseException as e:
+            s.record_error(e)
+            raise
+        finally:
+            s.end()
+
+
+class FileSpanExporter:
+    """
+    Write finished spans to a local file as OTLP/JSON lines.
+
+    Each line is an ExportTraceServiceRequest, the format read by the
+    OpenTelemetry Collector's otlpjsonfile receiver. Spans are queued and
+    written in batches by a background thread so request handling never waits
+    on disk. Every process writes its own file.
+
+    Like logging's RotatingFileHandler, a file that a write would take past
+    max_bytes is first renamed to .1 (older ones shifting up to
+    .backup_count, the oldest deleted) and a new one started. After each
+    rotation, the oldest span files in the directory, including those left
+    by exited workers, are deleted so it stays within max_total_bytes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        flush_interval: float = 1.0,
+        max_batch: int = 512,
+        max_bytes: int = 50 * 1024 * 1024,
+        backup_count: int = 3,
+        max_total_bytes: int = 1024 * 1024 * 1024,
+    ):
+        """
+        Args:
+            directory: Directory of the span files
+            flush_interval: Seconds the writer waits for spans before checking again
+            max_batch: Most spans written per line
+            max_bytes: Size at which a process's file is rotated
+            backup_count: Rotated files kept per process
+            max_total_bytes: Largest total size of the span files in the directory
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.max_total_bytes = max_total_bytes
+        self._queue: "queue.SimpleQueue[Span]" = queue.SimpleQueue()
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"spans-{os.getpid()}.jsonl")
+
+    def export(self, span: Span) -> None:
+        if self._pid != os.getpid():
+            self._start()
+        self._queue.put(span)
+
+    def _start(self) -> None:
+        # Started lazily so each forked worker gets its own writer thread
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.SimpleQueue()
+            threading.Thread(target=self._run, name="span-exporter", daemon=True).start()
+
+    def _drain(self, first: Optional[Span] = None) -> List[Span]:
+        batch = [first] if first is not None else []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            self.write(self._drain(first))
+
+    def flush(self) -> None:
+        """Write every queued span now."""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self.write(batch)
+
+    def write(self, spans: List[Span]) -> None:
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                ]},
+                "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": [s.to_otlp() for s in spans]}],
+            }]
+        }
+        try:
+            line = json.dumps(request, separators=(",", ":")) + "\n"
+            os.makedirs(self.directory, exist_ok=True)
+            try:
+                size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                size = 0
+            if size and size + len(line) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"Could not write {len(spans)} spans: {str(e)}")
+
+    def _rotate(self) -> None:
+        path = self.path
+        for i in range(self.backup_count, 0, -1):
+            source = f"{path}.{i - 1}" if i > 1 else path
+            if os.path.exists(source):
+                os.replace(source, f"{path}.{i}")
+        if os.path.exists(path):
+            os.remove(path)
+        self._prune()
+
+    def _prune(self) -> None:
+        """Delete the oldest span files until the directory has room for a new file within max_total_bytes."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("spans-") and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total + self.max_bytes <= self.max_total_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+_exporter: Optional[FileSpanExporter] = None
+
+
+def configure(exporter: Optional[FileSpanExporter]) -> None:
+    """Install the span exporter; None turns tracing off."""
+    global _exporter
+    _exporter = exporter
+
+
+if TRACING_ENABLED:
+    configure(FileSpanExporter(
+        TRACE_DIR, max_bytes=TRACE_MAX_FILE_BYTES, backup_count=TRACE_BACKUP_COUNT, max_total_bytes=TRACE_MAX_TOTAL_BYTES
+    ))
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.core.config import TRAFFIC_RECORD_PATH, TRAFFIC_RECORD_SALT
+
+logger = logging.getLogger(__name__)
+
+# Trace format version, written with every line
+TRACE_VERSION = 1
+
+_ROLES = {"user": "u", "assistant": "a", "system": "s", "tool": "t"}
+
+
+def fingerprint(text: str) -> str:
+    """
+    Short salted hash of a query, so a replay can repeat the queries that
+    repeated in production (report reuse, run coalescing) without their text.
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=6, key=TRAFFIC_RECORD_SALT.encode("utf-8")[:64]).hexdigest()
+
+
+def chat_shape(request: Any) -> Dict[str, Any]:
+    """Anonymized shape of a chat request: roles and sizes of its messages, never their content."""
+    return {
+        "model": request.model_name,
+        "stream": request.stream,
+        "max_tokens": request.max_tokens,
+        "messages": [[_ROLES.get(m.role, m.role[:1]), len(m.content)] for m in request.messages],
+    }
+
+
+def research_shape(request: Any) -> Dict[str, Any]:
+    """Anonymized shape of a research request: query size and fingerprint, and any budget overrides."""
+    shape = {
+        "model": request.model_name,
+        "stream": request.stream,
+        "query_chars": len(request.query),
+        "query": fingerprint(request.query),
+    }
+    for field in ("max_age_seconds", "max_tool_calls", "max_output_tokens", "max_sources", "deadline_seconds"):
+        value = getattr(request, field)
+        if value is not None:
+            shape[field] = value
+    return shape
+
+
+class TrafficRecorder:
+    """
+    Append one JSON line per recorded request to a trace file.
+
+    Lines are written with a single unbuffered append each, so gunicorn
+    workers can share one file; the replay tool orders them by arrival time.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._lock = threading.Lock()
+
+    def record(self, route: str, arrived: float, shape: Dict[str, Any], status: int, duration: float) -> None:
+        """
+        Args:
+            route: Route template of the request
+            arrived: Arrival time (epoch seconds)
+            shape: Request shape from chat_shape or research_shape
+            status: Response status code
+            duration: Seconds until the last byte of the response was sent
+        """
+        entry = {"v": TRACE_VERSION, "ts": round(arrived, 3), "route": route, **shape, "status": status, "ms": round(duration * 1000, 1)}
+        line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+        try:
+            with self._lock:
+                os.write(self._fd, line)
+        except OSError as e:
+            logger.warning(f"Could not record request shape: {str(e)}")
+
+
+def read_trace(paths: List[str]) -> List[Dict[str, Any]]:
+    """Load recorded requests from one or more trace files, ordered by arrival."""
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A worker killed mid-write leaves a partial last line
+                    continue
+    entries.sort(key=lambda e: e["ts"])
+    return entries
+
+
+recorder: Optional[TrafficRecorder] = TrafficRecorder(TRAFFIC_RECORD_PATH) if TRAFFIC_RECORD_PATH else None
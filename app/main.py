@@ -1,31 +1,86 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
-import logging
-import time
+from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
 
 from app.api.endpoints import router as api_router
-from app.core.config import API_V1_PREFIX, CORS_ORIGINS, ENVIRONMENT
+from app.api.admin import is_admin_key, router as admin_router
+from app.core.config import (
+    API_V1_PREFIX,
+    CONTINUOUS_PROFILING_ENABLED,
+    CORS_ORIGINS,
+    ENVIRONMENT,
+    LOOP_BLOCK_THRESHOLD_MS,
+    LOOP_MONITOR_ENABLED,
+    LOAD_SCORE_HEADER_ENABLED,
+    LOOP_MONITOR_INTERVAL_MS,
+    METRICS_ENABLED,
+)
 from app.core.logging_config import setup_logging
+from app.core import capacity, health, metrics, profiling
+from app.core.capacity import CapacityMiddleware
+from app.core.drain import DrainMiddleware, drain
+from app.core.health import LoadScoreMiddleware
+from app.core.loop_monitor import LoopMonitor
+from app.core.request_middleware import RequestMiddleware
 
 # Set up logging
 logger = setup_logging()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run per-worker background monitors for the life of the server."""
+    # Started here rather than at import so that, with the app preloaded in the gunicorn master, it runs in every worker
+    if CONTINUOUS_PROFILING_ENABLED:
+        profiling.start_continuous_profiler()
+    monitor = None
+    if LOOP_MONITOR_ENABLED:
+        monitor = LoopMonitor(interval=LOOP_MONITOR_INTERVAL_MS / 1000, threshold=LOOP_BLOCK_THRESHOLD_MS / 1000)
+        monitor.start()
+        health.probe.monitor = monitor
+    if capacity.controller is not None:
+        capacity.controller.start(monitor)
+    # The server has installed its signal handlers by now; SIGTERM drains requests in flight before they run
+    drain.install()
+    yield
+    if capacity.controller is not None:
+        await capacity.controller.stop()
+    if monitor is not None:
+        health.probe.monitor = None
+        await monitor.stop()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Agno Chat API",
     description="A simple API for chatting with an AI agent using the Agno framework",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
+# Chat and research requests over the worker's in-flight limit are refused with a 503
+# (added first, so it runs inside CORS and the refusals carry its headers)
+if capacity.controller is not None:
+    app.add_middleware(CapacityMiddleware, controller=capacity.controller, paths=capacity.LIMITED_PATHS)
+
+# New requests are refused with a 503 while the worker drains for shutdown; requests in flight are counted
+# (outside the capacity limit, so refusals don't take its slots; inside CORS, so they carry its headers)
+app.add_middleware(DrainMiddleware, drain=drain)
+
+# Every response reports the worker's load score, so a balancer can weight workers by it
+if LOAD_SCORE_HEADER_ENABLED:
+    app.add_middleware(LoadScoreMiddleware, probe=health.probe)
+
 # Add CORS middleware with proper settings for production
 app.add_middleware(
     CORSMiddleware,
     allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST"],
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", "X-Request-ID", "X-Client-ID"],
+    expose_headers=["X-Request-ID", "Retry-After", "X-Load-Score"],
 )
 
 # Add trusted host middleware for production
@@ -36,45 +91,34 @@ if ENVIRONMENT == "production":
 
 # Include routers
 app.include_router(api_router, prefix=API_V1_PREFIX)
+app.include_router(admin_router, prefix=f"{API_V1_PREFIX}/admin")
+
+# Request id, tracing, profiling, metrics and logging (outermost, so it sees CORS and trusted host responses)
+app.add_middleware(RequestMiddleware, is_admin=is_admin_key)
 
-# Add request logging middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    
-    # Log request details
-    logger.info(
-        f"Request: {request.method} {request.url.path}",
-        extra={
-            "method": request.method,
-            "path": request.url.path,
-            "client_ip": request.client.host if request.client else "unknown",
-        }
-    )
-    
-    try:
-        response = await call_next(request)
-        
-        # Log response time
-        process_time = time.time() - start_time
-        logger.info(
-            f"Response: {response.status_code} took {process_time:.3f}s",
-            extra={
-                "status_code": response.status_code,
-                "process_time": process_time
-            }
-        )
-        
-        return response
-    except Exception as e:
-        logger.error(f"Request failed: {str(e)}", exc_info=True)
-        return JSONResponse(
-            status_code=500,
-            content={"detail": "Internal server error"}
-        )
+
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        """Prometheus metrics, aggregated across gunicorn workers when PROMETHEUS_MULTIPROC_DIR is set."""
+        content, content_type = metrics.render()
+        return Response(content=content, media_type=content_type)
 
 
 @app.get("/")
 async def root():
     """Root endpoint for health check."""
-    return {"message": "Welcome to Agno Chat API", "status": "healthy"} 
\ No newline at end of file
+    return {"message": "Welcome to Agno Chat API", "status": "healthy"} 
+
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness probe: the worker's event loop is responding (also while it drains)."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness probe: 503 while the worker drains or is saturated, with the signals it was decided on."""
+    readiness = health.probe.readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
@@ -13,18 +13,72 @@ class StreamingChunk(BaseModel):
     content: str = Field(..., description="Partial content chunk for streaming")
     done: bool = Field(False, description="Whether this is the last chunk")
     model: Optional[str] = None
+    usage: Optional[dict] = Field(None, description="Token usage, on the last chunk")
+    session_id: Optional[str] = Field(None, description="The conversation session, on the last chunk")
+    routing: Optional[dict] = Field(None, description="How the model was chosen for model_name=auto, on the last chunk")
 
 
 class ChatRequest(BaseModel):
     """Chat request model."""
-    messages: List[ChatMessage] = Field(..., description="List of previous messages in the conversation")
+    messages: List[ChatMessage] = Field(
+        ...,
+        description="Messages of the conversation; with a session_id, only the new messages (the rest is kept by the server)"
+    )
     max_tokens: Optional[int] = Field(1000, description="Maximum number of tokens to generate")
-    model_name: Optional[str] = Field(None, description="The name of the model to use (e.g., gpt-4, gpt-3.5-turbo)")
+    model_name: Optional[str] = Field(
+        None,
+        description="The name of the model to use (e.g., gpt-4, gpt-3.5-turbo), or auto to let the server choose"
+    )
     stream: bool = Field(False, description="Whether to stream the response or not")
+    session_id: Optional[str] = Field(None, description="A session from POST /sessions whose stored history precedes messages")
 
 
 class ChatResponse(BaseModel):
     """Chat response model."""
     message: ChatMessage
-    usage: Optional[dict] = None
-    model: Optional[str] = None 
\ No newline at end of file
+    usage: Optional[dict] = Field(
+        None,
+        description="Token usage: prompt_tokens, completion_tokens, total_tokens, model_requests, token_source (upstream or estimate) and cost_usd"
+    )
+    model: Optional[str] = None
+    session_id: Optional[str] = Field(None, description="The conversation session the turn was added to")
+    routing: Optional[dict] = Field(None, description="How the model was chosen for model_name=auto: model, reason and complexity")
+
+
+class SessionResponse(BaseModel):
+    """A conversation session and its stored history."""
+    session_id: str
+    messages: List[ChatMessage] = Field(default_factory=list, description="The stored history, oldest first")
+
+
+class CompareRequest(BaseModel):
+    """Request to send one conversation to several models at once."""
+    messages: List[ChatMessage] = Field(..., description="Messages of the conversation, sent to every model")
+    models: Optional[List[str]] = Field(None, description="Models to compare (defaults to the server's COMPARE_MODELS)")
+    max_tokens: Optional[int] = Field(1000, description="Maximum number of tokens to generate per model")
+    stream: bool = Field(False, description="Whether to stream the replies interleaved as they arrive")
+
+
+class CompareResult(BaseModel):
+    """The reply of one model of a comparison, with its latency and token usage."""
+    model: str
+    content: Optional[str] = Field(None, description="The whole reply (not included when streaming)")
+    usage: Optional[dict] = Field(None, description="Token usage of the model's reply")
+    latency_ms: float = Field(..., description="Time from the start of the comparison to the end of the reply")
+    ttft_ms: Optional[float] = Field(None, description="Time from the start of the comparison to the first token")
+    error: Optional[str] = Field(None, description="Why the model failed, if it did")
+
+
+class CompareChunk(BaseModel):
+    """Streaming chunk of a comparison: content tagged with its model, a model's result, or the summary."""
+    model: Optional[str] = Field(None, description="The model the content is from")
+    content: str = Field("", description="Partial content chunk of the model's reply")
+    finished: bool = Field(False, description="Whether the model's reply is complete (its result is in result)")
+    result: Optional[CompareResult] = None
+    done: bool = Field(False, description="Whether this is the last chunk (the results of all models are in results)")
+    results: Optional[List[CompareResult]] = None
+
+
+class CompareResponse(BaseModel):
+    """Replies of all compared models, in the order they were requested."""
+    results: List[CompareResult]
@@ -1,4 +1,4 @@
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 
 from pydantic import BaseModel, Field
 
@@ -10,17 +10,55 @@ class ResearchRequest(BaseModel):
     query: str = Field(..., description="The research query to investigate")
     model_name: str = Field(default=MODEL_NAME, description="The model to use for research")
     stream: bool = Field(default=False, description="Whether to stream the response")
+    max_age_seconds: Optional[int] = Field(
+        default=None,
+        description="Reuse a stored report younger than this many seconds (0 forces a fresh run, None uses the server default)"
+    )
+    max_tool_calls: Optional[int] = Field(
+        default=None, ge=1,
+        description="Maximum tool calls for this run (capped at the server default)"
+    )
+    max_output_tokens: Optional[int] = Field(
+        default=None, ge=1,
+        description="Maximum generated tokens for this run (capped at the server default)"
+    )
+    max_sources: Optional[int] = Field(
+        default=None, ge=1,
+        description="Maximum distinct sources fetched for this run (capped at the server default)"
+    )
+    deadline_seconds: Optional[float] = Field(
+        default=None, gt=0,
+        description="Wall-clock deadline for this run in seconds (capped at the server default)"
+    )
 
 
 class ResearchResponse(BaseModel):
     """Response model for research endpoint."""
     message: Dict[str, str] = Field(..., description="The research response message")
     model: str = Field(..., description="The model used for research")
-    usage: Optional[Dict[str, int]] = Field(None, description="Token usage statistics")
+    usage: Optional[Dict[str, Any]] = Field(
+        None,
+        description=(
+            "Budget consumed: tool_calls, sources, output_tokens, elapsed_ms and budget_exhausted (the budget that ran out, if any, "
+            "or drain when the server shutting down cut the run short); "
+            "and token usage: prompt_tokens, completion_tokens, total_tokens, model_requests, token_source and cost_usd"
+        )
+    )
+    cached: bool = Field(default=False, description="Whether the report was served from the report store")
 
 
 class StreamingChunk(BaseModel):
     """Model for streaming research chunks."""
+    type: str = Field(
+        default="content",
+        description="Event type: tool_call_started, tool_call_finished, content, done or error"
+    )
     content: str = Field(..., description="The content of this chunk")
     done: bool = Field(..., description="Whether this is the final chunk")
-    model: str = Field(..., description="The model used for this chunk") 
\ No newline at end of file
+    model: str = Field(..., description="The model used for this chunk")
+    cached: bool = Field(default=False, description="Whether the report was served from the report store")
+    tool: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Tool call details for tool_call_started and tool_call_finished events"
+    )
+    usage: Optional[Dict[str, Any]] = Field(default=None, description="Budget consumed and token usage, on the done event") 
\ No newline at end of file
@@ -3,7 +3,7 @@ set -e
 
 # Function to handle shutdown signal
 function handle_sigterm() {
-    echo "Received SIGTERM, shutting down gracefully..."
+    echo "Received SIGTERM, draining in-flight requests (up to ${DRAIN_TIMEOUT_SECONDS:-25}s) before shutting down..."
     kill -TERM "$child_pid"
     wait "$child_pid"
     echo "Server stopped, exiting."
@@ -23,9 +23,11 @@ fi
 
 # Set number of workers based on available CPUs if not specified
 if [ -z "$WORKERS" ]; then
-    WORKERS=$(nproc --all)
-    # Use at least 1 worker, at most 4
-    WORKERS=$((WORKERS > 4 ? 4 : WORKERS))
+    # One event loop per CPU, up to MAX_WORKERS: every worker has its own SQLite connections and
+    # offload threads. /api/v1/admin/capacity reports a recommended worker count
+    MAX_WORKERS=${MAX_WORKERS:-8}
+    WORKERS=$(nproc)
+    WORKERS=$((WORKERS > MAX_WORKERS ? MAX_WORKERS : WORKERS))
     WORKERS=$((WORKERS < 1 ? 1 : WORKERS))
 fi
 
@@ -43,11 +45,19 @@ echo "Configuration:"
 echo "- Environment: ${ENVIRONMENT:-development}"
 echo "- Workers: $WORKERS"
 echo "- Log Level: $LOG_LEVEL"
+echo "- Preload App: ${PRELOAD_APP:-true}"
 
 # Start server with proper settings
 if [ "$ENVIRONMENT" = "production" ]; then
+    # Workers share metrics through this directory (cleared by gunicorn.conf.py on start)
+    export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+    # The worker count the app's capacity controller bases its recommendation on
+    export WEB_CONCURRENCY=$WORKERS
+
     # Use Gunicorn with Uvicorn workers in production
     gunicorn app.main:app \
+        --config gunicorn.conf.py \
         --bind 0.0.0.0:8000 \
         --workers $WORKERS \
         --worker-class uvicorn.workers.UvicornWorker \
@@ -0,0 +1,58 @@
+"""
+Gunicorn settings shared by every worker.
+
+Command-line flags in entrypoint.sh (bind, workers, timeout) take precedence;
+this file holds the server hooks.
+
+With PRELOAD_APP=true (the default) the app is imported once in the master
+and workers are forked from it, sharing its modules and warmed caches
+copy-on-write instead of each importing agno, openai and exa and loading
+its own tokenizers. Per-process state is set up again in each worker
+(see app/core/prefork.py).
+"""
+import gc
+import math
+import os
+import shutil
+
+preload_app = os.environ.get("PRELOAD_APP", "true").lower() == "true"
+
+# Workers drain for up to DRAIN_TIMEOUT_SECONDS on SIGTERM (see app/core/drain.py);
+# the master kills the ones still running this much later
+graceful_timeout = math.ceil(float(os.environ.get("DRAIN_TIMEOUT_SECONDS", "25"))) + 10
+
+if preload_app:
+    # Collections in the master would leave freed holes in pages the workers then share;
+    # workers turn the collector back on (see post_fork)
+    gc.disable()
+
+
+def on_starting(server):
+    """Start each server run with an empty Prometheus multiprocess directory."""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        # Samples left over from a previous run would be aggregated into this one
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def pre_fork(server, worker):
+    """Warm shared caches, close SQLite connections and freeze the master's objects before forking."""
+    if server.cfg.preload_app:
+        from app.core import prefork
+        prefork.prepare_master()
+
+
+def post_fork(server, worker):
+    """Restart the log writer and offload pool, reopen SQLite connections and drop inherited HTTP clients."""
+    if server.cfg.preload_app:
+        gc.enable()
+        from app.core import prefork
+        prefork.prepare_worker()
+
+
+def child_exit(server, worker):
+    """Drop the live gauges of a worker that exited so they stop counting towards the totals."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,116 @@
+"""
+Compare server configurations under the same load against the fake upstream.
+
+Runs the API under gunicorn (gunicorn.conf.py) once per combination of:
+
+- workers:  gunicorn worker processes (--workers, e.g. 1,2,4)
+- server:   uvloop+httptools (uvicorn's UvicornWorker, which picks them when
+            installed) or asyncio+h11 (UvicornH11Worker)
+- capacity: the capacity controller on (offload pool and in-flight limit
+            sized from observed load) or off (the fixed OFFLOAD_THREADS pool)
+
+and drives each with the bench_load scenarios at a fixed concurrency. Reports
+throughput, latency and TTFT percentiles, refusals (503s) and the offload
+threads and recommended worker count the controllers arrived at, read from
+/metrics after the run.
+
+The defaults send more concurrent streams than one worker's default pool of
+32 offload threads, so a fixed pool queues streams behind each other.
+
+Usage:
+    python tests/benchmarks/bench_capacity.py --workers 1,2,4 --concurrency 96 --requests 400
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_load import SCENARIOS, run_scenario  # noqa: E402
+from bench_worker_memory import gunicorn_stack  # noqa: E402
+
+SERVERS = {
+    "uvloop+httptools": "uvicorn.workers.UvicornWorker",
+    "asyncio+h11": "uvicorn.workers.UvicornH11Worker",
+}
+
+
+def read_gauges(base_url: str, names: List[str]) -> Dict[str, float]:
+    """Unlabelled metric values from /metrics (aggregated over the workers)."""
+    text = httpx.get(f"{base_url}/metrics", timeout=10).text
+    values = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] in names:
+            values[parts[0]] = float(parts[1])
+    return values
+
+
+def run_config(workers: int, server: str, capacity: bool, args) -> Dict[str, Any]:
+    env = {
+        "CAPACITY_CONTROL_ENABLED": "true" if capacity else "false",
+        "CAPACITY_INTERVAL_SECONDS": str(args.interval),
+    }
+    with gunicorn_stack(workers, worker_class=SERVERS[server], upstream_args=args.upstream_arg, extra_env=env) as (base_url, _, _):
+        result = asyncio.run(
+            run_scenario(base_url, args.scenario, args.requests, args.concurrency, warmup=args.warmup, max_tokens=args.max_tokens)
+        )
+        result.update(read_gauges(base_url, ["offload_threads", "capacity_recommended_workers", "capacity_rejected_requests_total"]))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare worker counts, uvloop/httptools and the capacity controller under load")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated gunicorn worker counts")
+    parser.add_argument("--server", action="append", choices=sorted(SERVERS), help="Server stack (repeatable; default: both)")
+    parser.add_argument("--capacity", action="append", choices=["on", "off"], help="Capacity controller (repeatable; default: both)")
+    parser.add_argument("--scenario", default="chat-stream", choices=sorted(SCENARIOS), help="bench_load scenario to run")
+    parser.add_argument("--concurrency", type=int, default=96, help="Requests in flight")
+    parser.add_argument("--requests", type=int, default=400, help="Requests per configuration")
+    parser.add_argument("--warmup", type=int, default=8, help="Unrecorded requests sent first")
+    parser.add_argument("--max-tokens", type=int, default=200, help="max_tokens for chat requests")
+    parser.add_argument("--interval", type=float, default=1.0, help="CAPACITY_INTERVAL_SECONDS for the run")
+    parser.add_argument(
+        "--upstream-arg", action="append",
+        help="Fake upstream option (repeatable; default: --latency-ms=300 --tokens-per-second=100 --completion-tokens=60)",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+    if args.upstream_arg is None:
+        args.upstream_arg = ["--latency-ms=300", "--tokens-per-second=100", "--completion-tokens=60"]
+
+    results = {}
+    configs = itertools.product(
+        [int(w) for w in args.workers.split(",")], args.server or list(SERVERS), args.capacity or ["off", "on"]
+    )
+    for workers, server, capacity in configs:
+        name = f"{workers}w {server} capacity={capacity}"
+        results[name] = run_config(workers, server, capacity == "on", args)
+        print(f"done: {name}", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'configuration':<38} {'req/s':>7} {'err':>5} {'503':>5} {'lat p50':>8} {'p99':>7} {'ttft p50':>9} {'p99':>7} "
+          f"{'threads':>8} {'rec. workers':>13}")
+
+    def get(result, metric, key):
+        return f"{result[metric][key]:.0f}" if result.get(metric) else "-"
+
+    for name, r in results.items():
+        print(
+            f"{name:<38} {r['throughput_rps']:>7.1f} {r['errors']:>5} {r.get('capacity_rejected_requests_total', 0):>5.0f} "
+            f"{get(r, 'latency_ms', 'p50'):>8} {get(r, 'latency_ms', 'p99'):>7} {get(r, 'ttft_ms', 'p50'):>9} "
+            f"{get(r, 'ttft_ms', 'p99'):>7} {r.get('offload_threads', 0):>8.0f} {r.get('capacity_recommended_workers', 0) or '-':>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
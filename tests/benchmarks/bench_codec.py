@@ -0,0 +1,179 @@
+"""
+Benchmark request decoding/validation, response encoding and SSE encoding.
+
+Clients resend the full conversation with every chat request, so request
+bodies grow with the history. For each history size this reports the time
+per request for:
+
+- request:  JSON decoding plus ChatRequest validation (stdlib json, orjson,
+            and pydantic's validate_json for reference)
+- asgi:     a whole POST through a FastAPI route, with the default route
+            versus CodecRoute
+
+and, independent of the history size:
+
+- response: encoding a ChatResponse the way FastAPI does for a
+            response_model (re-validate, then serialize) versus serializing
+            it without the re-validation
+- sse:      encoding a streamed event (chunk.dict() or a dict through
+            json.dumps, versus codec.sse)
+
+Every case is timed as the best of --repeat runs of --number calls.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import timeit
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+# The app config requires API keys; the benchmark never calls the APIs
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("EXA_API_KEY", "benchmark")
+
+from fastapi import APIRouter, FastAPI  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from app.core import codec  # noqa: E402
+from app.models.chat import ChatMessage, ChatRequest, ChatResponse, StreamingChunk  # noqa: E402
+
+SENTENCE = "Could you compare the projected costs of offshore wind with utility scale solar over the next decade? "
+
+
+def history(messages, chars):
+    """A request body with messages alternating between user and assistant."""
+    text = (SENTENCE * (chars // len(SENTENCE) + 1))[:chars]
+    return {
+        "messages": [{"role": "user" if i % 2 == 0 else "assistant", "content": text} for i in range(messages)],
+        "max_tokens": 500,
+        "model_name": "gpt-4o-mini",
+    }
+
+
+def reply(chars):
+    return ChatResponse(
+        message=ChatMessage(role="assistant", content=(SENTENCE * (chars // len(SENTENCE) + 1))[:chars]),
+        usage={"prompt_tokens": 1200, "completion_tokens": 300, "total_tokens": 1500, "model_requests": 1,
+               "token_source": "upstream", "cost_usd": 0.0012},
+    )
+
+
+def best(func, number, repeat):
+    """Best time per call in microseconds."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def asgi_app(fast):
+    """A FastAPI app with one chat-like route, using the default or the fast codec path."""
+    app = FastAPI()
+    router = APIRouter(route_class=codec.CodecRoute) if fast else APIRouter()
+    response = reply(2000)
+
+    @router.post("/chat", response_model=ChatResponse)
+    async def chat(request: ChatRequest):
+        return response
+
+    app.include_router(router)
+    return app
+
+
+def asgi_caller(app, body):
+    """Call the ASGI app with one POST request carrying body, without a network or HTTP client."""
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "POST", "path": "/chat", "raw_path": b"/chat",
+        "root_path": "", "scheme": "http", "query_string": b"", "server": ("bench", 80), "client": ("bench", 1),
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    }
+    loop = asyncio.new_event_loop()
+
+    async def call():
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        await app(dict(scope), receive, send)
+        assert sent[0]["status"] == 200, sent
+
+    return lambda: loop.run_until_complete(call())
+
+
+def run(sizes, chars, reply_chars, number, repeat):
+    # The field FastAPI builds for response_model=ChatResponse
+    field = create_model_field(name="Response_chat", type_=ChatResponse, mode="serialization")
+    response = reply(reply_chars)
+    chunk = StreamingChunk(content="The projected levelized cost of", done=False, model="gpt-4o-mini")
+    event = {"type": "content", "content": "The projected levelized cost of", "done": False, "model": "gpt-4o-mini"}
+    default_app, fast_app = asgi_app(False), asgi_app(True)
+
+    rows = []
+    for size in sizes:
+        body = json.dumps(history(size, chars)).encode("utf-8")
+        n = max(1, number // max(1, size // 10))
+        row = {"messages": size, "body_kb": round(len(body) / 1024, 1)}
+        row["request_json_us"] = best(lambda: ChatRequest.model_validate(json.loads(body)), n, repeat)
+        if codec.orjson is not None:
+            row["request_orjson_us"] = best(lambda: ChatRequest.model_validate(codec.orjson.loads(body)), n, repeat)
+        row["request_validate_json_us"] = best(lambda: ChatRequest.model_validate_json(body), n, repeat)
+        row["asgi_default_us"] = best(asgi_caller(default_app, body), n, repeat)
+        row["asgi_codec_us"] = best(asgi_caller(fast_app, body), n, repeat)
+        rows.append(row)
+
+    def validated_dump():
+        value, _ = field.validate(response, {}, loc=("response",))
+        return field.serialize_json(value)
+
+    encoding = {
+        "reply_kb": round(reply_chars / 1024, 1),
+        "response_default_us": best(validated_dump, number, repeat),
+        "response_serialize_only_us": best(lambda: field.serialize_json(response), number, repeat),
+    }
+    with warnings.catch_warnings():
+        # .dict() is deprecated in pydantic 2, which is part of what it cost
+        warnings.simplefilter("ignore")
+        encoding["sse_model_default_us"] = best(lambda: f"data: {json.dumps(chunk.dict())}\n\n", number * 10, repeat)
+    encoding["sse_model_codec_us"] = best(lambda: codec.sse(chunk), number * 10, repeat)
+    encoding["sse_dict_default_us"] = best(lambda: f"data: {json.dumps(event)}\n\n", number * 10, repeat)
+    encoding["sse_dict_codec_us"] = best(lambda: codec.sse(event), number * 10, repeat)
+    return rows, encoding
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request validation and response/SSE encoding")
+    parser.add_argument("--messages", default="10,100,500,2000", help="Comma-separated history sizes")
+    parser.add_argument("--chars", type=int, default=400, help="Characters per message")
+    parser.add_argument("--reply-chars", type=int, default=8000, help="Characters in the encoded response")
+    parser.add_argument("--number", type=int, default=500, help="Calls per timing run (scaled down for large histories)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per case")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.messages.split(",")]
+    rows, encoding = run(sizes, args.chars, args.reply_chars, args.number, args.repeat)
+    if args.json:
+        print(json.dumps({"fast_json": codec.FAST_JSON, "requests": rows, "encoding": encoding}, indent=2))
+        return
+
+    print(f"JSON backend: {'orjson' if codec.FAST_JSON else 'stdlib json'}\n")
+    print(f"{'messages':>8} {'body KB':>8} {'json+val':>9} {'orjson+val':>11} {'val_json':>9} {'asgi default':>13} {'asgi codec':>11} {'gain':>5}")
+    for r in rows:
+        print(
+            f"{r['messages']:>8} {r['body_kb']:>8} {r['request_json_us']:>9.0f} {r.get('request_orjson_us', float('nan')):>11.0f} "
+            f"{r['request_validate_json_us']:>9.0f} {r['asgi_default_us']:>13.0f} {r['asgi_codec_us']:>11.0f} "
+            f"{1 - r['asgi_codec_us'] / r['asgi_default_us']:>5.0%}"
+        )
+    e = encoding
+    print(f"\nResponse ({e['reply_kb']} KB): re-validate+serialize {e['response_default_us']:.1f}us, serialize only {e['response_serialize_only_us']:.1f}us")
+    print(f"SSE chunk (model): dict()+json.dumps {e['sse_model_default_us']:.2f}us, codec.sse {e['sse_model_codec_us']:.2f}us")
+    print(f"SSE event (dict):  json.dumps {e['sse_dict_default_us']:.2f}us, codec.sse {e['sse_dict_codec_us']:.2f}us")
+    print("(times in microseconds per call)")
+
+
+if __name__ == "__main__":
+    main()
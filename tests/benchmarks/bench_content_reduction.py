@@ -0,0 +1,94 @@
+"""
+Benchmark the source content reduction pipeline on recorded Exa results.
+
+Reports how many prompt tokens the reducer saves and how long it takes per
+result set. By default it runs on the bundled sample pages; record real ones
+by running the API with EXA_RECORD_PATH set and pass that file with --pages.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+# The app config requires API keys; the benchmark never calls the APIs
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("EXA_API_KEY", "benchmark")
+
+from app.core.config import CONTENT_CHUNK_TOKENS, CONTENT_TOKEN_BUDGET, CONTENT_TOP_K  # noqa: E402
+from app.core.content_reduction import ContentReducer  # noqa: E402
+
+SAMPLE_PAGES = Path(__file__).parent / "data" / "sample_pages.json"
+
+
+def load_recordings(path):
+    """Load result sets from a single JSON document or a JSON-lines recording."""
+    text = Path(path).read_text(encoding="utf-8")
+    try:
+        data = json.loads(text)
+        return data if isinstance(data, list) else [data]
+    except ValueError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def run_benchmark(recordings, token_budget, top_k, chunk_tokens, repeat):
+    """Reduce every recorded result set and collect sizes and timings."""
+    rows = []
+    for recording in recordings:
+        timings = []
+        for _ in range(repeat):
+            # A fresh reducer per pass so cross-call deduplication doesn't skew repeats
+            reducer = ContentReducer(token_budget=token_budget, top_k=top_k, chunk_tokens=chunk_tokens)
+            started = time.perf_counter()
+            _, stats = reducer.reduce(recording["results"], recording.get("query", ""))
+            timings.append(time.perf_counter() - started)
+        rows.append({
+            "query": recording.get("query", ""),
+            "sources": len(recording["results"]),
+            "input_tokens": stats.input_tokens,
+            "output_tokens": stats.output_tokens,
+            "chunks": stats.chunks,
+            "duplicates": stats.duplicates,
+            "selected": stats.selected,
+            "ms": min(timings) * 1000,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark research source content reduction")
+    parser.add_argument("--pages", default=str(SAMPLE_PAGES), help="Recorded Exa results (JSON or JSON lines)")
+    parser.add_argument("--token-budget", type=int, default=CONTENT_TOKEN_BUDGET, help="Token budget per result set")
+    parser.add_argument("--top-k", type=int, default=CONTENT_TOP_K, help="Maximum chunks kept per result set")
+    parser.add_argument("--chunk-tokens", type=int, default=CONTENT_CHUNK_TOKENS, help="Target chunk size in tokens")
+    parser.add_argument("--repeat", type=int, default=20, help="Timing repetitions per result set")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.pages):
+        print(f"Recording not found: {args.pages}")
+        sys.exit(1)
+
+    rows = run_benchmark(load_recordings(args.pages), args.token_budget, args.top_k, args.chunk_tokens, args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'sources':>7} {'in tokens':>10} {'out tokens':>10} {'saved':>6} {'chunks':>6} {'dupes':>5} {'ms':>7}  query")
+    for row in rows:
+        saved = 1 - row["output_tokens"] / row["input_tokens"] if row["input_tokens"] else 0.0
+        print(
+            f"{row['sources']:>7} {row['input_tokens']:>10} {row['output_tokens']:>10} {saved:>6.0%} "
+            f"{row['chunks']:>6} {row['duplicates']:>5} {row['ms']:>7.2f}  {row['query'][:50]}"
+        )
+
+    total_in = sum(row["input_tokens"] for row in rows)
+    total_out = sum(row["output_tokens"] for row in rows)
+    if total_in:
+        print(f"\nPrompt size reduced from {total_in} to {total_out} tokens ({1 - total_out / total_in:.0%} smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Measure what context compaction saves over a long conversation.
+
+Runs the API against the fake upstream twice, with CONTEXT_COMPACTION_ENABLED
+off and on, and has the same conversation with it through a session. The
+fake upstream adds --prefill-ms-per-1k delay per 1000 prompt tokens, the way
+an upstream model takes longer to process longer prompts. Reported per run:
+
+- prompt tokens per turn (all model requests, including summaries) and in total
+- latency per turn, over the whole conversation and its last turns
+- summary requests made and how turns were served (cached/extended/new)
+
+Usage:
+    python tests/benchmarks/bench_context.py --turns 60 --prefill-ms-per-1k 40
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_load import local_stack  # noqa: E402
+
+SENTENCE = "Tell me more about how offshore wind farms are maintained in winter storms. "
+
+
+def converse(base_url, turns, chars, max_tokens):
+    """Have one conversation through a session; returns one sample per turn."""
+    message = (SENTENCE * (chars // len(SENTENCE) + 1))[:chars]
+    samples = []
+    with httpx.Client(base_url=base_url, timeout=120) as client:
+        session_id = client.post("/api/v1/sessions").json()["session_id"]
+        for turn in range(turns):
+            started = time.perf_counter()
+            response = client.post("/api/v1/chat", json={
+                "session_id": session_id,
+                "messages": [{"role": "user", "content": f"({turn}) {message}"}],
+                "max_tokens": max_tokens,
+            })
+            latency = (time.perf_counter() - started) * 1000
+            response.raise_for_status()
+            usage = response.json()["usage"]
+            samples.append({"latency_ms": latency, "prompt_tokens": usage["prompt_tokens"], "context": usage.get("context")})
+    return samples
+
+
+def summarize(samples, tail):
+    last = samples[-tail:]
+    outcomes = {}
+    for s in samples:
+        if s["context"]:
+            outcomes[s["context"]["summary"]] = outcomes.get(s["context"]["summary"], 0) + 1
+    return {
+        "turns": len(samples),
+        "prompt_tokens_total": sum(s["prompt_tokens"] for s in samples),
+        "prompt_tokens_last": round(statistics.mean(s["prompt_tokens"] for s in last)),
+        "latency_ms_mean": round(statistics.mean(s["latency_ms"] for s in samples), 1),
+        "latency_ms_last": round(statistics.mean(s["latency_ms"] for s in last), 1),
+        "summary_requests": sum(s["context"]["summary_requests"] for s in samples if s["context"]),
+        "compacted_turns": outcomes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure prompt token and latency savings of context compaction")
+    parser.add_argument("--turns", type=int, default=60, help="Turns in the conversation")
+    parser.add_argument("--chars", type=int, default=600, help="Characters per user message")
+    parser.add_argument("--max-tokens", type=int, default=300, help="Reply length (the fake upstream's words per reply)")
+    parser.add_argument("--budget", type=int, default=8000, help="CONTEXT_TOKEN_BUDGET for the compacted run")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=40.0, help="Upstream delay per 1000 prompt tokens")
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="Upstream base latency")
+    parser.add_argument("--tail", type=int, default=10, help="Turns averaged for the 'last' columns")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    upstream_args = [
+        "--latency-ms", str(args.latency_ms), "--latency-jitter-ms", "0", "--tokens-per-second", "0",
+        "--completion-tokens", str(args.max_tokens), "--prefill-ms-per-1k-tokens", str(args.prefill_ms_per_1k),
+    ]
+    results = {}
+    for name, enabled in (("full", "false"), ("compacted", "true")):
+        os.environ["CONTEXT_COMPACTION_ENABLED"] = enabled
+        os.environ["CONTEXT_TOKEN_BUDGET"] = str(args.budget)
+        with local_stack(upstream_args) as base_url:
+            results[name] = summarize(converse(base_url, args.turns, args.chars, args.max_tokens), args.tail)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'run':<10} {'tokens total':>13} {'tokens/turn (last)':>19} {'latency mean':>13} {'latency (last)':>15} {'summaries':>10}")
+    for name, r in results.items():
+        print(
+            f"{name:<10} {r['prompt_tokens_total']:>13} {r['prompt_tokens_last']:>19} {r['latency_ms_mean']:>11.0f}ms "
+            f"{r['latency_ms_last']:>13.0f}ms {r['summary_requests']:>10}"
+        )
+    full, compacted = results["full"], results["compacted"]
+    print(
+        f"\nSaved {1 - compacted['prompt_tokens_total'] / full['prompt_tokens_total']:.0%} of prompt tokens, "
+        f"{1 - compacted['latency_ms_last'] / full['latency_ms_last']:.0%} of latency on the last {args.tail} turns "
+        f"(compacted turns: {compacted['compacted_turns']})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Load-test /chat and /research at a fixed concurrency and gate on regressions.
+
+Each scenario sends --requests requests with --concurrency in flight and
+reports throughput, end-to-end latency, and for streams the time to the
+first content event (TTFT) and the gaps between content events (inter-token
+latency), each as p50/p95/p99.
+
+Results can be saved as a JSON baseline (--save-baseline) and later runs
+compared against it (--baseline): the run exits with status 1 when a
+latency percentile grows, or throughput drops, by more than
+--max-regression (relative), or the error rate exceeds the baseline's by
+more than --max-error-increase.
+
+Pass --local to start the fake upstream (tests/fake_upstream) and the API on
+free ports for the run, so no keys or running server are needed:
+
+    python tests/benchmarks/bench_load.py --local --concurrency 32 --requests 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[2]
+
+SCENARIOS = {
+    # name: (path, stream)
+    "chat": ("/api/v1/chat", False),
+    "chat-stream": ("/api/v1/chat", True),
+    "research": ("/api/v1/research", False),
+    "research-stream": ("/api/v1/research", True),
+}
+PROMPT = "Summarize the main trade-offs between solar and wind power for a small town."
+
+# Percentiles compared against the baseline, per metric
+GATED = {
+    "latency_ms": ("p50", "p95", "p99"),
+    "ttft_ms": ("p50", "p95", "p99"),
+    "itl_ms": ("p50", "p95", "p99"),
+}
+
+
+def payload(scenario: str, i: int, max_tokens: int, model: Optional[str]) -> Dict[str, Any]:
+    """Request body for the i-th request of a scenario."""
+    path, stream = SCENARIOS[scenario]
+    if path.endswith("/research"):
+        # Distinct queries and no report reuse, so every request runs the agent
+        body: Dict[str, Any] = {"query": f"{PROMPT} (run {i})", "stream": stream, "max_age_seconds": 0}
+    else:
+        body = {"messages": [{"role": "user", "content": PROMPT}], "max_tokens": max_tokens, "stream": stream}
+    if model:
+        body["model_name"] = model
+    return body
+
+
+def is_error_event(event: Dict[str, Any]) -> bool:
+    return event.get("type") == "error" or (event.get("done") and str(event.get("content", "")).lstrip().startswith("Error:"))
+
+
+async def send(client: httpx.AsyncClient, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """Send one request and time it; streams are read event by event."""
+    started = time.perf_counter()
+    sample: Dict[str, Any] = {"ok": False, "ttft": None, "gaps": [], "events": 0}
+    try:
+        if not body.get("stream"):
+            response = await client.post(path, json=body)
+            sample["ok"] = response.status_code == 200
+            sample["status"] = response.status_code
+        else:
+            async with client.stream("POST", path, json=body) as response:
+                sample["status"] = response.status_code
+                ok = response.status_code == 200
+                last = None
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[6:])
+                    if is_error_event(event):
+                        ok = False
+                    if event.get("content") and event.get("type", "content") == "content":
+                        now = time.perf_counter()
+                        if last is None:
+                            sample["ttft"] = now - started
+                        else:
+                            sample["gaps"].append(now - last)
+                        last = now
+                        sample["events"] += 1
+                sample["ok"] = ok
+    except httpx.HTTPError as e:
+        sample["status"] = type(e).__name__
+    sample["latency"] = time.perf_counter() - started
+    return sample
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    """p50/p95/p99 and max of values in ms (nearest rank)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "max": round(ordered[-1] * 1000, 2)}
+
+
+def summarize(samples: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """Aggregate the samples of one scenario."""
+    ok = [s for s in samples if s["ok"]]
+    statuses: Dict[str, int] = {}
+    for s in samples:
+        if not s["ok"]:
+            statuses[str(s.get("status"))] = statuses.get(str(s.get("status")), 0) + 1
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "error_rate": round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+        "error_statuses": statuses,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "events_per_s": round(sum(s["events"] for s in ok) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": percentiles([s["latency"] for s in ok]),
+        "ttft_ms": percentiles([s["ttft"] for s in ok if s["ttft"] is not None]),
+        "itl_ms": percentiles([gap for s in ok for gap in s["gaps"]]),
+    }
+
+
+async def run_scenario(
+    base_url: str,
+    scenario: str,
+    requests: int,
+    concurrency: int,
+    warmup: int = 0,
+    max_tokens: int = 200,
+    model: Optional[str] = None,
+    timeout: float = 300.0,
+) -> Dict[str, Any]:
+    """Send requests for one scenario with a fixed number in flight and summarize them."""
+    path = SCENARIOS[scenario][0]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        await asyncio.gather(*(send(client, path, payload(scenario, -1 - i, max_tokens, model)) for i in range(warmup)))
+
+        counter = iter(range(requests))
+        samples: List[Dict[str, Any]] = []
+
+        async def worker():
+            for i in counter:
+                samples.append(await send(client, path, payload(scenario, i, max_tokens, model)))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    result = summarize(samples, elapsed)
+    result["concurrency"] = concurrency
+    return result
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float, max_error_increase: float) -> List[str]:
+    """Regressions of a run against a baseline, as readable lines (empty when within thresholds)."""
+    failures = []
+    for scenario, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if base is None:
+            continue
+        if result["error_rate"] > base["error_rate"] + max_error_increase:
+            failures.append(f"{scenario}: error rate {result['error_rate']:.2%} (baseline {base['error_rate']:.2%})")
+        if base["throughput_rps"] and result["throughput_rps"] < base["throughput_rps"] * (1 - max_regression):
+            failures.append(f"{scenario}: throughput {result['throughput_rps']} req/s (baseline {base['throughput_rps']})")
+        for metric, keys in GATED.items():
+            if not result.get(metric) or not base.get(metric):
+                continue
+            for key in keys:
+                now, before = result[metric][key], base[metric][key]
+                if now > before * (1 + max_regression):
+                    failures.append(f"{scenario}: {metric} {key} {now}ms (baseline {before}ms, +{now / before - 1:.0%})")
+    return failures
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+@contextmanager
+def local_stack(upstream_args: List[str], workers: int = 1) -> Iterator[str]:
+    """Run the fake upstream and the API on free ports; yields the API's base URL."""
+    upstream_port, api_port = free_port(), free_port()
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="benchmark",
+        EXA_API_KEY="benchmark",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{upstream_port}/v1",
+        EXA_BASE_URL=f"http://127.0.0.1:{upstream_port}",
+        DATA_DIR=tempfile.mkdtemp(prefix="agno-api-bench-"),
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+    )
+    # Never record benchmark traffic into a production trace
+    env.pop("TRAFFIC_RECORD_PATH", None)
+    processes = []
+    try:
+        upstream = subprocess.Popen(
+            [sys.executable, str(ROOT / "tests" / "fake_upstream" / "server.py"), "--port", str(upstream_port), *upstream_args],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+        )
+        processes.append(upstream)
+        wait_until_up(f"http://127.0.0.1:{upstream_port}/_config", upstream)
+        api = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(api_port), "--workers", str(workers), "--log-level", "warning"],
+            cwd=ROOT, env=env,
+        )
+        processes.append(api)
+        wait_until_up(f"http://127.0.0.1:{api_port}/", api)
+        yield f"http://127.0.0.1:{api_port}"
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def print_table(results: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'scenario':<16} {'req':>5} {'err':>5} {'req/s':>8} {'lat p50':>8} {'p95':>8} {'p99':>8} "
+          f"{'ttft p50':>9} {'p95':>8} {'itl p50':>8} {'p99':>7}")
+
+    def get(result, metric, key):
+        return f"{result[metric][key]:.0f}" if result.get(metric) else "-"
+
+    for name, r in results.items():
+        print(
+            f"{name:<16} {r['requests']:>5} {r['errors']:>5} {r['throughput_rps']:>8.1f} "
+            f"{get(r, 'latency_ms', 'p50'):>8} {get(r, 'latency_ms', 'p95'):>8} {get(r, 'latency_ms', 'p99'):>8} "
+            f"{get(r, 'ttft_ms', 'p50'):>9} {get(r, 'ttft_ms', 'p95'):>8} {get(r, 'itl_ms', 'p50'):>8} {get(r, 'itl_ms', 'p99'):>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the chat and research endpoints")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of a running API")
+    parser.add_argument("--local", action="store_true", help="Start the fake upstream and the API for the run instead of using --url")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes with --local")
+    parser.add_argument("--upstream-arg", action="append", default=[], help="Extra fake upstream option with --local (e.g. --upstream-arg=--latency-ms=500)")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario to run (repeatable; default: chat and chat-stream)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--warmup", type=int, default=4, help="Unrecorded requests sent before each scenario")
+    parser.add_argument("--max-tokens", type=int, default=200, help="max_tokens for chat requests")
+    parser.add_argument("--model", help="model_name sent with every request")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against; exits 1 on regressions")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative latency increase / throughput drop")
+    parser.add_argument("--max-error-increase", type=float, default=0.01, help="Allowed absolute error rate increase")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+    scenarios = args.scenario or ["chat", "chat-stream"]
+
+    def run(base_url):
+        return {
+            name: asyncio.run(run_scenario(base_url, name, args.requests, args.concurrency, args.warmup, args.max_tokens, args.model))
+            for name in scenarios
+        }
+
+    if args.local:
+        with local_stack(args.upstream_arg, args.workers) as base_url:
+            results = run(base_url)
+    else:
+        results = run(args.url)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {"url": "local" if args.local else args.url, "concurrency": args.concurrency, "requests": args.requests,
+                   "max_tokens": args.max_tokens, "model": args.model, "upstream_args": args.upstream_arg if args.local else None},
+        "scenarios": results,
+    }
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save_baseline).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(results)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        changed = [k for k, v in report["config"].items() if baseline.get("config", {}).get(k) != v]
+        if changed:
+            print(f"\nWarning: the baseline was recorded with different settings ({', '.join(changed)})")
+        failures = compare(report, baseline, args.max_regression, args.max_error_increase)
+        if failures:
+            print(f"\n{len(failures)} regression(s) against {args.baseline}:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
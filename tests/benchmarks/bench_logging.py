@@ -0,0 +1,135 @@
+"""
+Benchmark the per-request logging overhead on the request path.
+
+Emits the records a chat request produces (middleware, endpoint and one
+debug call per streamed chunk) and reports the time spent in the calling
+thread per request for:
+
+- sync:     JSON formatter writing directly to the sink (the previous setup)
+- queued:   records queued for a background writer (LocalQueueHandler)
+- sampled:  queued, with only --sample-rate of requests keeping info logs
+
+The queued cases also skip the caller lookup made for every record, as
+setup_logging() does.
+
+Per-chunk debug calls are timed both the old way (f-string and slice built
+even with debug logging off) and with lazy %-style arguments.
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+# The app config requires API keys; the benchmark never calls the APIs
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("EXA_API_KEY", "benchmark")
+
+from app.core import logging_config  # noqa: E402
+from app.core.logging_config import CustomJsonFormatter, LocalQueueHandler, RequestContextFilter  # noqa: E402
+
+MESSAGE = "What are the most promising approaches to quantum error correction this year?"
+CHUNK = "The surface code remains the leading candidate for fault tolerant quantum computing"
+
+
+def emit_request(logger, request_id, chunks, lazy):
+    """Log what the middleware and chat endpoint log for one streaming request."""
+    logger.info("Request: %s %s", "POST", "/api/v1/chat", extra={
+        "method": "POST", "path": "/api/v1/chat", "client_ip": "10.0.0.1", "request_id": request_id,
+    })
+    logger.info("Streaming chat request received", extra={"client_ip": "10.0.0.1", "request_id": request_id, "model": "gpt-4"})
+    logger.info(
+        "Processing streaming query: %.50s%s", MESSAGE, "..." if len(MESSAGE) > 50 else "",
+        extra={"request_id": request_id, "message_length": len(MESSAGE), "model": "gpt-4", "streaming": True},
+    )
+    for _ in range(chunks):
+        if lazy:
+            logger.debug("Streaming chunk: %.30s", CHUNK)
+        else:
+            logger.debug(f"Streaming chunk: {CHUNK[:30]}..." if len(CHUNK) > 30 else f"Streaming chunk: {CHUNK}")
+    logger.info("Streaming chat request completed successfully", extra={"request_id": request_id, "model": "gpt-4"})
+    logger.info("Response: %s took %.3fs", 200, 0.123, extra={"status_code": 200, "process_time": 0.123})
+
+
+def run_case(name, sink, requests, chunks, sample_rate, queued, lazy):
+    """Time the calling thread for every request, then wait for queued records to be written."""
+    srcfile = logging._srcfile
+    if queued:
+        logging._srcfile = None
+    output = logging.StreamHandler(sink)
+    output.setFormatter(CustomJsonFormatter("%(timestamp)s %(level)s %(name)s %(message)s"))
+    logger = logging.getLogger(f"bench.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    listener = None
+    if queued:
+        log_queue = queue.SimpleQueue()
+        handler = LocalQueueHandler(log_queue)
+        listener = logging.handlers.QueueListener(log_queue, output)
+        listener.start()
+    else:
+        handler = output
+    handler.addFilter(RequestContextFilter())
+    logger.addHandler(handler)
+
+    timings = []
+    started = time.perf_counter()
+    for i in range(requests):
+        request_started = time.perf_counter()
+        logging_config._request_sampled.set(sample_rate >= 1.0 or random.random() < sample_rate)
+        emit_request(logger, f"req-{i}", chunks, lazy)
+        timings.append(time.perf_counter() - request_started)
+    if listener is not None:
+        listener.stop()
+    total = time.perf_counter() - started
+    logger.removeHandler(handler)
+    logging_config._request_sampled.set(True)
+    logging._srcfile = srcfile
+
+    timings.sort()
+    return {
+        "case": name,
+        "us_per_request": sum(timings) / len(timings) * 1e6,
+        "p99_us": timings[int(len(timings) * 0.99)] * 1e6,
+        "total_s": total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-request logging overhead")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests to simulate per case")
+    parser.add_argument("--chunks", type=int, default=100, help="Streamed chunks per request (debug logging is off)")
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="Share of requests keeping info logs in the sampled case")
+    parser.add_argument("--sink", default=os.devnull, help="Where log lines are written (a file or pipe)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    cases = [
+        ("sync", 1.0, False, False),
+        ("queued", 1.0, True, False),
+        ("queued+lazy", 1.0, True, True),
+        (f"sampled {args.sample_rate:.0%}+lazy", args.sample_rate, True, True),
+    ]
+    with open(args.sink, "w", encoding="utf-8") as sink:
+        rows = [run_case(name, sink, args.requests, args.chunks, rate, queued, lazy) for name, rate, queued, lazy in cases]
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'case':<20} {'us/request':>11} {'p99 us':>9} {'total s':>8}")
+    for row in rows:
+        print(f"{row['case']:<20} {row['us_per_request']:>11.1f} {row['p99_us']:>9.1f} {row['total_s']:>8.2f}")
+    baseline = rows[0]["us_per_request"]
+    print(f"\nRequest path logging overhead: {baseline:.1f}us before, {rows[-1]['us_per_request']:.1f}us after "
+          f"({1 - rows[-1]['us_per_request'] / baseline:.0%} less)")
+
+
+if __name__ == "__main__":
+    main()
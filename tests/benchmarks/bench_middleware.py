@@ -0,0 +1,201 @@
+"""
+Benchmark the per-request and per-chunk cost of the request middleware.
+
+The same FastAPI app is called directly through ASGI (no network or HTTP
+client) with:
+
+- none:      no request middleware, the floor
+- function:  the earlier @app.middleware("http") version (a function
+             middleware, which Starlette runs as BaseHTTPMiddleware: the
+             endpoint runs in a separate task and the response body is
+             relayed through a memory stream)
+- asgi:      RequestMiddleware, which passes messages straight through
+
+Both middlewares do the same work (request id, span, metrics, logging), so
+the difference is the cost of the function middleware's plumbing. Reported
+are the time per small JSON request and per streamed response of --chunks
+chunks, and the added cost per chunk over none. Info logging is switched off
+so the queued log writes do not blur the comparison.
+
+Every case is timed as the best of --repeat runs of --number calls.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+# The app config requires API keys; the benchmark never calls the APIs
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("EXA_API_KEY", "benchmark")
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse, StreamingResponse  # noqa: E402
+
+from app.core import metrics, token_usage, tracing  # noqa: E402
+from app.core.logging_config import sample_request_logs  # noqa: E402
+from app.core.request_middleware import RequestMiddleware  # noqa: E402
+
+logger = logging.getLogger("bench_middleware")
+
+
+def add_function_middleware(app):
+    """The request middleware as it was before RequestMiddleware (profiling left out)."""
+
+    async def observe_body(body, on_done):
+        try:
+            async for part in body:
+                yield part
+        finally:
+            on_done()
+
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        start_time = time.time()
+        started = time.perf_counter()
+        in_progress = metrics.REQUESTS_IN_PROGRESS.labels(request.method)
+        in_progress.inc()
+        request_id = tracing.resolve_request_id(request.headers.get("X-Request-ID"))
+        tracing.request_id_var.set(request_id)
+        sample_request_logs()
+        token_usage.client_var.set(token_usage.resolve_client(request.headers.get("X-Client-ID")))
+        span = tracing.start_span(
+            f"{request.method} {request.url.path}",
+            parent=None,
+            attributes={"http.method": request.method, "http.target": request.url.path, "request.id": request_id},
+            remote_parent=tracing.parse_traceparent(request.headers.get("traceparent"))
+        )
+        logger.info("Request: %s %s", request.method, request.url.path)
+        try:
+            with tracing.use_span(span):
+                response = await call_next(request)
+            response.headers["X-Request-ID"] = request_id
+            process_time = time.time() - start_time
+            logger.info("Response: %s took %.3fs", response.status_code, process_time)
+
+            def record():
+                in_progress.dec()
+                route = metrics.route_of(request.scope)
+                metrics.REQUEST_LATENCY.labels(
+                    request.method, route, getattr(request.state, "model", ""), str(response.status_code)
+                ).observe(time.perf_counter() - started)
+                span.name = f"{request.method} {route}"
+                span.set_attribute("http.status_code", response.status_code)
+                span.end()
+
+            response.body_iterator = observe_body(response.body_iterator, record)
+            return response
+        except Exception as e:
+            in_progress.dec()
+            span.record_error(e)
+            span.end()
+            return JSONResponse(status_code=500, content={"detail": "Internal server error"})
+
+
+def bench_app(variant, chunks, chunk_bytes):
+    app = FastAPI()
+    if variant == "function":
+        add_function_middleware(app)
+    elif variant == "asgi":
+        app.add_middleware(RequestMiddleware, is_admin=lambda key: False)
+    payload = b"x" * chunk_bytes
+
+    @app.get("/bench/json")
+    async def small():
+        return {"message": "ok"}
+
+    @app.get("/bench/stream")
+    async def stream():
+        async def body():
+            for _ in range(chunks):
+                yield payload
+
+        return StreamingResponse(body(), media_type="text/event-stream")
+
+    return app
+
+
+def asgi_caller(app, path):
+    """Call the ASGI app with one GET request, without a network or HTTP client; checks the bytes received."""
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "GET", "path": path, "raw_path": path.encode(),
+        "root_path": "", "scheme": "http", "query_string": b"", "server": ("bench", 80), "client": ("bench", 1),
+        "headers": [(b"x-request-id", b"bench")],
+        # Without spec 2.4 every streamed response also waits on a disconnect listener task
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+    }
+    loop = asyncio.new_event_loop()
+
+    async def call():
+        received = 0
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            nonlocal received
+            if message["type"] == "http.response.body":
+                received += len(message.get("body", b""))
+
+        await app(dict(scope), receive, send)
+        return received
+
+    def run():
+        return loop.run_until_complete(call())
+
+    return run
+
+
+def best(func, number, repeat):
+    """Best time per call in microseconds."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def run(chunks, chunk_bytes, number, repeat):
+    results = {}
+    for variant in ("none", "function", "asgi"):
+        app = bench_app(variant, chunks, chunk_bytes)
+        json_call, stream_call = asgi_caller(app, "/bench/json"), asgi_caller(app, "/bench/stream")
+        assert stream_call() == chunks * chunk_bytes
+        results[variant] = {
+            "json_us": best(json_call, number, repeat),
+            "stream_us": best(stream_call, max(1, number // 10), repeat),
+        }
+    floor = results["none"]["stream_us"]
+    for r in results.values():
+        r["per_chunk_overhead_us"] = (r["stream_us"] - floor) / chunks
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request middleware overhead per request and per streamed chunk")
+    parser.add_argument("--chunks", type=int, default=500, help="Chunks per streamed response")
+    parser.add_argument("--chunk-bytes", type=int, default=64, help="Bytes per chunk")
+    parser.add_argument("--number", type=int, default=500, help="Calls per timing run (a tenth for streams)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per case")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    results = run(args.chunks, args.chunk_bytes, args.number, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'middleware':<10} {'json request':>13} {f'stream ({args.chunks} chunks)':>20} {'per chunk over none':>20}")
+    for name, r in results.items():
+        print(f"{name:<10} {r['json_us']:>11.0f}us {r['stream_us'] / 1000:>18.2f}ms {r['per_chunk_overhead_us']:>18.2f}us")
+    function, asgi = results["function"], results["asgi"]
+    print(
+        f"\nRequestMiddleware: {1 - asgi['json_us'] / function['json_us']:.0%} less time per JSON request, "
+        f"{1 - asgi['stream_us'] / function['stream_us']:.0%} less per stream than the function middleware"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Compare the memory of gunicorn workers with and without a preloaded app.
+
+Runs the API under gunicorn (gunicorn.conf.py, Uvicorn workers) against the
+fake upstream twice, with PRELOAD_APP=false and true. After warming every
+worker with chat and research requests, reports per worker (Linux only,
+from /proc/<pid>/smaps_rollup):
+
+- RSS: resident memory, counting shared pages in full in every process
+- PSS: resident memory with shared pages split between the processes sharing
+  them; the sum over all processes is what the server really uses
+- USS: memory private to the process (what exiting it would free)
+
+and the total PSS of the master and all workers.
+
+Usage:
+    python tests/benchmarks/bench_worker_memory.py --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_load import ROOT, free_port, wait_until_up  # noqa: E402
+
+
+def memory(pid: int) -> Dict[str, float]:
+    """RSS, PSS and USS of a process in MiB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        "rss_mb": fields["Rss"],
+        "pss_mb": fields["Pss"],
+        "uss_mb": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def children(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+@contextmanager
+def gunicorn_stack(
+    workers: int,
+    preload: bool = True,
+    worker_class: str = "uvicorn.workers.UvicornWorker",
+    upstream_args: Optional[List[str]] = None,
+    extra_env: Optional[Dict[str, str]] = None,
+) -> Iterator[tuple]:
+    """Run the fake upstream and the API under gunicorn; yields the base URL, the master's pid and the startup time."""
+    upstream_port, api_port = free_port(), free_port()
+    data_dir = tempfile.mkdtemp(prefix="agno-api-bench-")
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="benchmark",
+        EXA_API_KEY="benchmark",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{upstream_port}/v1",
+        EXA_BASE_URL=f"http://127.0.0.1:{upstream_port}",
+        DATA_DIR=data_dir,
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(data_dir, "prometheus"),
+        PRELOAD_APP="true" if preload else "false",
+        ENVIRONMENT="production",
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+        **(extra_env or {}),
+    )
+    env.pop("TRAFFIC_RECORD_PATH", None)
+    # Uvicorn (running the fake upstream) would read it as its worker count
+    env.pop("WEB_CONCURRENCY", None)
+    os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+    processes = []
+    try:
+        upstream = subprocess.Popen(
+            [sys.executable, str(ROOT / "tests" / "fake_upstream" / "server.py"), "--port", str(upstream_port),
+             *(upstream_args if upstream_args is not None else ["--latency-ms", "20", "--tokens-per-second", "0"])],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+        )
+        processes.append(upstream)
+        wait_until_up(f"http://127.0.0.1:{upstream_port}/_config", upstream)
+        started = time.perf_counter()
+        api = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "app.main:app", "--config", "gunicorn.conf.py",
+             "--bind", f"127.0.0.1:{api_port}", "--workers", str(workers),
+             "--worker-class", worker_class, "--log-level", "warning", "--timeout", "300"],
+            # The app logs JSON to stdout in production; keep the results readable
+            cwd=ROOT, env=dict(env, WEB_CONCURRENCY=str(workers)), stdout=subprocess.DEVNULL,
+        )
+        processes.append(api)
+        wait_until_up(f"http://127.0.0.1:{api_port}/", api)
+        # Wait for every worker, not only the first to accept connections
+        while len(children(api.pid)) < workers:
+            time.sleep(0.1)
+        # ENVIRONMENT=production only accepts the configured hosts
+        yield f"http://localhost:{api_port}", api.pid, time.perf_counter() - started
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def warm(base_url: str, requests: int) -> None:
+    """Send chat and research requests, many at once so they spread over the workers."""
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        chat = {"messages": [{"role": "user", "content": "How are offshore wind farms maintained?"}], "max_tokens": 100}
+        research = {"query": "Offshore wind farm maintenance", "max_tool_calls": 2}
+        calls = []
+        for i in range(requests):
+            if i % 4 == 3:
+                calls.append(client.post("/api/v1/research", json=research))
+            else:
+                calls.append(client.post("/api/v1/chat", json=dict(chat, stream=i % 2 == 0)))
+        for response in await asyncio.gather(*calls):
+            response.raise_for_status()
+
+
+def measure(workers: int, preload: bool, requests: int) -> Dict[str, object]:
+    with gunicorn_stack(workers, preload) as (base_url, master, startup):
+        asyncio.run(warm(base_url, requests))
+        pids = children(master)
+        per_worker = [memory(pid) for pid in pids]
+        master_memory = memory(master)
+    mean = {key: round(sum(m[key] for m in per_worker) / len(per_worker), 1) for key in per_worker[0]}
+    return {
+        "workers": len(pids),
+        "startup_s": round(startup, 2),
+        "worker": mean,
+        "master": {key: round(value, 1) for key, value in master_memory.items()},
+        "total_pss_mb": round(master_memory["pss_mb"] + sum(m["pss_mb"] for m in per_worker), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare gunicorn worker memory with and without a preloaded app")
+    parser.add_argument("--workers", type=int, default=4, help="Gunicorn workers")
+    parser.add_argument("--requests", type=int, default=64, help="Warm-up requests before measuring")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {name: measure(args.workers, preload, args.requests) for name, preload in (("no preload", False), ("preload", True))}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'':<11} {'workers':>7} {'startup':>8} {'worker RSS':>11} {'worker PSS':>11} {'worker USS':>11} {'master PSS':>11} {'total PSS':>10}")
+    for name, r in results.items():
+        w = r["worker"]
+        print(
+            f"{name:<11} {r['workers']:>7} {r['startup_s']:>7.1f}s {w['rss_mb']:>9.1f}MB {w['pss_mb']:>9.1f}MB "
+            f"{w['uss_mb']:>9.1f}MB {r['master']['pss_mb']:>9.1f}MB {r['total_pss_mb']:>8.1f}MB"
+        )
+    before, after = results["no preload"], results["preload"]
+    print(f"\nTotal PSS {before['total_pss_mb']:.0f}MB -> {after['total_pss_mb']:.0f}MB "
+          f"({1 - after['total_pss_mb'] / before['total_pss_mb']:.0%} less) with {args.workers} workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Replay a recorded traffic trace against a server and report latencies.
+
+Record a trace by running the API with TRAFFIC_RECORD_PATH set: every chat
+and research request is written as an anonymized shape (route, model,
+message roles and sizes, stream flag, budgets) with its arrival time,
+status and duration. This tool re-sends those shapes with filler text of
+the recorded sizes, on the recorded schedule compressed by --speed (open
+loop: requests are sent on time whether or not earlier ones finished), and
+reports latency percentiles per route next to the recorded ones.
+
+    python tests/benchmarks/replay_traffic.py traffic.jsonl --local --speed 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+# The app config requires API keys; reading traces never calls the APIs
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("EXA_API_KEY", "benchmark")
+
+from app.core.traffic_recorder import read_trace  # noqa: E402
+from bench_load import local_stack, percentiles, send, summarize  # noqa: E402
+
+FILLER = "the quick brown fox jumps over the lazy dog while the research agent gathers sources "
+ROLES = {"u": "user", "a": "assistant", "s": "system", "t": "tool"}
+
+
+def filler(chars: int, seed: str = "") -> str:
+    text = (seed + " " if seed else "") + FILLER * (chars // len(FILLER) + 1)
+    return text[:max(chars, len(seed))]
+
+
+def request_for(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Request body reproducing a recorded shape, or None for routes this tool cannot replay."""
+    body: Dict[str, Any] = {"stream": entry.get("stream", False)}
+    if entry.get("model"):
+        body["model_name"] = entry["model"]
+    if entry["route"].endswith("/chat"):
+        body["messages"] = [{"role": ROLES.get(role, "user"), "content": filler(size)} for role, size in entry["messages"]]
+        if entry.get("max_tokens") is not None:
+            body["max_tokens"] = entry["max_tokens"]
+        return body
+    if entry["route"].endswith("/research"):
+        # Queries that repeated in the trace repeat in the replay
+        body["query"] = filler(entry["query_chars"], f"query {entry['query']}")
+        for field in ("max_age_seconds", "max_tool_calls", "max_output_tokens", "max_sources", "deadline_seconds"):
+            if field in entry:
+                body[field] = entry[field]
+        return body
+    return None
+
+
+def group_of(entry: Dict[str, Any]) -> str:
+    return entry["route"].rsplit("/", 1)[-1] + ("-stream" if entry.get("stream") else "")
+
+
+async def replay(base_url: str, entries: List[Dict[str, Any]], speed: float, timeout: float) -> Dict[str, Any]:
+    """Send every entry at its recorded offset divided by speed; collect samples per route group."""
+    samples: Dict[str, List[Dict[str, Any]]] = {}
+    lateness: List[float] = []
+    first = entries[0]["ts"]
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+
+        async def fire(entry, body, due):
+            lateness.append(max(0.0, time.perf_counter() - due))
+            sample = await send(client, entry["route"], body)
+            samples.setdefault(group_of(entry), []).append(sample)
+
+        tasks = []
+        started = time.perf_counter()
+        for entry in entries:
+            body = request_for(entry)
+            if body is None:
+                continue
+            due = started + (entry["ts"] - first) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(entry, body, due)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    results = {name: summarize(group, elapsed) for name, group in sorted(samples.items())}
+    for name, result in results.items():
+        recorded = [e for e in entries if group_of(e) == name and e.get("status") == 200]
+        result["recorded_latency_ms"] = percentiles([e["ms"] / 1000 for e in recorded])
+    return {
+        "requests": sum(len(group) for group in samples.values()),
+        "elapsed_s": round(elapsed, 2),
+        "send_lateness_ms": percentiles(lateness),
+        "groups": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded traffic trace")
+    parser.add_argument("trace", nargs="+", help="Trace files written with TRAFFIC_RECORD_PATH (merged by arrival time)")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of a running API")
+    parser.add_argument("--local", action="store_true", help="Start the fake upstream and the API for the replay instead of using --url")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes with --local")
+    parser.add_argument("--upstream-arg", action="append", default=[], help="Extra fake upstream option with --local")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up: 10 sends the trace's requests 10 times closer together")
+    parser.add_argument("--limit", type=int, help="Replay only the first N requests")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    entries = read_trace(args.trace)[:args.limit]
+    if not entries:
+        print("The trace has no requests")
+        sys.exit(1)
+    span = entries[-1]["ts"] - entries[0]["ts"]
+    print(f"Replaying {len(entries)} requests recorded over {span:.0f}s at {args.speed:g}x ({span / args.speed:.0f}s)", file=sys.stderr)
+
+    if args.local:
+        with local_stack(args.upstream_arg, args.workers) as base_url:
+            report = asyncio.run(replay(base_url, entries, args.speed, args.timeout))
+    else:
+        report = asyncio.run(replay(args.url, entries, args.speed, args.timeout))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    def cell(result, metric, key):
+        return f"{result[metric][key]:.0f}" if result.get(metric) else "-"
+
+    print(f"{'group':<16} {'req':>5} {'err':>5} {'lat p50':>8} {'p95':>8} {'p99':>8} {'ttft p50':>9} {'p95':>8} {'recorded p50':>13} {'p95':>8}")
+    for name, r in report["groups"].items():
+        print(
+            f"{name:<16} {r['requests']:>5} {r['errors']:>5} {cell(r, 'latency_ms', 'p50'):>8} {cell(r, 'latency_ms', 'p95'):>8} "
+            f"{cell(r, 'latency_ms', 'p99'):>8} {cell(r, 'ttft_ms', 'p50'):>9} {cell(r, 'ttft_ms', 'p95'):>8} "
+            f"{cell(r, 'recorded_latency_ms', 'p50'):>13} {cell(r, 'recorded_latency_ms', 'p95'):>8}"
+        )
+    lateness = report["send_lateness_ms"]
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s; sent late by p50 {lateness['p50']}ms, p99 {lateness['p99']}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# app.core.config refuses to load without an OpenAI key; these tests never call upstream
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("EXA_API_KEY", "test-key")
+# Keep the stores opened by app.api.endpoints out of the working tree
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="agno-api-tests-"))
@@ -0,0 +1,78 @@
+"""
+Tests for the capacity controller.
+"""
+import asyncio
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import offload
+from app.core.capacity import CapacityController, CapacityMiddleware
+from app.core.config import OFFLOAD_THREADS
+
+
+def test_pool_grows_with_demand_and_the_limit_backs_off_under_loop_lag():
+    controller = CapacityController(min_threads=2, max_threads=16, thread_headroom=1.5, min_concurrency=4, max_concurrency=20)
+    release = threading.Event()
+
+    async def run():
+        offload.resize(2)
+        calls = [asyncio.ensure_future(offload.run_in_thread(release.wait, 5)) for _ in range(6)]
+        await asyncio.sleep(0.05)
+        # 2 calls running and 4 waiting for a thread
+        controller.adjust()
+        grown = offload.usage().threads
+        release.set()
+        await asyncio.gather(*calls)
+        return grown
+
+    try:
+        assert asyncio.run(run()) == 9
+        assert controller.stats()["last_adjustment"]["thread_demand"] == 6
+
+        # A lagging loop cuts the in-flight limit and asks for another worker; the idle pool shrinks gradually
+        controller.adjust(lag=0.2)
+        assert controller.limit == 15 and offload.usage().threads == 8
+        assert controller.recommended_workers >= min(2, controller.stats()["cpu_count"])
+        controller.adjust()
+        assert controller.limit == 15 and offload.usage().threads == 7
+    finally:
+        offload.resize(OFFLOAD_THREADS)
+
+
+def test_requests_over_the_limit_are_refused_until_one_finishes():
+    controller = CapacityController(min_concurrency=1, max_concurrency=4)
+    controller.limit = 1
+    app = FastAPI()
+    app.add_middleware(CapacityMiddleware, controller=controller, paths=("/limited",))
+    entered, release = threading.Event(), threading.Event()
+
+    @app.get("/limited")
+    def limited():
+        entered.set()
+        release.wait(5)
+        return {"ok": True}
+
+    @app.get("/free")
+    def free():
+        return {"ok": True}
+
+    client = TestClient(app)
+    first = []
+    thread = threading.Thread(target=lambda: first.append(client.get("/limited")))
+    thread.start()
+    assert entered.wait(5)
+
+    refused = client.get("/limited")
+    assert refused.status_code == 503 and refused.headers["Retry-After"] == "1"
+    assert client.get("/free").status_code == 200
+    release.set()
+    thread.join()
+
+    assert first[0].status_code == 200
+    assert client.get("/limited").status_code == 200
+    assert controller.in_flight == 0 and controller.rejected == 1
+    # The limit was reached without loop lag, so it is raised
+    controller.adjust()
+    assert controller.limit == 2
@@ -0,0 +1,43 @@
+"""
+Tests for the JSON codec used for request bodies and stream events.
+"""
+import json
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import codec
+from app.models.chat import ChatRequest, StreamingChunk
+
+
+def _client():
+    app = FastAPI()
+    router = APIRouter(route_class=codec.CodecRoute)
+
+    @router.post("/echo")
+    async def echo(request: ChatRequest):
+        return {"messages": len(request.messages), "last": request.messages[-1].content}
+
+    app.include_router(router)
+    return TestClient(app)
+
+
+def test_codec_route_decodes_and_validates_request_bodies():
+    client = _client()
+    history = [{"role": "user", "content": f"message {i} é"} for i in range(300)]
+
+    response = client.post("/echo", json={"messages": history})
+    assert response.json() == {"messages": 300, "last": "message 299 é"}
+
+    assert client.post("/echo", content=b'{"messages": [', headers={"Content-Type": "application/json"}).status_code == 422
+    assert client.post("/echo", json={"messages": [{"role": "user"}]}).status_code == 422
+
+
+def test_sse_events_round_trip():
+    chunk = StreamingChunk(content="café \"quoted\"\n", done=False, model="gpt-4o")
+    event = {"type": "content", "content": "café", "done": False, "usage": None}
+
+    for payload, expected in ((chunk, chunk.model_dump()), (event, event)):
+        encoded = codec.sse(payload)
+        assert encoded.startswith(b"data: ") and encoded.endswith(b"\n\n")
+        assert json.loads(encoded[6:]) == expected
@@ -0,0 +1,85 @@
+"""
+Tests for comparing models on one conversation.
+"""
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from app.core.openai_service import AgnoService
+from app.main import app
+from app.models.chat import ChatMessage, CompareChunk, CompareResult, StreamingChunk
+
+# Seconds before each chunk, per model
+DELAYS = {"gpt-4o-mini": [0.01, 0.01], "gpt-4o": [0.15, 0.01], "o3-mini": [0.05]}
+
+
+def _fake_chat_completion(monkeypatch):
+    def chat_completion(cls, messages, model_name, stream, **kwargs):
+        async def chunks():
+            for i, delay in enumerate(DELAYS[model_name]):
+                await asyncio.sleep(delay)
+                if model_name == "o3-mini":
+                    yield StreamingChunk(content="\n\nError: upstream unavailable", done=True, model=model_name)
+                    raise RuntimeError("upstream unavailable")
+                yield StreamingChunk(content=f"{model_name} {i} ", model=model_name)
+            yield StreamingChunk(content="", done=True, model=model_name, usage={"completion_tokens": len(DELAYS[model_name])})
+
+        return chunks()
+
+    monkeypatch.setattr(AgnoService, "chat_completion", classmethod(chat_completion))
+
+
+def test_models_stream_concurrently_and_interleave(monkeypatch):
+    _fake_chat_completion(monkeypatch)
+
+    async def run():
+        messages = [ChatMessage(role="user", content="Hello")]
+        return [chunk async for chunk in AgnoService.compare(messages, ["gpt-4o", "gpt-4o-mini", "o3-mini"])]
+
+    chunks = asyncio.run(run())
+    order = [(c.model, c.content or ("finished" if c.finished else "")) for c in chunks if not c.done]
+    assert order == [
+        ("gpt-4o-mini", "gpt-4o-mini 0 "),
+        ("gpt-4o-mini", "gpt-4o-mini 1 "),
+        ("gpt-4o-mini", "finished"),
+        ("o3-mini", "finished"),
+        ("gpt-4o", "gpt-4o 0 "),
+        ("gpt-4o", "gpt-4o 1 "),
+        ("gpt-4o", "finished"),
+    ]
+
+    results = chunks[-1].results
+    assert chunks[-1].done and [r.model for r in results] == ["gpt-4o", "gpt-4o-mini", "o3-mini"]
+    fast, failed, slow = results[1], results[2], results[0]
+    assert fast.usage == {"completion_tokens": 2} and fast.error is None
+    assert failed.error == "upstream unavailable" and failed.ttft_ms is None
+    # Concurrent: the slowest model sets the pace, not the sum of all
+    assert fast.ttft_ms < slow.ttft_ms < 300 and slow.latency_ms < 300
+
+
+def test_compare_endpoint(monkeypatch):
+    _fake_chat_completion(monkeypatch)
+    client = TestClient(app)
+    body = {"messages": [{"role": "user", "content": "Hello"}], "models": ["gpt-4o", "gpt-4o-mini"]}
+
+    response = client.post("/api/v1/chat/compare", json=body)
+    assert [(r["model"], r["content"]) for r in response.json()["results"]] == [
+        ("gpt-4o", "gpt-4o 0 gpt-4o 1 "), ("gpt-4o-mini", "gpt-4o-mini 0 gpt-4o-mini 1 ")
+    ]
+
+    with client.stream("POST", "/api/v1/chat/compare", json={**body, "stream": True}) as stream:
+        events = [json.loads(line[6:]) for line in stream.iter_lines() if line.startswith("data: ")]
+    assert events[0]["model"] == "gpt-4o-mini"
+    assert sum(1 for e in events if e["finished"]) == 2
+    assert events[-1]["done"] and len(events[-1]["results"]) == 2
+
+    assert client.post("/api/v1/chat/compare", json={**body, "models": ["auto"]}).status_code == 400
+
+    async def cut_short(*args, **kwargs):
+        yield CompareChunk(model="gpt-4o", finished=True, result=CompareResult(model="gpt-4o", latency_ms=1.0, error="timeout"))
+
+    monkeypatch.setattr(AgnoService, "compare", classmethod(lambda cls, *args, **kwargs: cut_short()))
+    response = client.post("/api/v1/chat/compare", json=body)
+    assert response.status_code == 502 and response.json()["detail"]["errors"] == {"gpt-4o": "timeout"}
+    assert client.post("/api/v1/chat/compare", json={**body, "models": [f"m{i}" for i in range(10)]}).status_code == 400
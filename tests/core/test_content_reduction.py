@@ -0,0 +1,71 @@
+"""
+Tests for the source content reduction pipeline.
+"""
+from app.core.content_reduction import ContentReducer, extract_text, simhash, split_chunks, tokenize
+
+PARAGRAPH = (
+    "Quantum error correction spreads one logical qubit across many physical qubits "
+    "so that errors can be detected through repeated parity measurements."
+)
+
+
+def test_extract_text_drops_markup_and_boilerplate():
+    raw = (
+        "<html><head><script>var x = 1;</script></head><body>"
+        "<nav><a href='/'>Home</a></nav><p>Share</p>"
+        f"<p>{PARAGRAPH}</p><footer>Copyright 2025 Example Media Group</footer></body></html>"
+    )
+
+    text = extract_text(raw)
+
+    assert text == PARAGRAPH
+
+
+def test_split_chunks_respects_chunk_size():
+    text = "\n\n".join([PARAGRAPH] * 6)
+
+    chunks = split_chunks(text, chunk_tokens=80)
+
+    assert len(chunks) == 3
+    assert all(chunk.startswith("Quantum") for chunk in chunks)
+
+
+def test_simhash_is_close_for_near_duplicates():
+    original = simhash(tokenize(PARAGRAPH))
+    edited = simhash(tokenize(PARAGRAPH.replace("repeated", "frequent")))
+    unrelated = simhash(tokenize("The city council approved a new budget for road repairs in the northern districts."))
+
+    assert (original ^ edited).bit_count() < (original ^ unrelated).bit_count()
+
+
+def test_reduce_keeps_relevant_chunks_within_budget():
+    results = [
+        {"url": "https://a.example", "title": "A", "text": PARAGRAPH + "\n\nAdvertisement: book a test drive of the new electric sedan today."},
+        {"url": "https://b.example", "title": "B", "text": "The city council approved a new budget for road repairs in the northern districts."},
+    ]
+    reducer = ContentReducer(token_budget=40, top_k=5, chunk_tokens=40)
+
+    reduced, stats = reducer.reduce(results, "quantum error correction")
+
+    assert reduced[0]["text"] == PARAGRAPH
+    assert "text" not in reduced[1]
+    assert reduced[1]["url"] == "https://b.example"
+    assert stats.output_tokens <= 40 < stats.input_tokens
+
+
+def test_reduce_drops_duplicates_across_sources_and_calls():
+    results = [
+        {"url": "https://a.example", "text": PARAGRAPH},
+        {"url": "https://b.example", "text": PARAGRAPH},
+    ]
+    reducer = ContentReducer(token_budget=500, top_k=10, chunk_tokens=60)
+
+    reduced, stats = reducer.reduce(results, "quantum error correction")
+    assert stats.duplicates == 1
+    assert "text" not in reduced[1]
+
+    # Content already passed on by this reducer is not sent again
+    _, stats = reducer.reduce([{"url": "https://c.example", "text": PARAGRAPH}], "quantum error correction")
+    assert stats.duplicates == 1
+    assert stats.selected == 0
+    assert reducer.totals.duplicates == 2
@@ -0,0 +1,80 @@
+"""
+Tests for fitting conversation histories into a token budget.
+"""
+from app.core import openai_service
+from app.core.context_compaction import SUMMARY_HEADER, ContextCompactor, SummaryStore
+from app.core.openai_service import AgnoService
+from app.models.chat import ChatMessage, ChatResponse
+
+
+def _conversation(turns):
+    messages = [ChatMessage(role="system", content="Answer in French.")]
+    for i in range(turns):
+        messages.append(ChatMessage(role="user", content=f"question {i} " + "word " * 60))
+        messages.append(ChatMessage(role="assistant", content=f"answer {i} " + "word " * 60))
+    return messages + [ChatMessage(role="user", content="And now?")]
+
+
+def _compactor(tmp_path, calls, **kwargs):
+    def summarize(previous, messages):
+        calls.append((previous, [m.content.split()[1] for m in messages]))
+        return f"summary through {messages[-1].content.split()[1]}"
+
+    options = {"budget": 1000, "keep_recent": 4, "step": 4, "summary_tokens": 100, "input_tokens": 100_000}
+    options.update(kwargs)
+    return ContextCompactor(summarize, SummaryStore(str(tmp_path / "summaries.db"), ttl=3600), **options)
+
+
+def test_old_turns_are_summarized_incrementally(tmp_path):
+    calls = []
+    compactor = _compactor(tmp_path, calls)
+
+    short = _conversation(2)
+    assert compactor.compact(short, "gpt-4o") == (short, None)
+
+    messages, report = compactor.compact(_conversation(12), "gpt-4o")
+    assert messages[0].content == "Answer in French." and messages[-1].content == "And now?"
+    assert messages[1].role == "system" and messages[1].content.startswith(SUMMARY_HEADER)
+    assert report["summary"] == "new" and report["summarized_messages"] % 4 == 0
+    assert report["sent_tokens"] <= 1000 < report["original_tokens"]
+    assert report["saved_tokens"] == report["original_tokens"] - report["sent_tokens"]
+
+    # The next turn reuses the stored summary, and later ones only summarize the new turns
+    assert compactor.compact(_conversation(13), "gpt-4o")[1]["summary"] == "cached"
+    _, report = compactor.compact(_conversation(16), "gpt-4o")
+    assert report["summary"] == "extended" and report["summary_requests"] == 1
+    previous, summarized = calls[-1]
+    assert previous.startswith("summary through")
+    assert len(summarized) <= 8
+
+
+def test_long_spans_are_summarized_in_rounds_within_per_model_budgets(tmp_path):
+    calls = []
+    compactor = _compactor(tmp_path, calls, input_tokens=300, budgets='{"gpt-4o-mini": 100000}')
+
+    assert compactor.compact(_conversation(30), "gpt-4o-mini-2024-07-18")[1] is None
+    _, report = compactor.compact(_conversation(30), "gpt-4o")
+    assert report["summary_requests"] == len(calls) > 1
+    assert calls[0][0] is None and all(previous for previous, _ in calls[1:])
+
+
+def test_chat_completion_sends_the_compacted_history(tmp_path, monkeypatch):
+    calls, histories = [], []
+    monkeypatch.setattr(openai_service, "context_compactor", _compactor(tmp_path, calls))
+    monkeypatch.setattr(AgnoService, "_agent_for_run", classmethod(
+        lambda cls, model, history=None: histories.append(history)
+    ))
+    monkeypatch.setattr(AgnoService, "_run_with_retries", classmethod(
+        lambda cls, agent, message, model, start: ChatResponse(message=ChatMessage(role="assistant", content="Voilà"))
+    ))
+
+    response = AgnoService.chat_completion(messages=_conversation(12), model_name="gpt-4o")
+    assert response.usage["context"]["saved_tokens"] > 0
+    assert histories[-1][1].content.startswith(SUMMARY_HEADER)
+
+    def failing(previous, messages):
+        raise RuntimeError("summary model unavailable")
+
+    monkeypatch.setattr(openai_service.context_compactor, "summarize", failing)
+    response = AgnoService.chat_completion(messages=_conversation(20), model_name="gpt-4o")
+    assert "context" not in response.usage and len(histories[-1]) == 41
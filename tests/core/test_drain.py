@@ -0,0 +1,102 @@
+"""
+Tests for draining a worker before shutdown.
+"""
+import asyncio
+import os
+import signal
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from app.core.drain import Drain, DrainMiddleware
+from app.core.research_budget import BudgetTracker, ResearchBudget, cut_short
+
+
+def drained_app(drain: Drain) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(DrainMiddleware, drain=drain)
+    never = asyncio.Event()
+
+    async def tokens():
+        yield "partial"
+        # An upstream that stalls past the deadline
+        await never.wait()
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            try:
+                async for token in drain.guard(tokens()):
+                    yield f"data: {token}\n\n"
+            except Exception as e:
+                yield f"data: error {str(e)}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.2)
+        return {"ok": True}
+
+    @app.get("/metrics")
+    async def metrics():
+        return {"ok": True}
+
+    return app
+
+
+def test_drain_refuses_new_requests_lets_others_finish_and_cuts_stalled_streams():
+    drain = Drain(timeout=0.5)
+    app = drained_app(drain)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            stream = asyncio.ensure_future(client.get("/stream"))
+            slow = asyncio.ensure_future(client.get("/slow"))
+            await asyncio.sleep(0.05)
+            draining = asyncio.ensure_future(drain.drain())
+            await asyncio.sleep(0)
+            refused = await client.get("/slow")
+            exempt = await client.get("/metrics")
+            return await stream, await slow, refused, exempt, await draining
+
+    started = time.monotonic()
+    stream, slow, refused, exempt, report = asyncio.run(run())
+
+    assert stream.text == "data: partial\n\ndata: error Server is shutting down, retry the request\n\n"
+    assert slow.status_code == 200
+    assert refused.status_code == 503 and refused.headers["Retry-After"] == "1"
+    assert refused.headers["Connection"] == "close"
+    assert exempt.status_code == 200
+    assert report["completed"] == 1 and report["stream_cut"] == 1
+    assert report["dropped"] == 0 and report["refused"] == 1
+    assert 0.5 <= report["duration_seconds"] < time.monotonic() - started
+
+
+def test_sigterm_drains_and_cuts_research_runs_short_before_the_server_stops():
+    drain = Drain(timeout=1.0)
+    drain.on_begin(lambda deadline: cut_short(deadline - 0.1))
+    stopped = []
+    original = signal.signal(signal.SIGTERM, lambda sig, frame: stopped.append((sig, drain.report)))
+
+    async def run():
+        tracker = BudgetTracker(ResearchBudget(deadline_seconds=180))
+        run = asyncio.ensure_future(asyncio.sleep(0.05))
+        drain.track(run)
+        assert drain.install()
+        os.kill(os.getpid(), signal.SIGTERM)
+        while not stopped:
+            await asyncio.sleep(0.01)
+        return tracker
+
+    try:
+        tracker = asyncio.run(run())
+    finally:
+        signal.signal(signal.SIGTERM, original)
+
+    # The server's handler ran once the background run had finished, well before the deadline
+    sig, report = stopped[0]
+    assert sig == signal.SIGTERM
+    assert report["unfinished_background_tasks"] == 0 and report["duration_seconds"] < 1.0
+    assert tracker.deadline == tracker.cut_off == drain.deadline - 0.1
@@ -0,0 +1,101 @@
+"""
+Tests for the local OpenAI/Exa stand-in in tests/fake_upstream.
+"""
+import json
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+from agno.agent import Agent
+from openai import InternalServerError, OpenAI
+
+from app.core import research_tools, token_usage
+from app.core.openai_model import TracedOpenAIChat
+from app.core.research_tools import ResearchExaTools
+from tests.fake_upstream.server import FakeUpstreamSettings, create_app
+
+
+@pytest.fixture(scope="module")
+def upstream():
+    settings = FakeUpstreamSettings(latency_ms=0, latency_jitter_ms=0, tokens_per_second=0, completion_tokens=20, exa_latency_ms=0)
+    app = create_app(settings)
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    url = "http://%s:%d" % sock.getsockname()
+    yield url
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+@pytest.fixture
+def configure(upstream):
+    """Change fake upstream settings for one test."""
+    before = httpx.get(f"{upstream}/_config").json()
+    yield lambda **changes: httpx.post(f"{upstream}/_config", json=changes).raise_for_status()
+    httpx.post(f"{upstream}/_config", json=before).raise_for_status()
+
+
+def test_openai_sdk_completions_and_streams(upstream):
+    client = OpenAI(api_key="test", base_url=f"{upstream}/v1")
+    messages = [{"role": "user", "content": "Hello there"}]
+
+    response = client.chat.completions.create(model="gpt-4o", messages=messages)
+    assert len(response.choices[0].message.content.split()) == 20
+    assert response.usage.completion_tokens == 20
+
+    chunks = list(client.chat.completions.create(
+        model="gpt-4o", messages=messages, stream=True, stream_options={"include_usage": True}, max_tokens=5,
+    ))
+    text = "".join(c.choices[0].delta.content or "" for c in chunks if c.choices)
+    assert len(text.split()) == 5
+    assert chunks[-1].usage.completion_tokens == 5
+
+
+def test_agent_tool_calls_round_trip(upstream):
+    calls = []
+
+    def lookup(topic: str) -> str:
+        """Look up a topic."""
+        calls.append(topic)
+        return json.dumps({"topic": topic, "facts": ["a", "b"]})
+
+    agent = Agent(model=TracedOpenAIChat(id="gpt-4o", api_key="test", base_url=f"{upstream}/v1"), tools=[lookup])
+    with token_usage.track() as usage:
+        chunks = list(agent.run("solar power", stream=True))
+
+    assert calls == ["solar power"]
+    assert "".join(c.content for c in chunks if isinstance(c.content, str))
+    # One request for the tool call, one for the answer, both with upstream usage
+    assert usage.as_dict()["model_requests"] == 2
+    assert usage.as_dict()["token_source"] == "upstream"
+
+
+def test_injected_errors(upstream, configure):
+    configure(error_rate=1.0, rate_limit_share=0.0)
+    client = OpenAI(api_key="test", base_url=f"{upstream}/v1", max_retries=0)
+    with pytest.raises(InternalServerError):
+        client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "Hi"}])
+
+
+def test_research_tools_search_the_configured_exa(upstream, configure, monkeypatch):
+    configure(exa_text_chars=5000)
+    monkeypatch.setattr(research_tools, "EXA_BASE_URL", upstream)
+    tools = ResearchExaTools(api_key="test", text_length_limit=800, num_results=3)
+
+    results = json.loads(tools.search_exa("fusion reactors"))
+
+    assert len(results) == 3
+    assert all(r["url"].startswith("https://example.com/fusion-reactors/") for r in results)
+    assert all(0 < len(r["text"]) <= 800 for r in results)
+
+    # Searches ask for no more results than the run's source budget has left
+    tools = ResearchExaTools(api_key="test", sources_left=lambda: 2)
+    assert len(json.loads(tools.search_exa("fusion reactors", num_results=5))) == 2
@@ -0,0 +1,64 @@
+"""
+Tests for the liveness and readiness probes and the load score.
+"""
+import asyncio
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import health, offload
+from app.core.config import OFFLOAD_THREADS
+from app.core.drain import Drain
+from app.core.health import HealthProbe, LoadScoreMiddleware
+from app.core.loop_monitor import LoopMonitor
+from app.main import app
+
+
+def test_load_score_follows_loop_lag_and_pool_saturation_and_draining_fails_readiness():
+    drain = Drain()
+    probe = HealthProbe(drain, max_load_score=0.9, lag_limit=0.1)
+    probe.monitor = LoopMonitor()
+    release = threading.Event()
+
+    async def run():
+        offload.resize(2)
+        calls = [asyncio.ensure_future(offload.run_in_thread(release.wait, 5)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        # 2 threads busy and 1 call waiting
+        saturated = probe.readiness()
+        release.set()
+        await asyncio.gather(*calls)
+        return saturated
+
+    try:
+        probe.monitor.average_lag = 0.05
+        assert probe.load_score() == 0.5 and probe.readiness()["ready"]
+
+        probe.monitor.average_lag = 0.0
+        saturated = asyncio.run(run())
+        assert saturated["load_score"] == 1.0 and not saturated["ready"]
+        assert (saturated["offload_busy"], saturated["offload_queued"]) == (2, 1)
+    finally:
+        offload.resize(OFFLOAD_THREADS)
+
+    assert probe.readiness()["ready"]
+    drain.begin()
+    readiness = probe.readiness()
+    assert readiness["draining"] and not readiness["ready"]
+
+
+def test_probes_and_load_score_header():
+    client = TestClient(app)
+    assert client.get("/healthz").json() == {"status": "ok"}
+    ready = client.get("/readyz")
+    assert ready.status_code == 200 and ready.json()["ready"] and not ready.json()["draining"]
+
+    scored = FastAPI()
+    scored.add_middleware(LoadScoreMiddleware, probe=health.probe)
+
+    @scored.get("/")
+    async def root():
+        return {"ok": True}
+
+    assert TestClient(scored).get("/").headers["X-Load-Score"] == "0.00"
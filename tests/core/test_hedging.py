@@ -0,0 +1,102 @@
+"""
+Tests for hedged streaming.
+"""
+import asyncio
+
+import pytest
+
+from app.core.hedging import HedgePolicy
+
+
+def _stream(first_after, words=("Hello", " world"), fail=False, log=None):
+    async def contents():
+        try:
+            await asyncio.sleep(first_after)
+            if fail:
+                raise RuntimeError("upstream error")
+            for word in words:
+                yield word
+        finally:
+            if log is not None:
+                log.append("closed")
+
+    return contents
+
+
+async def _collect(policy, primary, hedge, primary_model="gpt-4o", hedge_model="gpt-4o-mini"):
+    return [item async for item in policy.stream(primary_model, primary, hedge_model, hedge)]
+
+
+def test_late_first_token_is_hedged_and_the_loser_cancelled():
+    policy = HedgePolicy(default_delay=0.05, budget_percent=100)
+    closed = []
+
+    items = asyncio.run(_collect(policy, _stream(5, log=closed), _stream(0.01, words=("Hi",))))
+    assert items == [("gpt-4o-mini", "Hi")]
+    assert closed == ["closed"]
+
+    items = asyncio.run(_collect(policy, _stream(0.08), _stream(5)))
+    assert items == [("gpt-4o", "Hello"), ("gpt-4o", " world")]
+
+    assert asyncio.run(_collect(policy, _stream(0), _stream(0)))[0][0] == "gpt-4o"
+    stats = policy.stats()
+    assert stats["outcomes"] == {"hedge_won": 1, "primary_won": 1, "not_needed": 1}
+    assert stats["hedge_win_rate"] == 0.5
+
+
+def test_losing_streams_are_closed():
+    policy = HedgePolicy(default_delay=0.02, budget_percent=100)
+    closed = []
+
+    class Stream:
+        """A stream that only releases its upstream request when closed."""
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            await asyncio.sleep(5)
+            return "late"
+
+        async def aclose(self):
+            closed.append("closed")
+
+    items = asyncio.run(_collect(policy, Stream, _stream(0.01, words=("Hi",))))
+    assert items == [("gpt-4o-mini", "Hi")]
+    assert closed == ["closed"]
+
+
+def test_hedges_stay_within_budget():
+    policy = HedgePolicy(default_delay=0.01, budget_percent=25)
+
+    async def run():
+        results = []
+        for _ in range(8):
+            results.append(await _collect(policy, _stream(0.05), _stream(0)))
+        return results
+
+    results = asyncio.run(run())
+    assert sum(1 for items in results if items[0][0] == "gpt-4o-mini") == 2
+    assert policy.stats()["outcomes"]["budget_exhausted"] == 6
+
+
+def test_a_failed_stream_leaves_the_other_to_answer():
+    policy = HedgePolicy(default_delay=0.02, budget_percent=100)
+
+    items = asyncio.run(_collect(policy, _stream(0.05, fail=True), _stream(0.1, words=("Hi",))))
+    assert items == [("gpt-4o-mini", "Hi")]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(_collect(policy, _stream(0.05, fail=True), _stream(0.03, fail=True)))
+    assert policy.stats()["outcomes"]["failed"] == 1
+
+
+def test_delay_follows_the_percentile_of_recent_first_tokens():
+    policy = HedgePolicy(percentile=90, min_delay=0.1, default_delay=2.0, min_samples=10)
+    assert policy.delay("gpt-4o") == 2.0
+    for i in range(1, 101):
+        policy.observe("gpt-4o", i / 100)
+    assert policy.delay("gpt-4o") == pytest.approx(0.91)
+    for _ in range(200):
+        policy.observe("gpt-4o", 0.01)
+    assert policy.delay("gpt-4o") == 0.1
@@ -0,0 +1,92 @@
+"""
+Tests for the knowledge index over previously fetched research sources.
+"""
+import json
+
+import pytest
+
+from app.core.knowledge_index import KnowledgeIndex
+from app.core.research_tools import ResearchExaTools
+
+SURFACE_CODE = (
+    "The surface code arranges data qubits and measurement qubits on a grid, and a decoder "
+    "infers errors from repeated stabilizer measurements."
+)
+THRESHOLD = (
+    "Below the error correction threshold, adding physical qubits makes the logical qubit "
+    "more reliable; above it, more qubits only add more errors."
+)
+
+
+@pytest.fixture
+def index(tmp_path):
+    return KnowledgeIndex(str(tmp_path / "knowledge.db"), chunk_tokens=60, max_documents=100, compact_every=0)
+
+
+def _result(url, text, title="Title"):
+    return {"url": url, "title": title, "published_date": "2025-01-14", "text": text}
+
+
+def test_add_is_incremental(index):
+    assert index.add([_result("https://a", SURFACE_CODE), _result("https://b", THRESHOLD)]) == 2
+    # Unchanged documents are not re-indexed
+    assert index.add([_result("https://a", SURFACE_CODE)]) == 0
+    # Changed documents replace their chunks
+    assert index.add([_result("https://a", THRESHOLD)]) == 1
+
+    stats = index.stats()
+    assert stats["documents"] == 2
+    assert stats["chunks"] == 2
+    assert index.search("surface code decoder", num_results=5, max_age=60) == []
+
+
+def test_search_ranks_matching_documents(index):
+    index.add([_result("https://a", SURFACE_CODE), _result("https://b", THRESHOLD)])
+
+    results = index.search("surface code stabilizer", num_results=5, max_age=60)
+
+    assert [r["url"] for r in results] == ["https://a"]
+    assert results[0]["text"] == SURFACE_CODE
+    assert results[0]["coverage"] == 1.0
+
+
+def test_search_ignores_stale_documents(index):
+    index.add([_result("https://a", SURFACE_CODE)])
+
+    assert index.search("surface code", num_results=5, max_age=-1) == []
+
+
+def test_answer_requires_enough_covering_documents(index):
+    index.add([_result("https://a", SURFACE_CODE), _result("https://b", THRESHOLD)])
+
+    assert index.answer("qubits", num_results=5, max_age=60, min_results=2, min_coverage=1.0) is not None
+    assert index.answer("surface code", num_results=5, max_age=60, min_results=2, min_coverage=1.0) is None
+
+    stats = index.stats()
+    assert stats["remote_searches_avoided"] == 1
+    assert stats["remote_searches"] == 1
+    assert stats["avoided_ratio"] == 0.5
+
+
+def test_compact_evicts_oldest_documents(tmp_path):
+    index = KnowledgeIndex(str(tmp_path / "knowledge.db"), chunk_tokens=60, max_documents=1, compact_every=0)
+    index.add([_result("https://a", SURFACE_CODE)])
+    index.add([_result("https://b", THRESHOLD)])
+
+    assert index.compact() == 1
+    assert index.stats()["documents"] == 1
+    assert index.search("surface code", num_results=5, max_age=60) == []
+    assert index.search("threshold", num_results=5, max_age=60)[0]["url"] == "https://b"
+
+
+def test_search_tool_answers_from_index(index, monkeypatch):
+    monkeypatch.setattr("app.core.research_tools.KNOWLEDGE_MIN_RESULTS", 1)
+    index.add([_result("https://a", SURFACE_CODE)])
+    tools = ResearchExaTools(research_query="surface code", knowledge=index)
+    tools.exa = None  # Any remote call would fail
+
+    results = json.loads(tools.search_exa("surface code decoder"))
+
+    assert [r["url"] for r in results] == ["https://a"]
+    assert "coverage" not in results[0]
+    assert tools.local_searches == 1
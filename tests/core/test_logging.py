@@ -0,0 +1,51 @@
+"""
+Tests for queued, sampled logging.
+"""
+import contextvars
+import logging
+import queue
+import sys
+
+from app.core import logging_config
+from app.core.logging_config import LocalQueueHandler, RequestContextFilter
+
+
+def _handle_in_request(handler, sampled, records):
+    def run():
+        logging_config._request_sampled.set(sampled)
+        for record in records:
+            handler.handle(record)
+
+    contextvars.copy_context().run(run)
+
+
+def _record(level, msg, *args):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+def test_unsampled_requests_keep_only_warnings_and_errors():
+    log_queue = queue.SimpleQueue()
+    handler = LocalQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter())
+
+    _handle_in_request(handler, False, [_record(logging.INFO, "dropped"), _record(logging.WARNING, "kept")])
+    _handle_in_request(handler, True, [_record(logging.INFO, "kept %s", "too")])
+
+    messages = []
+    while not log_queue.empty():
+        messages.append(log_queue.get().msg)
+    assert messages == ["kept", "kept too"]
+
+
+def test_queued_records_keep_exception_info_for_the_writer():
+    log_queue = queue.SimpleQueue()
+    handler = LocalQueueHandler(log_queue)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord("test", logging.ERROR, __file__, 1, "failed: %s", ("x",), sys.exc_info())
+    handler.handle(record)
+
+    queued = log_queue.get()
+    assert queued.msg == "failed: x" and queued.args is None
+    assert "ValueError: boom" in logging.Formatter().format(queued)
@@ -0,0 +1,56 @@
+"""
+Tests for the event loop monitor.
+"""
+import asyncio
+import time
+
+import pytest
+from agno.run.response import RunResponse
+
+from app.core.loop_monitor import LoopMonitor
+from app.core.openai_service import AgnoService
+from app.models.chat import ChatMessage
+
+
+class SlowAgent:
+    """Streams a few chunks, blocking its thread while waiting for each."""
+
+    def run(self, message, stream=False):
+        for word in ("slow", "model"):
+            time.sleep(0.15)
+            yield RunResponse(content=word)
+
+
+def blocking_handler():
+    time.sleep(0.3)
+
+
+def test_blocking_call_is_reported_with_its_stack():
+    async def run():
+        async with LoopMonitor(interval=0.01, threshold=0.05) as monitor:
+            blocking_handler()
+            await asyncio.sleep(0.05)
+        return monitor
+
+    monitor = asyncio.run(run())
+
+    assert len(monitor.blocked) == 1
+    assert "blocking_handler" in monitor.blocked[0].stack
+    assert monitor.max_lag >= 0.25
+    with pytest.raises(AssertionError, match="blocking_handler"):
+        monitor.assert_not_blocked()
+
+
+def test_streaming_chat_does_not_block_the_loop(monkeypatch):
+    monkeypatch.setattr(AgnoService, "_agent_for_run", classmethod(lambda cls, model, history=None: SlowAgent()))
+
+    async def run():
+        async with LoopMonitor(interval=0.01, threshold=0.05) as monitor:
+            stream = AgnoService.chat_completion([ChatMessage(role="user", content="hi")], stream=True)
+            chunks = [chunk.content async for chunk in stream]
+        return monitor, chunks
+
+    monitor, chunks = asyncio.run(run())
+
+    assert chunks == ["slow", "model", ""]
+    monitor.assert_not_blocked()
@@ -0,0 +1,74 @@
+"""
+Tests for the Prometheus metrics.
+"""
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from app.core import metrics
+from app.main import app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _sample(name, labels):
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_endpoint_reports_request_latency_per_route():
+    labels = {"method": "GET", "route": "/", "model": "", "status": "200"}
+    before = _sample("http_request_duration_seconds_count", labels)
+
+    client = TestClient(app)
+    assert client.get("/").status_code == 200
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "http_request_duration_seconds_bucket" in response.text
+    assert _sample("http_request_duration_seconds_count", labels) == before + 1
+
+
+def test_stream_meter_records_ttft_and_throughput():
+    labels = {"endpoint": "test", "model": "gpt-4o"}
+    meter = metrics.StreamMeter("test", "gpt-4o")
+    assert _sample("streams_in_progress", {"endpoint": "test"}) == 1
+
+    meter.content("")
+    meter.content("x" * 400)
+    meter.content("y" * 400)
+    meter.finish()
+    meter.finish()
+
+    assert _sample("stream_time_to_first_token_seconds_count", labels) == 1
+    assert _sample("stream_tokens_per_second_count", labels) == 1
+    assert _sample("streams_in_progress", {"endpoint": "test"}) == 0
+
+
+def test_model_labels_are_bounded_to_known_models():
+    assert metrics.model_label("gpt-4o") == "gpt-4o"
+    # Versions count as their model, the longest known name winning
+    assert metrics.model_label("gpt-4o-mini-2024-07-18") == "gpt-4o-mini"
+    assert metrics.model_label("made-up-model-123") == "other"
+    assert metrics.model_label(None) == ""
+
+    before = _sample("stream_time_to_first_token_seconds_count", {"endpoint": "test", "model": "other"})
+    meter = metrics.StreamMeter("test", "made-up-model-456")
+    meter.content("x")
+    meter.finish()
+    assert _sample("stream_time_to_first_token_seconds_count", {"endpoint": "test", "model": "other"}) == before + 1
+
+
+def test_multiprocess_metrics_aggregate_across_workers(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path), PYTHONPATH=ROOT)
+    record = "from app.core.metrics import RESEARCH_RUNS_JOINED; RESEARCH_RUNS_JOINED.inc()"
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", record], env=env, check=True)
+
+    scrape = "from app.core.metrics import render; print(render()[0].decode())"
+    output = subprocess.run([sys.executable, "-c", scrape], env=env, check=True, capture_output=True, text=True).stdout
+
+    assert "research_runs_joined_total 2.0" in output
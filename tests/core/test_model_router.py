@@ -0,0 +1,115 @@
+"""
+Tests for routing model_name=auto requests.
+"""
+import asyncio
+import time
+
+from app.core import openai_service
+from app.core.model_router import CLOSED, HALF_OPEN, OPEN, ModelRouter
+from app.core.openai_service import AgnoService
+from app.models.chat import ChatMessage, ChatResponse
+
+
+def _messages(text):
+    return [ChatMessage(role="user", content=text)]
+
+
+def test_requests_are_routed_by_complexity():
+    router = ModelRouter(["gpt-4o-mini", "gpt-4o"], long_prompt_tokens=500)
+
+    assert router.route(_messages("What is the capital of France?")).model == "gpt-4o-mini"
+    decision = router.route(_messages("Why does this fail?\n```python\ndef f(): return 1/0\n```"))
+    assert (decision.model, decision.reason, decision.candidates) == ("gpt-4o", "preferred", ["gpt-4o", "gpt-4o-mini"])
+    assert router.route(_messages("word " * 2000)).model == "gpt-4o"
+
+
+def test_degraded_models_are_avoided_until_they_recover():
+    router = ModelRouter(["gpt-4o-mini", "gpt-4o"], "gpt-4", degraded_latency_factor=2.0, breaker_cooldown=0.2)
+    for _ in range(20):
+        router.observe("gpt-4o-mini", 0.5, ok=True)
+    for _ in range(10):
+        router.observe("gpt-4o-mini", 3.0, ok=True)
+
+    decision = router.route(_messages("Hello"))
+    assert (decision.model, decision.reason) == ("gpt-4o", "degraded")
+    assert router.stats()["health"]["gpt-4o-mini"]["latency_ms"] > 1000
+
+    # Streamed requests' time to the first token is averaged apart from full response times
+    for _ in range(20):
+        router.observe("gpt-4", 2.0, ok=True)
+        router.observe("gpt-4", 0.2, ok=True, stream=True)
+    health = router.stats()["health"]["gpt-4"]
+    assert (health["latency_ms"], health["ttft_ms"]) == (2000.0, 200.0)
+
+    for _ in range(3):
+        router.observe("gpt-4o", 0.4, ok=False)
+    decision = router.route(_messages("Explain how to compare these designs"))
+    assert (decision.model, decision.reason) == ("gpt-4o", "no_healthy_model")
+
+    # Averages not updated for a cooldown no longer keep a model out
+    time.sleep(0.25)
+    assert router.route(_messages("Hello")).model == "gpt-4o-mini"
+
+
+def test_circuit_opens_after_failures_and_closes_after_a_successful_probe():
+    router = ModelRouter(["gpt-4o-mini", "gpt-4o"], breaker_failures=3, breaker_cooldown=0.1, degraded_error_rate=1.0)
+    for _ in range(3):
+        router.observe("gpt-4o-mini", 1.0, ok=False)
+    assert router.stats()["health"]["gpt-4o-mini"]["state"] == OPEN
+
+    decision = router.route(_messages("Hello"))
+    assert (decision.model, decision.reason) == ("gpt-4o", "circuit_open")
+
+    time.sleep(0.15)
+    assert router.route(_messages("Hello")).model == "gpt-4o-mini"
+    assert router.stats()["health"]["gpt-4o-mini"]["state"] == HALF_OPEN
+    # Only one probe at a time
+    assert router.route(_messages("Hello")).model == "gpt-4o"
+
+    router.observe("gpt-4o-mini", 0.5, ok=True)
+    assert router.stats()["health"]["gpt-4o-mini"]["state"] == CLOSED
+    assert router.route(_messages("Hello")).model == "gpt-4o-mini"
+
+
+def test_only_routed_models_and_the_default_model_are_tracked():
+    router = ModelRouter(["gpt-4o-mini", "gpt-4o"], default_model="gpt-4")
+    for model in ("gpt-4", "gpt-4o", "made-up-model-1", "made-up-model-2"):
+        router.observe(model, 0.5, ok=True)
+    assert set(router.circuit_states()) == {"gpt-4", "gpt-4o"}
+
+
+def test_routed_requests_fail_over_to_the_next_model(monkeypatch):
+    router = ModelRouter(["gpt-4o-mini", "gpt-4o"])
+    monkeypatch.setattr(openai_service, "model_router", router)
+    monkeypatch.setattr(AgnoService, "_prepare_run", classmethod(lambda cls, messages, model: (model, None)))
+
+    def run(cls, agent, message, model, start, max_retries=3):
+        assert max_retries == (1 if agent == "gpt-4o-mini" else 3)
+        if agent == "gpt-4o-mini":
+            raise RuntimeError("upstream unavailable")
+        return ChatResponse(message=ChatMessage(role="assistant", content="Paris"), model=model)
+
+    monkeypatch.setattr(AgnoService, "_run_with_retries", classmethod(run))
+    response = AgnoService.chat_completion(messages=_messages("Capital of France?"), model_name="auto")
+    assert response.model == "gpt-4o"
+    assert response.routing["reason"] == "failed_over"
+
+    class Agent:
+        def __init__(self, model):
+            self.model = model
+
+        def run(self, message, stream):
+            if self.model == "gpt-4o-mini":
+                raise RuntimeError("upstream unavailable")
+            return iter([type("Chunk", (), {"content": "Paris"})()])
+
+    monkeypatch.setattr(AgnoService, "_prepare_run", classmethod(lambda cls, messages, model: (Agent(model), None)))
+
+    async def stream():
+        return [chunk async for chunk in AgnoService.chat_completion(
+            messages=_messages("Capital of France?"), model_name="auto", stream=True
+        )]
+
+    chunks = asyncio.run(stream())
+    assert [c.content for c in chunks] == ["Paris", ""]
+    assert chunks[-1].model == "gpt-4o" and chunks[-1].routing["reason"] == "failed_over"
@@ -0,0 +1,54 @@
+"""
+Tests for the state shared between a preloaded gunicorn master and its workers.
+"""
+import gc
+import json
+import os
+
+from app.core import prefork
+from app.core.sessions import SessionStore
+
+
+def test_forked_workers_reopen_stores_and_share_what_was_warmed(tmp_path, monkeypatch):
+    # A registry of our own, so the app's singletons are left alone
+    monkeypatch.setattr(prefork, "_warm_ups", [])
+    monkeypatch.setattr(prefork, "_before_fork", [])
+    monkeypatch.setattr(prefork, "_after_fork", [])
+    monkeypatch.setattr(prefork, "_warmed", False)
+    warmed = []
+    prefork.warm_up(lambda: warmed.append("cache"))
+    prefork.warm_up(lambda: 1 / 0)
+
+    store = SessionStore(str(tmp_path / "sessions.db"), max_bytes=10_000, max_sessions=10, ttl=3600)
+    session_id = store.create()
+    store.append(session_id, [("user", "from the master")])
+
+    try:
+        prefork.prepare_master()
+        prefork.prepare_master()
+        # Warmed once however many workers are forked; a failed warm-up is only logged
+        assert warmed == ["cache"]
+
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read)
+                prefork.prepare_worker()
+                store.append(session_id, [("assistant", "from a worker")])
+                result = {"warmed": warmed, "turns": store.get(session_id)}
+                os.write(write, json.dumps(result).encode())
+            finally:
+                os._exit(0)
+        os.close(write)
+        with os.fdopen(read) as f:
+            result = json.loads(f.read())
+        os.waitpid(pid, 0)
+    finally:
+        gc.unfreeze()
+        prefork.prepare_worker()
+
+    assert result["warmed"] == ["cache"]
+    assert result["turns"] == [["user", "from the master"], ["assistant", "from a worker"]]
+    # The master's own connection is open again and sees the worker's turn
+    assert store.get(session_id) == [("user", "from the master"), ("assistant", "from a worker")]
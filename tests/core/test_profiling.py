@@ -0,0 +1,109 @@
+"""
+Tests for per-request and continuous profiling.
+"""
+import asyncio
+import pstats
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import profiling
+from app.core.offload import run_in_thread
+from app.main import app
+
+ADMIN_KEY = "test-admin-key"
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr("app.api.admin.ADMIN_API_KEY", ADMIN_KEY)
+    return tmp_path
+
+
+def busy_loop(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_sampler_collapses_running_stacks_and_skips_idle_threads():
+    stop = threading.Event()
+
+    def work():
+        while not stop.is_set():
+            busy_loop(0.01)
+
+    busy = threading.Thread(target=work)
+    idle = threading.Thread(target=stop.wait)
+    busy.start()
+    idle.start()
+    try:
+        sampler = profiling.StackSampler(interval=0.001, thread_ids=lambda: [busy.ident, idle.ident])
+        for _ in range(20):
+            sampler.sample()
+    finally:
+        stop.set()
+        busy.join()
+        idle.join()
+
+    lines = sampler.folded().splitlines()
+    assert lines
+    assert all("busy_loop (core/test_profiling.py:" in line for line in lines)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == 20
+
+
+def test_cpu_profile_includes_offloaded_calls(profile_dir):
+    async def handle():
+        profile = profiling.start_request_profile("cpu", "r1")
+        await run_in_thread(busy_loop, 0.01)
+        return profile.finish()
+
+    path = asyncio.run(handle())
+
+    functions = {name for _, _, name in pstats.Stats(path).stats}
+    assert "busy_loop" in functions
+    # Only one cpu profile may run on the event loop at a time; the lock is released again
+    assert profiling._cpu_profile_lock.acquire(blocking=False)
+    profiling._cpu_profile_lock.release()
+
+
+def test_profile_requires_admin_key_and_is_downloadable(profile_dir):
+    client = TestClient(app)
+
+    assert "X-Profile-ID" not in client.get("/", headers={"X-Profile": "cpu"}).headers
+    names = [
+        client.get("/?profile=sample", headers={"X-Admin-Key": ADMIN_KEY, "X-Request-ID": "abc"}).headers["X-Profile-ID"]
+        for _ in range(2)
+    ]
+    # A repeated request id doesn't overwrite the earlier profile
+    assert names[0] != names[1]
+    assert all(name.startswith("request-abc-") and name.endswith(".folded") for name in names)
+
+    listing = client.get("/api/v1/admin/profiles", headers={"X-Admin-Key": ADMIN_KEY}).json()
+    assert sorted(p["name"] for p in listing["profiles"]) == sorted(names)
+    download = client.get(f"/api/v1/admin/profiles/{names[0]}", headers={"X-Admin-Key": ADMIN_KEY})
+    assert download.status_code == 200
+    assert client.get("/api/v1/admin/profiles/..%2Fsecret", headers={"X-Admin-Key": ADMIN_KEY}).status_code == 404
+
+
+def test_profile_artifact_is_written_off_the_event_loop(profile_dir, monkeypatch):
+    write = profiling.RequestProfile.write
+    writers = []
+
+    def recording_write(self):
+        try:
+            asyncio.get_running_loop()
+            writers.append("event loop")
+        except RuntimeError:
+            writers.append("thread")
+        return write(self)
+
+    monkeypatch.setattr(profiling.RequestProfile, "write", recording_write)
+    client = TestClient(app)
+    name = client.get("/?profile=cpu", headers={"X-Admin-Key": ADMIN_KEY}).headers["X-Profile-ID"]
+
+    assert writers == ["thread"]
+    assert (profile_dir / name).exists()
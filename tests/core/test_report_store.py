@@ -0,0 +1,79 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.api import endpoints
+from app.core.report_store import ReportStore, normalize_query, report_key
+from app.main import app
+
+
+def test_normalize_query():
+    """Case, punctuation and whitespace differences share a key."""
+    assert normalize_query("  Latest on   Quantum Computing?! ") == "latest on quantum computing"
+    assert report_key("Latest on X", "gpt-4") == report_key("latest on x?", "gpt-4")
+    assert report_key("Latest on X", "gpt-4") != report_key("Latest on X", "gpt-4o")
+    # Reports produced under other research limits are kept apart
+    assert report_key("Latest on X", "gpt-4") != report_key("Latest on X", "gpt-4", {"max_tool_calls": 2})
+
+
+def test_freshness_window(tmp_path):
+    """Reports are reused only inside the freshness window."""
+    store = ReportStore(str(tmp_path / "reports.db"))
+    store.put("Latest on X", "gpt-4", "# Report")
+
+    assert store.get("latest on x", "gpt-4", max_age=60)["content"] == "# Report"
+    assert store.get("latest on x", "gpt-4", max_age=0) is None
+    assert store.get("latest on x", "o3-mini", max_age=60) is None
+
+    # A report produced under smaller limits is only served to requests with the same limits
+    store.put("Latest on X", "o3-mini", "# Short report", budget={"max_tool_calls": 2})
+    assert store.get("latest on x", "o3-mini", max_age=60) is None
+    assert store.get("latest on x", "o3-mini", max_age=60, budget={"max_tool_calls": 2})["content"] == "# Short report"
+
+    time.sleep(0.05)
+    assert store.get("latest on x", "gpt-4", max_age=0.01) is None
+    assert store.stats() == {"entries": 2, "hits": 2, "misses": 3}
+
+
+def test_invalidate(tmp_path):
+    """Invalidation can target a query, a model or everything."""
+    store = ReportStore(str(tmp_path / "reports.db"))
+    store.put("Latest on X", "gpt-4", "a")
+    store.put("Latest on X", "o3-mini", "b")
+    store.put("Latest on Y", "gpt-4", "c")
+
+    assert store.invalidate(query="latest on x!", model_name="gpt-4") == 1
+    assert store.invalidate(model_name="o3-mini") == 1
+    assert store.invalidate() == 1
+    assert store.stats()["entries"] == 0
+
+
+def test_drained_refresh_keeps_the_complete_report(tmp_path, monkeypatch):
+    """A refresh cut short by a draining worker stores a partial report apart, for a retry to resume from."""
+    store = ReportStore(str(tmp_path / "reports.db"))
+    store.put("Latest on X", "gpt-4", "# Report")
+    monkeypatch.setattr(endpoints, "report_store", store)
+    resumed = []
+
+    async def research(query, stream, budget, model_name, resume=None):
+        resumed.append(resume)
+        drained = resume is None
+        yield {"type": "content", "content": "# Partial" if drained else "# New report", "done": False, "model": model_name}
+        usage = {"budget_exhausted": "drain" if drained else None}
+        yield {"type": "done", "content": "", "done": True, "model": model_name, "usage": usage}
+
+    monkeypatch.setattr(endpoints.research_service, "research", research)
+    client = TestClient(app)
+    body = {"query": "Latest on X", "model_name": "gpt-4"}
+
+    assert client.post("/api/v1/research", json={**body, "max_age_seconds": 0}).json()["message"]["content"] == "# Partial"
+    # The complete report is still served, and the partial one is not counted as a hit
+    assert store.get("latest on x", "gpt-4", max_age=60)["content"] == "# Report"
+    assert client.post("/api/v1/research", json=body).json()["cached"]
+    assert store.get_partial("latest on x", "gpt-4", max_age=60)["content"] == "# Partial"
+
+    # The retried refresh resumes from the partial report, whose complete report supersedes it
+    assert client.post("/api/v1/research", json={**body, "max_age_seconds": 0}).json()["message"]["content"] == "# New report"
+    assert resumed == [None, "# Partial"]
+    assert store.get("latest on x", "gpt-4", max_age=60)["content"] == "# New report"
+    assert store.get_partial("latest on x", "gpt-4", max_age=60) is None
@@ -0,0 +1,76 @@
+"""
+Tests for the request middleware.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.core import tracing
+from app.core.request_middleware import RequestMiddleware
+
+
+def _app(events):
+    @asynccontextmanager
+    async def lifespan(app):
+        events.append("startup")
+        yield
+        events.append("shutdown")
+
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(RequestMiddleware, is_admin=lambda key: False)
+
+    @app.get("/test/stream")
+    async def stream(req: Request):
+        req.state.model = "gpt-4o"
+        request_id = tracing.get_request_id()
+
+        async def chunks():
+            for _ in range(3):
+                await asyncio.sleep(0.05)
+                yield f"{request_id}\n".encode()
+
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    @app.get("/test/fail")
+    async def fail():
+        raise RuntimeError("broken")
+
+    return app
+
+
+def test_streams_are_measured_to_the_last_byte():
+    labels = {"method": "GET", "route": "/test/stream", "model": "gpt-4o", "status": "200"}
+    size_labels = {"method": "GET", "route": "/test/stream"}
+    count_before = REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) or 0
+    sum_before = REGISTRY.get_sample_value("http_request_duration_seconds_sum", labels) or 0
+    bytes_before = REGISTRY.get_sample_value("http_response_size_bytes_sum", size_labels) or 0
+
+    events = []
+    with TestClient(_app(events)) as client:
+        response = client.get("/test/stream", headers={"X-Request-ID": "stream-1"})
+        assert events == ["startup"]
+    assert events == ["startup", "shutdown"]
+
+    # The endpoint ran in the request's context and the body passed through unchanged
+    assert response.headers["X-Request-ID"] == "stream-1"
+    assert response.text == "stream-1\n" * 3
+    assert REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) == count_before + 1
+    assert REGISTRY.get_sample_value("http_request_duration_seconds_sum", labels) - sum_before >= 0.15
+    assert REGISTRY.get_sample_value("http_response_size_bytes_sum", size_labels) - bytes_before == len(response.content)
+
+
+def test_errors_become_500_responses_with_the_request_id():
+    labels = {"method": "GET", "route": "/test/fail", "model": "", "status": "500"}
+    before = REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) or 0
+
+    client = TestClient(_app([]), raise_server_exceptions=False)
+    response = client.get("/test/fail", headers={"X-Request-ID": "fail-1"})
+
+    assert response.status_code == 500
+    assert response.json() == {"detail": "Internal server error"}
+    assert response.headers["X-Request-ID"] == "fail-1"
+    assert REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) == before + 1
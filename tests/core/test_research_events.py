@@ -0,0 +1,151 @@
+import asyncio
+import json
+import time
+
+from agno.models.message import MessageMetrics
+from agno.run.response import RunEvent, RunResponse
+
+from app.core.research_budget import ResearchBudget, cut_short
+from app.core.research_service import ResearchService
+
+
+class FakeModel:
+    def __init__(self, id):
+        self.id = id
+        self.tool_choice = None
+
+
+class FakeAgent:
+    """Replays a fixed sequence of Agno run responses, optionally pausing before some."""
+
+    def __init__(self, chunks, delays=None):
+        self.model = FakeModel("gpt-4")
+        self.chunks = chunks
+        self.delays = delays or {}
+
+    def run(self, message, stream=False, **kwargs):
+        for index, chunk in enumerate(self.chunks):
+            time.sleep(self.delays.get(index, 0))
+            yield chunk
+
+
+def _tool_chunks(call_id="c1", urls=("https://example.com",)):
+    started = {"tool_call_id": call_id, "tool_name": "search_exa", "tool_args": {"query": "x"}}
+    result = json.dumps([{"url": url} for url in urls])
+    finished = dict(started, content=result, metrics=MessageMetrics(time=0.25))
+    return [
+        RunResponse(content="search_exa(query=x)", event=RunEvent.tool_call_started.value, tools=[started]),
+        RunResponse(content="done", event=RunEvent.tool_call_completed.value, tools=[finished]),
+    ]
+
+
+def _service(*agents):
+    service = ResearchService(model_name="gpt-4")
+    pending = list(agents)
+    service._create_agent = lambda *args, **kwargs: pending.pop(0)
+    return service
+
+
+async def _collect_async(service, budget=None, resume=None):
+    return [event async for event in service.research("x", stream=True, budget=budget, resume=resume)]
+
+
+def _collect(service, budget=None):
+    return asyncio.run(_collect_async(service, budget))
+
+
+def test_tool_calls_become_typed_events():
+    """Tool calls are announced once each, intermediate steps are dropped."""
+    chunks = [RunResponse(content="Run started", event=RunEvent.run_started.value)]
+    chunks += _tool_chunks()
+    chunks += [
+        RunResponse(content="# Report", event=RunEvent.run_response.value),
+        RunResponse(content="# Report", event=RunEvent.run_completed.value),
+    ]
+
+    events = _collect(_service(FakeAgent(chunks)))
+
+    assert [e["type"] for e in events] == ["tool_call_started", "tool_call_finished", "content", "done"]
+    assert all({"content", "done", "model"} <= set(e) for e in events)
+    assert events[0]["tool"] == {"id": "c1", "name": "search_exa", "args": {"query": "x"}}
+    assert events[1]["tool"]["duration_ms"] == 250.0
+    assert events[1]["tool"]["result_size"] == len('[{"url": "https://example.com"}]')
+    assert "".join(e["content"] for e in events) == "# Report"
+    assert events[-1]["usage"]["tool_calls"] == 1
+    assert events[-1]["usage"]["sources"] == 1
+    assert events[-1]["usage"]["budget_exhausted"] is None
+
+
+def test_source_budget_stops_tool_use():
+    """Running out of sources switches the agent to writing."""
+    agent = FakeAgent(_tool_chunks(urls=("https://a", "https://b")) + [RunResponse(content="# Report")])
+    events = _collect(_service(agent), ResearchBudget(max_sources=2))
+
+    assert agent.model.tool_choice == "none"
+    assert events[-1]["usage"]["budget_exhausted"] == "sources"
+
+
+def test_deadline_writes_up_gathered_material():
+    """When the deadline hits during the search phase, a writer reports what was gathered."""
+    searching = FakeAgent(_tool_chunks() + [RunResponse(content="never sent")], delays={2: 5})
+    writer = FakeAgent([RunResponse(content="# Partial report")])
+    service = _service(searching, writer)
+
+    started = time.monotonic()
+    events = _collect(service, ResearchBudget(deadline_seconds=0.4))
+
+    assert time.monotonic() - started < 2
+    assert "".join(e["content"] for e in events) == "# Partial report"
+    assert events[-1]["usage"]["budget_exhausted"] == "deadline"
+    assert events[-1]["usage"]["tool_calls"] == 1
+
+
+def test_output_budget_truncates():
+    """Output stops once the output token budget is spent."""
+    agent = FakeAgent([RunResponse(content="a" * 40), RunResponse(content="b" * 40)])
+    events = _collect(_service(agent), ResearchBudget(max_output_tokens=10))
+
+    assert "".join(e["content"] for e in events) == "a" * 40
+    assert events[-1]["usage"]["budget_exhausted"] == "output_tokens"
+
+
+def test_drain_cut_off_is_reported_and_its_report_resumed():
+    """A run cut short by a draining worker writes up and says so; a retry gets its partial report as context."""
+    searching = FakeAgent(_tool_chunks() + _tool_chunks("c2") + [RunResponse(content="never sent")], delays={2: 0.3})
+    writer = FakeAgent([RunResponse(content="# Partial report")])
+    service = _service(searching, writer)
+
+    async def cut_short_while_running():
+        run = asyncio.ensure_future(_collect_async(service, ResearchBudget(deadline_seconds=180)))
+        await asyncio.sleep(0.1)
+        cut_short(time.monotonic() + 1.0)
+        return await run
+
+    events = asyncio.run(cut_short_while_running())
+    assert "".join(e["content"] for e in events) == "# Partial report"
+    assert events[-1]["usage"]["budget_exhausted"] == "drain"
+
+    contexts = []
+    service = ResearchService(model_name="gpt-4")
+
+    def create_agent(*args, context=None, **kwargs):
+        contexts.append(context)
+        return FakeAgent([RunResponse(content="# Report")])
+
+    service._create_agent = create_agent
+    asyncio.run(_collect_async(service, resume="# Partial report"))
+    assert "# Partial report" in contexts[0]
+
+
+def test_default_budget_allows_several_searches():
+    """Searches ask for the model's own number of results, not the whole source budget, so one doesn't use it up."""
+    service = ResearchService(model_name="gpt-4")
+    agent = service._create_agent(ResearchBudget(), sources_left=lambda: 3)
+    assert agent.tools[0].num_results is None
+
+    urls = [f"https://example.com/{i}" for i in range(10)]
+    agent = FakeAgent(_tool_chunks("c1", urls[:5]) + _tool_chunks("c2", urls[5:]) + [RunResponse(content="# Report")])
+    events = _collect(_service(agent))
+
+    assert agent.model.tool_choice is None
+    assert events[-1]["usage"]["tool_calls"] == 2 and events[-1]["usage"]["budget_exhausted"] is None
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from app.core.research_runs import InflightRuns
+
+
+async def _chunks(fail=False):
+    for part in ["hello ", "world"]:
+        await asyncio.sleep(0.01)
+        yield {"content": part, "done": False}
+    if fail:
+        raise RuntimeError("upstream failed")
+    yield {"content": "", "done": True, "usage": {"tool_calls": 0}}
+
+
+def test_subscribers_share_one_run():
+    """Late subscribers replay earlier chunks and the report is stored once."""
+    async def scenario():
+        runs = InflightRuns()
+        stored = []
+        run = runs.launch("k", _chunks(), on_complete=lambda content, usage: stored.append((content, usage)))
+        assert runs.get("k") is run
+
+        async def collect():
+            return [chunk["content"] async for chunk in run.subscribe()]
+
+        first = asyncio.ensure_future(collect())
+        await asyncio.sleep(0.015)
+        second = asyncio.ensure_future(collect())
+
+        assert await first == await second == ["hello ", "world", ""]
+        assert await run.result() == "hello world"
+        assert stored == [("hello world", {"tool_calls": 0})]
+        assert runs.get("k") is None
+
+    asyncio.run(scenario())
+
+
+def test_failures_propagate_to_subscribers():
+    """Subscribers see the chunks produced before the failure, then the error."""
+    async def scenario():
+        runs = InflightRuns()
+        run = runs.launch("k", _chunks(fail=True))
+        seen = []
+        with pytest.raises(RuntimeError):
+            async for chunk in run.subscribe():
+                seen.append(chunk["content"])
+        assert seen == ["hello ", "world"]
+        with pytest.raises(RuntimeError):
+            await run.result()
+
+    asyncio.run(scenario())
+
+
+def test_unregistered_run_does_not_replace_leader():
+    """A forced refresh runs alongside the registered run."""
+    async def scenario():
+        runs = InflightRuns()
+        leader = runs.launch("k", _chunks())
+        refresh = runs.launch("k", _chunks(), register=False)
+        assert runs.get("k") is leader
+        assert len(runs) == 2
+        await asyncio.gather(leader.result(), refresh.result())
+        await asyncio.sleep(0)
+        assert len(runs) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,104 @@
+"""
+Tests for server-side conversation sessions.
+"""
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from app.core.openai_service import AgnoService
+from app.core.sessions import MESSAGE_OVERHEAD_BYTES, SessionStore
+from app.main import app
+from app.models.chat import ChatMessage, ChatResponse, StreamingChunk
+
+
+def _store(tmp_path, **kwargs):
+    options = {"max_bytes": 10_000, "max_sessions": 100, "ttl": 3600}
+    options.update(kwargs)
+    return SessionStore(str(tmp_path / "sessions.db"), **options)
+
+
+def test_cache_stays_within_bounds_and_evicted_sessions_are_reloaded(tmp_path):
+    store = _store(tmp_path, max_bytes=3 * (100 + MESSAGE_OVERHEAD_BYTES), max_sessions=2)
+    first, second, third = store.create(), store.create(), store.create()
+    for session_id in (first, second, third):
+        store.append(session_id, [("user", "x" * 100)])
+        store.get(session_id)
+
+    stats = store.stats()
+    assert stats["cached_sessions"] == 2 and stats["evictions"] == 1
+    assert store.get(first) == [("user", "x" * 100)]
+    assert store.stats()["misses"] == 4
+
+    store.append(second, [("assistant", "y" * 100), ("user", "z" * 100)])
+    stats = store.stats()
+    assert stats["cache_bytes"] <= stats["cache_max_bytes"]
+    assert store.get(second) == [("user", "x" * 100), ("assistant", "y" * 100), ("user", "z" * 100)]
+    assert store.get("unknown") is None and not store.append("unknown", [("user", "hi")])
+
+
+def test_workers_see_each_others_turns_and_idle_sessions_expire(tmp_path):
+    worker_a, worker_b = _store(tmp_path), _store(tmp_path)
+    session_id = worker_a.create()
+    worker_a.append(session_id, [("user", "hello"), ("assistant", "hi")])
+    assert worker_b.get(session_id) == [("user", "hello"), ("assistant", "hi")]
+
+    worker_a.append(session_id, [("user", "how are you?")])
+    assert worker_b.get(session_id)[-1] == ("user", "how are you?")
+    assert worker_b.stats()["refreshes"] == 1
+
+    worker_b.ttl = 0
+    time.sleep(0.01)
+    assert worker_b.prune() == 1
+    assert worker_a.get(session_id) is None and worker_b.get(session_id) is None
+
+
+def test_chat_with_a_session_sends_only_the_new_turn(monkeypatch):
+    calls = []
+
+    def chat_completion(cls, messages, stream, **kwargs):
+        calls.append([(m.role, m.content) for m in messages])
+        if not stream:
+            return ChatResponse(message=ChatMessage(role="assistant", content=f"reply {len(calls)}"))
+
+        async def chunks():
+            yield StreamingChunk(content="streamed ", model="gpt-4o")
+            yield StreamingChunk(content="reply", model="gpt-4o")
+            if messages[-1].content != "cut":
+                yield StreamingChunk(content="", done=True, model="gpt-4o")
+
+        return chunks()
+
+    monkeypatch.setattr(AgnoService, "chat_completion", classmethod(chat_completion))
+    client = TestClient(app)
+    session_id = client.post("/api/v1/sessions").json()["session_id"]
+
+    response = client.post("/api/v1/chat", json={"session_id": session_id, "messages": [{"role": "user", "content": "one"}]})
+    assert response.json()["session_id"] == session_id
+    client.post("/api/v1/chat", json={"session_id": session_id, "messages": [{"role": "user", "content": "two"}]})
+    assert calls[-1] == [("user", "one"), ("assistant", "reply 1"), ("user", "two")]
+
+    with client.stream("POST", "/api/v1/chat", json={
+        "session_id": session_id, "stream": True, "messages": [{"role": "user", "content": "three"}]
+    }) as stream:
+        events = [json.loads(line[6:]) for line in stream.iter_lines() if line.startswith("data: ")]
+    assert events[-1]["done"] and events[-1]["session_id"] == session_id
+
+    history = client.get(f"/api/v1/sessions/{session_id}").json()["messages"]
+    assert [m["content"] for m in history] == ["one", "reply 1", "two", "reply 2", "three", "streamed reply"]
+
+    # A stream ending without its final chunk gets an error event and leaves the session as it was
+    with client.stream("POST", "/api/v1/chat", json={
+        "session_id": session_id, "stream": True, "messages": [{"role": "user", "content": "cut"}]
+    }) as stream:
+        events = [json.loads(line[6:]) for line in stream.iter_lines() if line.startswith("data: ")]
+    assert events[-1]["done"] and "turn not saved" in events[-1]["content"]
+    assert len(client.get(f"/api/v1/sessions/{session_id}").json()["messages"]) == 6
+
+    assert client.delete(f"/api/v1/sessions/{session_id}").status_code == 200
+    assert client.post("/api/v1/chat", json={"session_id": session_id, "messages": [{"role": "user", "content": "four"}]}).status_code == 404
+
+
+def test_earlier_messages_are_passed_to_the_agent():
+    agent = AgnoService._agent_for_run("gpt-4o", history=[ChatMessage(role="user", content="My name is Ada.")])
+    assert [(m.role, m.content) for m in agent.add_messages] == [("user", "My name is Ada.")]
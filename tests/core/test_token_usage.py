@@ -0,0 +1,96 @@
+"""
+Tests for token usage accounting.
+"""
+from types import SimpleNamespace
+
+import pytest
+from agno.models.message import Message
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from prometheus_client import REGISTRY
+
+from app.core import token_usage
+from app.core.openai_model import TracedOpenAIChat
+
+
+class FakeCompletions:
+    def __init__(self, response):
+        self.response = response
+
+    def create(self, **kwargs):
+        return self.response
+
+
+def _model(response):
+    return TracedOpenAIChat(id="gpt-4o", api_key="test", client=SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(response))))
+
+
+def _completion(content, usage=None):
+    return ChatCompletion.model_validate({
+        "id": "c", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": usage,
+    })
+
+
+def _chunk(content=None, usage=None):
+    choices = [{"index": 0, "delta": {"content": content}}] if content is not None else []
+    return ChatCompletionChunk.model_validate({
+        "id": "c", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o", "choices": choices, "usage": usage,
+    })
+
+
+@pytest.fixture(autouse=True)
+def length_estimates(monkeypatch):
+    # Tests run offline, where tiktoken cannot fetch its encodings
+    monkeypatch.setattr(token_usage, "_tokenizer_available", False)
+
+
+def test_upstream_usage_is_recorded_per_model_and_client():
+    labels = {"model": "gpt-4o", "client": "team-a", "kind": "prompt"}
+    before = REGISTRY.get_sample_value("model_tokens_total", labels) or 0.0
+    model = _model(_completion("Hi", {"prompt_tokens": 1000, "completion_tokens": 500, "total_tokens": 1500}))
+
+    client = token_usage.client_var.set(token_usage.resolve_client("team-a"))
+    try:
+        with token_usage.track() as usage:
+            model.invoke([Message(role="user", content="Hello")])
+    finally:
+        token_usage.client_var.reset(client)
+
+    assert usage.as_dict() == {
+        "prompt_tokens": 1000,
+        "completion_tokens": 500,
+        "total_tokens": 1500,
+        "model_requests": 1,
+        "token_source": "upstream",
+        "cost_usd": 0.0075,
+    }
+    assert REGISTRY.get_sample_value("model_tokens_total", labels) == before + 1000
+
+
+def test_streams_without_upstream_usage_are_counted_incrementally():
+    model = _model(iter([_chunk("x" * 40), _chunk("y" * 40), _chunk(usage=None)]))
+
+    with token_usage.track() as usage:
+        stream = model.invoke_stream([Message(role="user", content="z" * 80)])
+        next(stream)
+        # Abandoned mid-stream: the tokens generated so far still count
+        stream.close()
+
+    result = usage.as_dict()
+    assert result["completion_tokens"] == 10
+    assert result["prompt_tokens"] == 20 + token_usage.MESSAGE_OVERHEAD_TOKENS
+    assert result["token_source"] == "estimate"
+
+
+def test_prices_match_model_versions_by_longest_prefix():
+    assert token_usage.price("gpt-4o-mini-2024-07-18") == token_usage.PRICES["gpt-4o-mini"]
+    assert token_usage.price("gpt-4-0613") == token_usage.PRICES["gpt-4"]
+    assert token_usage.price("unknown-model") is None
+
+
+def test_tokenizers_are_cached_per_encoding_not_per_model_name():
+    counts = {token_usage.count_tokens("Hello world", f"client-model-{i}") for i in range(50)}
+    assert counts == {token_usage.count_tokens("Hello world", "gpt-4o")}
+    # Made-up model names share the fallback encoding instead of adding cache entries
+    assert len(token_usage._encodings) <= 3
@@ -0,0 +1,110 @@
+"""
+Tests for request tracing.
+"""
+import json
+import os
+
+import pytest
+from agno.models.message import MessageMetrics
+from agno.run.response import RunEvent, RunResponse
+from fastapi.testclient import TestClient
+
+from app.core import tracing
+from app.core.research_service import ToolCallTimer
+from app.main import app
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    exporter = tracing.FileSpanExporter(str(tmp_path))
+    tracing.configure(exporter)
+    yield exporter
+    tracing.configure(None)
+
+
+def _spans(exporter):
+    exporter.flush()
+    spans = []
+    with open(exporter.path) as f:
+        for line in f:
+            for resource in json.loads(line)["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    spans.extend(scope["spans"])
+    return {s["name"]: s for s in spans}
+
+
+def test_request_id_is_echoed_or_generated():
+    client = TestClient(app)
+
+    assert client.get("/", headers={"X-Request-ID": "abc-123"}).headers["X-Request-ID"] == "abc-123"
+    generated = client.get("/", headers={"X-Request-ID": "not an id!"}).headers["X-Request-ID"]
+    assert generated != "not an id!" and len(generated) == 32
+
+
+def test_spans_nest_and_export_as_otlp_json(exporter):
+    root = tracing.start_span("root", parent=None)
+    with tracing.use_span(root):
+        with tracing.span("child", model="m") as child:
+            child.add_event("offload.started", {"queued_ms": 1.5})
+        with pytest.raises(RuntimeError):
+            with tracing.span("failing"):
+                raise RuntimeError("boom")
+    root.end()
+
+    spans = _spans(exporter)
+    assert spans["child"]["traceId"] == spans["root"]["traceId"]
+    assert spans["child"]["parentSpanId"] == spans["root"]["spanId"]
+    assert "parentSpanId" not in spans["root"]
+    assert spans["child"]["attributes"] == [{"key": "model", "value": {"stringValue": "m"}}]
+    assert spans["child"]["events"][0]["name"] == "offload.started"
+    assert spans["failing"]["status"] == {"code": 2, "message": "RuntimeError: boom"}
+
+
+def test_remote_parent_continues_the_callers_trace(exporter):
+    remote = tracing.parse_traceparent("00-" + "a" * 32 + "-" + "b" * 16 + "-01")
+    tracing.start_span("request", parent=None, remote_parent=remote).end()
+
+    span = _spans(exporter)["request"]
+    assert span["traceId"] == "a" * 32
+    assert span["parentSpanId"] == "b" * 16
+
+
+def test_tool_calls_are_recorded_as_spans(exporter):
+    root = tracing.start_span("research.run", parent=None)
+    timer = ToolCallTimer(parent_span=root)
+    started = {"tool_call_id": "c1", "tool_name": "search_exa", "tool_args": {"query": "x"}}
+    finished = dict(started, content="Error: rate limited", metrics=MessageMetrics(time=0.25))
+    timer.events(RunResponse(event=RunEvent.tool_call_started.value, tools=[started]))
+    timer.events(RunResponse(event=RunEvent.tool_call_completed.value, tools=[finished]))
+    root.end()
+
+    span = _spans(exporter)["tool.search_exa"]
+    assert span["parentSpanId"] == root.span_id
+    assert int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"]) == 250_000_000
+    assert span["status"]["message"] == "Error: rate limited"
+
+
+def test_request_span_is_named_after_the_route(exporter):
+    TestClient(app).get("/", headers={"traceparent": "00-" + "c" * 32 + "-" + "d" * 16 + "-01"})
+
+    span = _spans(exporter)["GET /"]
+    assert span["traceId"] == "c" * 32
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in span["attributes"]
+
+
+def test_span_files_rotate_and_the_directory_stays_within_its_limit(tmp_path):
+    exporter = tracing.FileSpanExporter(str(tmp_path), max_bytes=1000, backup_count=2, max_total_bytes=4000)
+    # Left behind by an exited worker
+    stale = tmp_path / "spans-1.jsonl"
+    stale.write_text("x" * 2000)
+    os.utime(stale, (0, 0))
+
+    span = tracing.Span("work", "0" * 32, None, {})
+    for _ in range(30):
+        exporter.write([span])
+
+    assert os.path.getsize(exporter.path) < 1000
+    assert os.path.exists(exporter.path + ".1") and os.path.exists(exporter.path + ".2")
+    assert not os.path.exists(exporter.path + ".3")
+    assert not stale.exists()
+    assert sum(f.stat().st_size for f in tmp_path.iterdir()) <= 4000
@@ -0,0 +1,60 @@
+"""
+Tests for traffic recording.
+"""
+import json
+
+from fastapi.testclient import TestClient
+
+from app.core import traffic_recorder
+from app.core.openai_service import AgnoService
+from app.main import app
+from app.models.chat import ChatMessage, ChatResponse
+
+
+def test_chat_requests_are_recorded_as_anonymized_shapes(tmp_path, monkeypatch):
+    path = tmp_path / "traffic.jsonl"
+    monkeypatch.setattr(traffic_recorder, "recorder", traffic_recorder.TrafficRecorder(str(path)))
+    monkeypatch.setattr(AgnoService, "chat_completion", classmethod(
+        lambda cls, **kwargs: ChatResponse(message=ChatMessage(role="assistant", content="Hi"))
+    ))
+    secret = "my account number is 1234"
+
+    client = TestClient(app)
+    response = client.post("/api/v1/chat", json={
+        "messages": [{"role": "system", "content": "Be brief."}, {"role": "user", "content": secret}],
+        "model_name": "gpt-4o-mini",
+        "max_tokens": 50,
+    })
+    client.get("/")
+
+    assert response.status_code == 200
+    text = path.read_text()
+    assert secret not in text
+    [entry] = traffic_recorder.read_trace([str(path)])
+    assert entry["route"] == "/api/v1/chat"
+    assert entry["messages"] == [["s", 9], ["u", len(secret)]]
+    assert (entry["model"], entry["stream"], entry["max_tokens"], entry["status"]) == ("gpt-4o-mini", False, 50, 200)
+
+
+def test_research_queries_are_fingerprinted_and_traces_merged_by_arrival(tmp_path):
+    class Request:
+        query = "fusion power plants"
+        model_name = "gpt-4o"
+        stream = True
+        max_age_seconds = 0
+        max_tool_calls = max_output_tokens = max_sources = deadline_seconds = None
+
+    shape = traffic_recorder.research_shape(Request)
+    assert shape["query"] == traffic_recorder.fingerprint("fusion power plants") != traffic_recorder.fingerprint("fusion")
+    assert shape["query_chars"] == 19 and shape["max_age_seconds"] == 0 and "max_sources" not in shape
+
+    first, second = tmp_path / "a.jsonl", tmp_path / "b.jsonl"
+    traffic_recorder.TrafficRecorder(str(first)).record("/api/v1/research", 20.0, shape, 200, 1.5)
+    traffic_recorder.TrafficRecorder(str(second)).record("/api/v1/research", 10.0, shape, 200, 2.0)
+    with open(first, "a") as f:
+        # A worker killed mid-write
+        f.write('{"v":1,"ts":3')
+
+    entries = traffic_recorder.read_trace([str(first), str(second)])
+    assert [e["ts"] for e in entries] == [10.0, 20.0]
+    assert json.loads(first.read_text().splitlines()[0])["ms"] == 1500.0
@@ -0,0 +1,400 @@
+"""
+Local stand-in for the OpenAI and Exa APIs, for load tests and offline runs.
+
+Speaks enough of both APIs for the app, the OpenAI SDK and exa_py:
+
+- POST /v1/chat/completions: streaming and non-streaming completions, tool
+  calls when the request offers tools, and usage (streamed when
+  stream_options.include_usage is set)
+- POST /search, /contents, /findSimilar: Exa results with generated page text
+
+Replies are generated deterministically from a fixed vocabulary, so their
+size is controlled by the settings rather than the prompt. Latency, token
+rate, error rates and payload sizes are set on the command line and can be
+changed while running with POST /_config. GET /_stats counts the requests
+served and the errors injected.
+
+Point the app at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+    EXA_BASE_URL=http://127.0.0.1:9100
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "the of and to in research model results data system approach analysis method performance "
+    "recent study evidence source report quantum energy network language learning market policy "
+    "growth significant across several findings suggest while however because further improved "
+    "measured compared baseline increase reduction framework application developed published"
+).split()
+
+
+@dataclass
+class FakeUpstreamSettings:
+    """Behaviour of the fake upstream; every field can be changed at runtime through /_config."""
+
+    # Delay before the first token (streaming) or the whole response
+    latency_ms: float = 300.0
+    # Uniform random variation added to every latency
+    latency_jitter_ms: float = 100.0
+    # Extra delay before the first token per 1000 prompt tokens, like prompt processing upstream
+    prefill_ms_per_1k_tokens: float = 0.0
+    # Share of chat requests that stall for stall_ms before their first token (a slow tail)
+    stall_rate: float = 0.0
+    stall_ms: float = 5000.0
+    # Streaming rate; 0 sends all tokens at once
+    tokens_per_second: float = 50.0
+    # Words in each completion
+    completion_tokens: int = 150
+    # Share of chat requests failing with an injected error before responding
+    error_rate: float = 0.0
+    # Share of those errors returned as 429 rate limits (the rest are 500s)
+    rate_limit_share: float = 0.5
+    # Share of streams cut off halfway, without a finish chunk
+    stream_abort_rate: float = 0.0
+    # Tool calls made per user message before answering, when the request offers tools
+    tool_rounds: int = 1
+    # Exa latency, error rate and page text size
+    exa_latency_ms: float = 400.0
+    exa_error_rate: float = 0.0
+    exa_text_chars: int = 3000
+    seed: int = 0
+
+
+def _prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    # Same rough estimate the app falls back to: 4 characters per token plus per-message overhead
+    return sum(len(json.dumps(m.get("content") or "")) // 4 + 4 for m in messages)
+
+
+def _last_user_text(messages: List[Dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content") or ""
+            if isinstance(content, list):
+                content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            return content
+    return ""
+
+
+def _tool_rounds_since_user(messages: List[Dict[str, Any]]) -> int:
+    rounds = 0
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            break
+        if message.get("role") == "assistant" and message.get("tool_calls"):
+            rounds += 1
+    return rounds
+
+
+def _arguments(parameters: Dict[str, Any], query: str) -> Dict[str, Any]:
+    """Arguments for a tool call, filling the required parameters from the user's message."""
+    properties = parameters.get("properties") or {}
+    arguments: Dict[str, Any] = {}
+    for name in parameters.get("required") or list(properties)[:1]:
+        schema = properties.get(name) or {}
+        kind = schema.get("type")
+        if isinstance(kind, list):
+            kind = next((k for k in kind if k != "null"), None)
+        if kind in ("integer", "number"):
+            arguments[name] = 3
+        elif kind == "boolean":
+            arguments[name] = True
+        elif kind == "array":
+            arguments[name] = [query[:200]]
+        elif kind == "object":
+            arguments[name] = {}
+        else:
+            arguments[name] = query[:200]
+    return arguments
+
+
+class FakeUpstream:
+    """Request handlers and state of one fake upstream server."""
+
+    def __init__(self, settings: Optional[FakeUpstreamSettings] = None):
+        self.settings = settings or FakeUpstreamSettings()
+        self.random = random.Random(self.settings.seed)
+        self.stats: Dict[str, int] = {}
+
+    def count(self, name: str) -> None:
+        self.stats[name] = self.stats.get(name, 0) + 1
+
+    def configure(self, changes: Dict[str, Any]) -> None:
+        names = {f.name for f in fields(FakeUpstreamSettings)}
+        for name, value in changes.items():
+            if name not in names:
+                raise ValueError(f"Unknown setting: {name}")
+            setattr(self.settings, name, type(getattr(self.settings, name))(value))
+
+    async def delay(self, latency_ms: float) -> None:
+        jitter = self.random.uniform(0, self.settings.latency_jitter_ms)
+        await asyncio.sleep(max(0.0, latency_ms + jitter) / 1000)
+
+    def words(self, count: int, key: str) -> List[str]:
+        rng = random.Random(f"{self.settings.seed}:{key}")
+        return [rng.choice(WORDS) for _ in range(count)]
+
+    # OpenAI chat completions
+
+    def _tool_call(self, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The tool call to answer with, if the request offers tools and rounds are left."""
+        tools = [t for t in body.get("tools") or [] if t.get("type") == "function"]
+        choice = body.get("tool_choice")
+        messages = body.get("messages") or []
+        if not tools or choice == "none" or _tool_rounds_since_user(messages) >= self.settings.tool_rounds:
+            return None
+        tool = tools[0]["function"]
+        if isinstance(choice, dict):
+            tool = next((t["function"] for t in tools if t["function"]["name"] == choice["function"]["name"]), tool)
+        self.count("tool_calls")
+        return {
+            "id": f"call_{self.random.getrandbits(48):012x}",
+            "type": "function",
+            "function": {
+                "name": tool["name"],
+                "arguments": json.dumps(_arguments(tool.get("parameters") or {}, _last_user_text(messages))),
+            },
+        }
+
+    def _error(self) -> Optional[JSONResponse]:
+        if self.random.random() >= self.settings.error_rate:
+            return None
+        if self.random.random() < self.settings.rate_limit_share:
+            self.count("errors_429")
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (injected)", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after": "1"},
+            )
+        self.count("errors_500")
+        return JSONResponse(
+            {"error": {"message": "The server had an error (injected)", "type": "server_error", "code": None}},
+            status_code=500,
+        )
+
+    async def chat_completions(self, body: Dict[str, Any]) -> Any:
+        self.count("chat_completions")
+        error = self._error()
+        if error is not None:
+            await self.delay(self.settings.latency_ms)
+            return error
+
+        messages = body.get("messages") or []
+        model = body.get("model") or "gpt-4o"
+        completion_id = f"chatcmpl-{self.random.getrandbits(64):016x}"
+        tool_call = self._tool_call(body)
+        limit = body.get("max_completion_tokens") or body.get("max_tokens")
+        count = min(self.settings.completion_tokens, limit) if limit else self.settings.completion_tokens
+        words = [] if tool_call else self.words(count, _last_user_text(messages) + str(len(messages)))
+        usage = {
+            "prompt_tokens": _prompt_tokens(messages),
+            "completion_tokens": len(words) or len(tool_call["function"]["arguments"]) // 4,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        latency_ms = self.settings.latency_ms + usage["prompt_tokens"] / 1000 * self.settings.prefill_ms_per_1k_tokens
+        if self.random.random() < self.settings.stall_rate:
+            self.count("stalls")
+            latency_ms += self.settings.stall_ms
+
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(
+                self._stream(completion_id, model, words, tool_call, usage if include_usage else None, latency_ms),
+                media_type="text/event-stream",
+            )
+
+        await self.delay(latency_ms)
+        if self.settings.tokens_per_second > 0:
+            await asyncio.sleep(usage["completion_tokens"] / self.settings.tokens_per_second)
+        message: Dict[str, Any] = {"role": "assistant", "content": None if tool_call else " ".join(words)}
+        if tool_call:
+            message["tool_calls"] = [tool_call]
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_call else ("length" if limit and limit < self.settings.completion_tokens else "stop"),
+            }],
+            "usage": usage,
+        }
+
+    async def _stream(
+        self,
+        completion_id: str,
+        model: str,
+        words: List[str],
+        tool_call: Optional[Dict[str, Any]],
+        usage: Optional[Dict[str, int]],
+        latency_ms: float,
+    ) -> AsyncIterator[str]:
+        created = int(time.time())
+
+        def event(delta: Optional[Dict[str, Any]], finish_reason: Optional[str] = None, **extra: Any) -> str:
+            choices = [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model, "choices": choices}
+            chunk.update(extra)
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        if tool_call:
+            arguments = tool_call["function"]["arguments"]
+            step = max(1, len(arguments) // 4)
+            pieces = [arguments[i:i + step] for i in range(0, len(arguments), step)]
+        else:
+            pieces = [word if i == 0 else " " + word for i, word in enumerate(words)]
+        abort_at = len(pieces) // 2 if self.random.random() < self.settings.stream_abort_rate else None
+        interval = 1 / self.settings.tokens_per_second if self.settings.tokens_per_second > 0 else 0
+
+        await self.delay(latency_ms)
+        yield event({"role": "assistant", "content": None if tool_call else ""})
+        started = time.perf_counter()
+        for i, piece in enumerate(pieces):
+            if i == abort_at:
+                self.count("streams_aborted")
+                raise ConnectionAbortedError("Stream aborted (injected)")
+            if interval:
+                # Pace against the start of the stream so scheduling delays do not accumulate
+                wait = started + i * interval - time.perf_counter()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            if tool_call:
+                call: Dict[str, Any] = {"index": 0, "function": {"arguments": piece}}
+                if i == 0:
+                    call.update(id=tool_call["id"], type="function")
+                    call["function"]["name"] = tool_call["function"]["name"]
+                yield event({"tool_calls": [call]})
+            else:
+                yield event({"content": piece})
+        yield event({}, "tool_calls" if tool_call else "stop")
+        if usage is not None:
+            yield event(None, usage=usage)
+        yield "data: [DONE]\n\n"
+
+    # Exa
+
+    def _page(self, url: str, rank: int, contents: Dict[str, Any]) -> Dict[str, Any]:
+        digest = hashlib.sha1(url.encode()).hexdigest()[:12]
+        title = " ".join(self.words(6, url)).capitalize()
+        result: Dict[str, Any] = {
+            "id": url,
+            "url": url,
+            "title": title,
+            "publishedDate": datetime.now(timezone.utc).strftime("%Y-%m-%dT00:00:00.000Z"),
+            "author": f"Author {digest[:4]}",
+            "score": round(max(0.05, 0.9 - rank * 0.05), 3),
+        }
+        text_options = contents.get("text")
+        if text_options is not None and text_options is not False:
+            limit = self.settings.exa_text_chars
+            if isinstance(text_options, dict) and text_options.get("maxCharacters"):
+                limit = min(limit, int(text_options["maxCharacters"]))
+            sentences = []
+            words = self.words(limit // 5 + 12, digest)
+            for start in range(0, len(words), 12):
+                sentences.append(" ".join(words[start:start + 12]).capitalize() + ".")
+            result["text"] = f"# {title}\n\n" + " ".join(sentences)[:limit]
+        if contents.get("summary"):
+            result["summary"] = " ".join(self.words(40, digest + "summary")).capitalize() + "."
+        if contents.get("highlights"):
+            result["highlights"] = [" ".join(self.words(20, digest + "highlight")).capitalize() + "."]
+            result["highlightScores"] = [0.5]
+        return result
+
+    async def exa_results(self, endpoint: str, body: Dict[str, Any]) -> Any:
+        self.count(f"exa_{endpoint}")
+        await self.delay(self.settings.exa_latency_ms)
+        if self.random.random() < self.settings.exa_error_rate:
+            self.count("exa_errors")
+            return JSONResponse({"error": "Internal error (injected)"}, status_code=500)
+
+        contents = body.get("contents") or {}
+        if endpoint == "contents":
+            urls = body.get("urls") or body.get("ids") or []
+            contents = body
+        else:
+            seed = body.get("query") or body.get("url") or ""
+            slug = "-".join(seed.lower().split())[:40] or "page"
+            urls = [f"https://example.com/{slug}/{i}" for i in range(int(body.get("numResults") or 10))]
+        return {
+            "requestId": f"{self.random.getrandbits(64):016x}",
+            "resolvedSearchType": body.get("type") or "neural",
+            "results": [self._page(url, rank, contents) for rank, url in enumerate(urls)],
+        }
+
+
+def create_app(settings: Optional[FakeUpstreamSettings] = None) -> FastAPI:
+    """Build the fake upstream ASGI app."""
+    upstream = FakeUpstream(settings)
+    app = FastAPI(title="Fake OpenAI/Exa upstream")
+    app.state.upstream = upstream
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await upstream.chat_completions(await request.json())
+
+    @app.post("/search")
+    async def search(request: Request):
+        return await upstream.exa_results("search", await request.json())
+
+    @app.post("/findSimilar")
+    async def find_similar(request: Request):
+        return await upstream.exa_results("findSimilar", await request.json())
+
+    @app.post("/contents")
+    async def contents(request: Request):
+        return await upstream.exa_results("contents", await request.json())
+
+    @app.get("/_config")
+    async def get_config():
+        return asdict(upstream.settings)
+
+    @app.post("/_config")
+    async def set_config(request: Request):
+        try:
+            upstream.configure(await request.json())
+        except (TypeError, ValueError) as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        return asdict(upstream.settings)
+
+    @app.get("/_stats")
+    async def stats():
+        return upstream.stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI- and Exa-compatible fake upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    defaults = FakeUpstreamSettings()
+    for field in fields(FakeUpstreamSettings):
+        value = getattr(defaults, field.name)
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    settings = FakeUpstreamSettings(**{f.name: getattr(args, f.name) for f in fields(FakeUpstreamSettings)})
+    print(f"Fake upstream on http://{args.host}:{args.port}")
+    print(f"  OPENAI_BASE_URL=http://{args.host}:{args.port}/v1")
+    print(f"  EXA_BASE_URL=http://{args.host}:{args.port}")
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -44,6 +44,9 @@ with st.sidebar:
 # Initialize session state for chat history
 if "messages" not in st.session_state:
     st.session_state.messages = []
+# The server keeps the conversation; each request only carries the new message
+if "session_id" not in st.session_state:
+    st.session_state.session_id = None
 
 # Display chat messages
 for message in st.session_state.messages:
@@ -60,9 +63,13 @@ if user_input:
     with st.chat_message("user"):
         st.write(user_input)
     
+    if st.session_state.session_id is None:
+        st.session_state.session_id = requests.post(f"{API_BASE_URL}/sessions").json()["session_id"]
+    
     # Create request payload
     payload = {
-        "messages": [{"role": m["role"], "content": m["content"]} for m in st.session_state.messages],
+        "messages": [{"role": "user", "content": user_input}],
+        "session_id": st.session_state.session_id,
         "model_name": selected_model,
         "max_tokens": max_tokens,
         "stream": enable_streaming
@@ -264,5 +271,8 @@ st.caption("Agno API Chat Test App | Created for testing")
 
 # Clear all button
 if st.button("Clear Chat History"):
+    if st.session_state.session_id is not None:
+        requests.delete(f"{API_BASE_URL}/sessions/{st.session_state.session_id}")
+        st.session_state.session_id = None
     st.session_state.messages = []
     st.rerun() 
\ No newline at end of file